@@ -1,5 +1,8 @@
 from django.contrib import admin
-from .models import Player, Score, OTP, Contact, Rating, Review
+from .models import (
+    Player, Score, OTP, Contact, Rating, Review, PooledPuzzle, PuzzleImage, LeaderboardEntry, WindowedLeaderboardEntry,
+    EmailOutbox,
+)
 
 
 @admin.register(Player)
@@ -16,6 +19,34 @@ class ScoreAdmin(admin.ModelAdmin):
     search_fields = ['user__username']
 
 
+@admin.register(PooledPuzzle)
+class PooledPuzzleAdmin(admin.ModelAdmin):
+    list_display = ['id', 'created_at']
+    readonly_fields = ['data', 'created_at']
+
+
+@admin.register(PuzzleImage)
+class PuzzleImageAdmin(admin.ModelAdmin):
+    list_display = ['digest', 'content_type', 'size', 'hits', 'last_accessed']
+    search_fields = ['digest', 'source_url']
+    readonly_fields = ['created_at']
+
+
+@admin.register(LeaderboardEntry)
+class LeaderboardEntryAdmin(admin.ModelAdmin):
+    list_display = ['user', 'best_score']
+    search_fields = ['user__username']
+    ordering = ['-best_score']
+
+
+@admin.register(WindowedLeaderboardEntry)
+class WindowedLeaderboardEntryAdmin(admin.ModelAdmin):
+    list_display = ['user', 'window', 'bucket', 'best_score']
+    list_filter = ['window', 'bucket']
+    search_fields = ['user__username']
+    ordering = ['window', '-bucket', '-best_score']
+
+
 @admin.register(OTP)
 class OTPAdmin(admin.ModelAdmin):
     list_display = ['user', 'otp_type', 'contact_info', 'is_used', 'created_at', 'expires_at']
@@ -23,6 +54,20 @@ class OTPAdmin(admin.ModelAdmin):
     search_fields = ['user__username', 'contact_info']
 
 
+@admin.register(EmailOutbox)
+class EmailOutboxAdmin(admin.ModelAdmin):
+    list_display = ['subject', 'priority', 'status', 'sensitive', 'attempts', 'next_attempt_at', 'sent_at']
+    list_filter = ['status', 'priority', 'sensitive']
+    search_fields = ['subject', 'recipients']
+    readonly_fields = ['sensitive', 'created_at', 'sent_at', 'last_error']
+
+    def get_exclude(self, request, obj=None):
+        # Sensitive bodies hold live OTP codes
+        if obj is not None and obj.sensitive:
+            return ['body']
+        return super().get_exclude(request, obj)
+
+
 @admin.register(Contact)
 class ContactAdmin(admin.ModelAdmin):
     list_display = ['name', 'email', 'subject', 'is_read', 'created_at']
@@ -4,3 +4,16 @@ from django.apps import AppConfig
 class BananaConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'Banana'
+
+    def ready(self):
+        from django.contrib.auth.models import User
+        from django.core import checks
+        from django.db.models.signals import post_delete, post_save
+
+        from . import snapshots, throttling
+
+        checks.register(throttling.check_cache, checks.Tags.caches)
+
+        # Deactivating (or otherwise changing) a user drops their cached snapshot
+        post_save.connect(snapshots.user_changed, sender=User, dispatch_uid='banana-user-snapshot-save')
+        post_delete.connect(snapshots.user_changed, sender=User, dispatch_uid='banana-user-snapshot-delete')
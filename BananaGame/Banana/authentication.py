@@ -0,0 +1,29 @@
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.settings import api_settings as jwt_settings
+
+from . import snapshots
+
+
+class SnapshotJWTAuthentication(JWTAuthentication):
+    """
+    JWTAuthentication that takes request.user from the cached user snapshot
+    (see Banana.snapshots) instead of loading auth_user on every request. It
+    also refuses access tokens issued before the user last logged out everywhere.
+    """
+
+    def get_user(self, validated_token):
+        try:
+            user_id = validated_token[jwt_settings.USER_ID_CLAIM]
+        except KeyError:
+            raise InvalidToken(_("Token contained no recognizable user identification"))
+
+        user, revoked_before = snapshots.get_user(user_id)
+        if user is None:
+            raise AuthenticationFailed(_("User not found"), code="user_not_found")
+        if not jwt_settings.USER_AUTHENTICATION_RULE(user):
+            raise AuthenticationFailed(_("User is inactive"), code="user_inactive")
+        if validated_token.get('iat', 0) < revoked_before:
+            raise AuthenticationFailed(_("Token is blacklisted"), code="token_not_valid")
+        return user
@@ -0,0 +1,29 @@
+"""
+Cache backends.
+
+Django's FileBasedCache only deletes an expired entry when something reads
+it, and once MAX_ENTRIES files exist it culls a random third of them, live or
+not. Entries nobody reads again (a player who left mid-puzzle, a finished
+certificate job) therefore pile up until they push out puzzles that are still
+being answered. ExpiringFileBasedCache removes the expired entries first and
+only culls at random if the live ones alone still fill the cache.
+"""
+from django.core.cache.backends.filebased import FileBasedCache
+
+
+class ExpiringFileBasedCache(FileBasedCache):
+
+    def _cull(self):
+        filelist = self._list_cache_files()
+        if len(filelist) < self._max_entries:
+            return
+        live = 0
+        for fname in filelist:
+            try:
+                with open(fname, 'rb') as f:
+                    if not self._is_expired(f):
+                        live += 1
+            except FileNotFoundError:
+                pass  # Deleted by another process meanwhile
+        if live >= self._max_entries:
+            super()._cull()
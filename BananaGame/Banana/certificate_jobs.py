@@ -0,0 +1,147 @@
+"""
+Background certificate rendering.
+
+POST /certificate/ submits a job instead of rendering in the request worker.
+Jobs run on a per-process pool of CERTIFICATE_WORKERS processes, started with
+ReportLab imported and every rank's layout drawn, and the finished PDF goes
+into the certificate disk cache. Job status lives in the CERTIFICATE_JOB_CACHE
+alias so any worker can answer a poll.
+
+A job's id is derived from (user, rank, score, date), so identical requests
+share one job: a process hands out the same future to concurrent callers, and
+other processes see the pending status in the cache. At most
+CERTIFICATE_MAX_PENDING jobs wait per process; beyond that submit() raises
+QueueFullError rather than queueing without limit. A job still pending after
+CERTIFICATE_JOB_TIMEOUT (its process may have died) is started again.
+"""
+import hashlib
+import logging
+import multiprocessing
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from django.conf import settings
+from django.core.cache import caches
+
+from . import certificates
+
+logger = logging.getLogger(__name__)
+
+PENDING = 'pending'
+DONE = 'done'
+FAILED = 'failed'
+
+_lock = threading.Lock()
+_executor = None
+_futures = {}  # job_id -> Future of the jobs this process is running
+
+
+class QueueFullError(Exception):
+    """Raised when this process already has CERTIFICATE_MAX_PENDING jobs waiting"""
+
+
+def workers():
+    return getattr(settings, 'CERTIFICATE_WORKERS', 2)
+
+
+def max_pending():
+    return getattr(settings, 'CERTIFICATE_MAX_PENDING', 100)
+
+
+def job_timeout():
+    return getattr(settings, 'CERTIFICATE_JOB_TIMEOUT', 60)
+
+
+def job_ttl():
+    return getattr(settings, 'CERTIFICATE_JOB_TTL', 60 * 60)
+
+
+def _cache():
+    return caches[getattr(settings, 'CERTIFICATE_JOB_CACHE', 'default')]
+
+
+def _key(job_id):
+    return f'certificate-job:{job_id}'
+
+
+def job_id_for(user_id, rank, score, date):
+    return hashlib.sha256(f'{user_id}:{rank}:{score}:{date.isoformat()}'.encode()).hexdigest()[:32]
+
+
+def _get_executor():
+    global _executor
+    if _executor is None:
+        # spawn rather than fork: the server process has threads of its own
+        _executor = ProcessPoolExecutor(
+            max_workers=workers(),
+            mp_context=multiprocessing.get_context('spawn'),
+            initializer=certificates.warm,
+        )
+    return _executor
+
+
+def _reset_executor():
+    """Drop a pool whose worker died so the next job starts a fresh one"""
+    global _executor
+    with _lock:
+        executor, _executor = _executor, None
+    if executor is not None:
+        executor.shutdown(wait=False)
+
+
+def get(job_id):
+    """The job's record ({'status', 'user_id', 'rank', 'score', 'date', ...}) or None if unknown or expired"""
+    return _cache().get(_key(job_id))
+
+
+def submit(user, rank, score, date):
+    """
+    Return the job rendering this certificate, starting one unless it is
+    already cached, running, or queued elsewhere. Raises QueueFullError.
+    """
+    job_id = job_id_for(user.pk, rank, score, date)
+    job = {
+        'job_id': job_id, 'user_id': user.pk, 'username': user.username,
+        'rank': rank, 'score': score, 'date': date,
+    }
+    cache = _cache()
+    if certificates.cached(user.pk, rank, score, date) is not None:
+        job['status'] = DONE
+        cache.set(_key(job_id), job, job_ttl())
+        return job
+
+    with _lock:
+        if job_id in _futures:
+            return cache.get(_key(job_id)) or job
+        existing = cache.get(_key(job_id))
+        if existing and existing['status'] == PENDING and time.time() - existing['submitted_at'] < job_timeout():
+            return existing
+        if len(_futures) >= max_pending():
+            raise QueueFullError("Too many certificates are being generated, try again shortly")
+        future = _get_executor().submit(certificates.render, user.username, rank, score, date)
+        _futures[job_id] = future
+        job.update(status=PENDING, submitted_at=time.time())
+        cache.set(_key(job_id), job, job_ttl())
+    # Outside the lock: the callback runs at once if the job has already finished
+    future.add_done_callback(lambda f: _finish(job, f))
+    return job
+
+
+def _finish(job, future):
+    """Store the rendered PDF and record the outcome"""
+    job = dict(job)
+    try:
+        content = future.result()
+    except Exception as exc:
+        logger.error("Certificate job %s failed: %s", job['job_id'], exc)
+        job.update(status=FAILED, error=str(exc))
+        if isinstance(exc, BrokenProcessPool):
+            _reset_executor()
+    else:
+        certificates.store(job['user_id'], job['rank'], job['score'], job['date'], content)
+        job['status'] = DONE
+    _cache().set(_key(job['job_id']), job, job_ttl())
+    with _lock:
+        _futures.pop(job['job_id'], None)
@@ -0,0 +1,282 @@
+"""
+Certificate PDFs for the top 3 players (and, from batch renders, any rank).
+
+The page is split into the static layout for each rank (background, borders,
+title, rule, place and stars) and the details stamped onto it (name, score
+and date). The layout is drawn once per rank per process and kept as the
+content stream of a form XObject; each certificate then places that form and
+draws three strings. Finished PDFs are cached on disk under
+CERTIFICATE_CACHE_ROOT, keyed by (user, rank, score, date), and the cache is
+kept under CERTIFICATE_CACHE_MAX_BYTES by evicting the least recently used.
+render_batch() spreads a list of certificates over a process pool.
+"""
+import logging
+import os
+import tempfile
+import threading
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+from io import BytesIO
+from pathlib import Path
+
+from django.conf import settings
+from reportlab.lib import colors
+from reportlab.lib.pagesizes import A4, landscape
+from reportlab.pdfbase.pdfdoc import PDFDictionary, PDFFormXObject, PDFName, PDFStream, xObjectName
+from reportlab.pdfgen import canvas
+
+logger = logging.getLogger(__name__)
+
+PAGE_SIZE = landscape(A4)
+WIDTH, HEIGHT = PAGE_SIZE
+FONT = 'Helvetica'
+BOLD = 'Helvetica-Bold'
+PLACE_TEXTS = {1: "CHAMPION", 2: "RUNNER-UP", 3: "THIRD PLACE"}
+PLACE_COLORS = {1: '#FCD34D', 2: '#9CA3AF', 3: '#FB923C'}
+ORDINALS = {1: 'First', 2: 'Second', 3: 'Third'}
+OTHER_PLACE_COLOR = '#D97706'
+
+_cached_bytes = None  # this process's running estimate of the cache size
+_cached_bytes_lock = threading.Lock()
+
+
+def cache_root():
+    return Path(getattr(settings, 'CERTIFICATE_CACHE_ROOT', settings.BASE_DIR / 'media' / 'certificates'))
+
+
+def max_bytes():
+    return getattr(settings, 'CERTIFICATE_CACHE_MAX_BYTES', 50 * 1024 * 1024)
+
+
+def filename(username, rank):
+    return f"Banana_Game_Certificate_{username}_{rank}st.pdf"
+
+
+def ordinal(n):
+    """1 -> '1st', 12 -> '12th', 23 -> '23rd'"""
+    suffix = 'th' if 10 <= n % 100 <= 20 else {1: 'st', 2: 'nd', 3: 'rd'}.get(n % 10, 'th')
+    return f'{n}{suffix}'
+
+
+def _centred(p, text, font, size, y):
+    p.setFont(font, size)
+    p.drawString((WIDTH - p.stringWidth(text, font, size)) / 2, y, text)
+
+
+def _new_canvas(buffer):
+    p = canvas.Canvas(buffer, pagesize=PAGE_SIZE)
+    # Register both fonts up front so they get the same internal names in
+    # every document, which the cached layout stream refers to
+    p.setFont(BOLD, 12)
+    p.setFont(FONT, 12)
+    return p
+
+
+def _draw_layout(p, rank):
+    """Everything on the page that only depends on the rank"""
+    p.setFillColor(colors.HexColor('#FCD34D'))
+    p.rect(0, 0, WIDTH, HEIGHT, fill=1)
+
+    p.setStrokeColor(colors.HexColor('#F59E0B'))
+    p.setLineWidth(20)
+    p.rect(10, 10, WIDTH - 20, HEIGHT - 20, fill=0, stroke=1)
+
+    p.setStrokeColor(colors.HexColor('#D97706'))
+    p.setLineWidth(5)
+    p.rect(30, 30, WIDTH - 60, HEIGHT - 60, fill=0, stroke=1)
+
+    p.setFillColor(colors.HexColor('#92400E'))
+    _centred(p, "CERTIFICATE OF ACHIEVEMENT", BOLD, 48, HEIGHT - 120)
+
+    p.setStrokeColor(colors.HexColor('#92400E'))
+    p.setLineWidth(3)
+    p.line(WIDTH * 0.2, HEIGHT - 160, WIDTH * 0.8, HEIGHT - 160)
+
+    p.setFillColor(colors.HexColor(PLACE_COLORS.get(rank, OTHER_PLACE_COLOR)))
+    _centred(p, PLACE_TEXTS.get(rank, f"{ordinal(rank).upper()} PLACE"), BOLD, 36, HEIGHT - 220)
+
+    p.setFillColor(colors.HexColor('#78350F'))
+    _centred(p, f"{ORDINALS.get(rank, ordinal(rank))} Place Winner", FONT, 24, HEIGHT - 270)
+    _centred(p, "This is to certify that", FONT, 20, HEIGHT - 320)
+    _centred(p, f"Has achieved {ordinal(rank)} Place", FONT, 22, HEIGHT - 440)
+    _centred(p, "in the Banana Brain Blitz Game", FONT, 20, HEIGHT - 480)
+
+    p.setFont(BOLD, 40)
+    p.setFillColor(colors.HexColor('#92400E'))
+    p.drawString(100, HEIGHT - 100, "*")
+    p.drawString(WIDTH - 140, HEIGHT - 100, "*")
+    p.drawString(100, 120, "*")
+    p.drawString(WIDTH - 140, 120, "*")
+
+
+def _draw_details(p, username, score, date):
+    """The per-player text stamped onto the layout"""
+    p.setFillColor(colors.HexColor('#1F2937'))
+    _centred(p, username, BOLD, 42, HEIGHT - 380)
+
+    p.setFillColor(colors.HexColor('#78350F'))
+    _centred(p, f"Final Score: {score} Points", BOLD, 28, HEIGHT - 540)
+    _centred(p, f"Date: {date.strftime('%B %d, %Y')}", FONT, 16, 80)
+
+
+@lru_cache(maxsize=256)
+def _layout_stream(rank):
+    """Deflated content stream of the rank's layout form, drawn and compressed once per process"""
+    p = _new_canvas(BytesIO())
+    p.beginForm('layout')
+    _draw_layout(p, rank)
+    p.endForm()
+    return zlib.compress(p._doc.idToObject[xObjectName('layout')].stream)
+
+
+def warm():
+    """Draw every rank's layout now rather than on the first certificate"""
+    for rank in PLACE_TEXTS:
+        _layout_stream(rank)
+
+
+def render(username, rank, score, date):
+    """Render a certificate by placing the rank's cached layout and stamping the details on it"""
+    buffer = BytesIO()
+    p = _new_canvas(buffer)
+    # The bounding box overhangs the page so it never clips the background's edge
+    form = PDFFormXObject(-1, -1, WIDTH + 1, HEIGHT + 1)
+    # Already compressed, so ReportLab writes it as is instead of encoding it again
+    form.Contents = PDFStream(PDFDictionary({'Filter': PDFName('FlateDecode')}), _layout_stream(rank))
+    p._doc.addForm('layout', form)
+    p.doForm('layout')
+    _draw_details(p, username, score, date)
+    p.showPage()
+    p.save()
+    return buffer.getvalue()
+
+
+def render_full(username, rank, score, date):
+    """Render a certificate by drawing the whole page from scratch"""
+    buffer = BytesIO()
+    p = _new_canvas(buffer)
+    _draw_layout(p, rank)
+    _draw_details(p, username, score, date)
+    p.showPage()
+    p.save()
+    return buffer.getvalue()
+
+
+def _render_chunk(chunk):
+    date, entries = chunk
+    return [render(username, rank, score, date) for username, rank, score in entries]
+
+
+def render_batch(entries, date, workers=None, chunk_size=50):
+    """
+    Render certificates for [(username, rank, score)] across a process pool
+    (when workers > 1), yielding the PDFs in order as each chunk completes
+    """
+    entries = list(entries)
+    workers = workers or os.cpu_count() or 1
+    chunks = [(date, entries[start:start + chunk_size]) for start in range(0, len(entries), chunk_size)]
+    if workers <= 1 or len(chunks) <= 1:
+        for chunk in chunks:
+            yield from _render_chunk(chunk)
+        return
+    with ProcessPoolExecutor(max_workers=workers, initializer=warm) as executor:
+        for rendered in executor.map(_render_chunk, chunks):
+            yield from rendered
+
+
+def path_for(user_id, rank, score, date):
+    return cache_root() / f'{user_id}-{rank}-{score}-{date.isoformat()}.pdf'
+
+
+def _write_atomically(path, content):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=path.parent, prefix='.tmp-')
+    try:
+        with os.fdopen(fd, 'wb') as handle:
+            handle.write(content)
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.unlink(tmp_path)
+        except FileNotFoundError:
+            pass
+        raise
+
+
+def cached(user_id, rank, score, date):
+    """Path of the cached certificate, or None if it has not been rendered (or was evicted)"""
+    path = path_for(user_id, rank, score, date)
+    try:
+        # mtime doubles as the last access time for eviction
+        os.utime(path)
+    except FileNotFoundError:
+        return None
+    return path
+
+
+def store(user_id, rank, score, date, content):
+    """Add a rendered certificate to the disk cache"""
+    path = path_for(user_id, rank, score, date)
+    try:
+        _write_atomically(path, content)
+        _note_write(len(content))
+    except OSError as exc:
+        logger.warning("Could not cache certificate %s: %s", path.name, exc)
+
+
+def get_certificate(user, rank, score, date):
+    """PDF bytes of the user's certificate, from the disk cache when it has been rendered before"""
+    path = cached(user.pk, rank, score, date)
+    if path is not None:
+        try:
+            return path.read_bytes()
+        except FileNotFoundError:
+            pass
+    content = render(user.username, rank, score, date)
+    store(user.pk, rank, score, date, content)
+    return content
+
+
+def _note_write(size):
+    """Add a new file to the running size and evict once it passes the limit, so most writes skip the directory scan"""
+    global _cached_bytes
+    with _cached_bytes_lock:
+        if _cached_bytes is not None:
+            _cached_bytes += size
+            if _cached_bytes <= max_bytes():
+                return
+        _cached_bytes = None
+    evict()
+
+
+def evict(limit=None):
+    """Delete least recently used certificates until the cache fits in `limit` bytes"""
+    global _cached_bytes
+    limit = max_bytes() if limit is None else limit
+    root = cache_root()
+    if not root.exists():
+        return 0
+    entries = []
+    for entry in root.glob('*.pdf'):
+        try:
+            stat = entry.stat()
+        except FileNotFoundError:
+            continue
+        entries.append((stat.st_mtime, stat.st_size, entry))
+    total = sum(size for _, size, _ in entries)
+    removed = 0
+    for _, size, entry in sorted(entries, key=lambda item: item[0]):
+        if total <= limit:
+            break
+        try:
+            entry.unlink()
+        except FileNotFoundError:
+            pass
+        total -= size
+        removed += 1
+    with _cached_bytes_lock:
+        _cached_bytes = total
+    if removed:
+        logger.info("Evicted %s cached certificates", removed)
+    return removed
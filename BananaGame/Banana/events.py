@@ -0,0 +1,147 @@
+"""
+In-process publish/subscribe for the server-sent event stream.
+
+Subscribers are asyncio queues owned by the ASGI event loop; publishers are
+ordinary request threads (submit_score, puzzle answers). publish() hands each
+event to every subscribed loop with a single call_soon_threadsafe, and the
+loop then drops it into each subscriber's queue, so an idle connection costs
+a queue and a suspended coroutine rather than a thread. Events are encoded as
+SSE frames once per publish, not once per subscriber, and keep-alives come
+from one timer per loop rather than a timeout on every connection.
+
+Only connections held by this process see events published by it: with
+several workers, each streams the changes it handles itself.
+"""
+import asyncio
+import json
+import threading
+from collections import defaultdict
+
+from django.conf import settings
+
+_lock = threading.Lock()
+_subscriptions = defaultdict(lambda: defaultdict(set))  # topic -> loop -> {Subscription}
+_heartbeats = {}  # loop -> TimerHandle of its next keep-alive
+_count = 0
+
+
+KEEPALIVE = b': keepalive\n\n'
+
+
+def heartbeat():
+    return getattr(settings, 'EVENT_STREAM_HEARTBEAT', 15)
+
+
+def queue_size():
+    return getattr(settings, 'EVENT_STREAM_QUEUE_SIZE', 100)
+
+
+def max_connections():
+    return getattr(settings, 'EVENT_STREAM_MAX_CONNECTIONS', 20000)
+
+
+class Subscription:
+    """
+    Queue of encoded SSE frames for one connection. If the client falls so
+    far behind that the queue fills up, further events are dropped and
+    `overflowed` is set so the stream can resend a full snapshot instead.
+    """
+
+    def __init__(self, topics, loop):
+        self.topics = tuple(topics)
+        self.loop = loop
+        self.queue = asyncio.Queue(queue_size())
+        self.overflowed = False
+
+    def deliver(self, frame):
+        try:
+            self.queue.put_nowait(frame)
+        except asyncio.QueueFull:
+            self.overflowed = True
+
+    def drain(self):
+        while not self.queue.empty():
+            self.queue.get_nowait()
+        self.overflowed = False
+
+
+def subscribe(topics):
+    """Subscribe the running event loop to `topics`. Must be called from a coroutine."""
+    global _count
+    subscription = Subscription(topics, asyncio.get_running_loop())
+    with _lock:
+        for topic in subscription.topics:
+            _subscriptions[topic][subscription.loop].add(subscription)
+        _count += 1
+        if subscription.loop not in _heartbeats:
+            _heartbeats[subscription.loop] = subscription.loop.call_later(heartbeat(), _beat, subscription.loop)
+    return subscription
+
+
+def unsubscribe(subscription):
+    global _count
+    with _lock:
+        for topic in subscription.topics:
+            loops = _subscriptions.get(topic)
+            if loops is None:
+                continue
+            loops[subscription.loop].discard(subscription)
+            if not loops[subscription.loop]:
+                del loops[subscription.loop]
+            if not loops:
+                del _subscriptions[topic]
+        _count -= 1
+
+
+def subscriber_count():
+    return _count
+
+
+def has_subscribers(topic):
+    return topic in _subscriptions
+
+
+def _beat(loop):
+    """Send a keep-alive to every stream on `loop`, then reschedule while any remain"""
+    with _lock:
+        subscriptions = {s for loops in _subscriptions.values() for s in loops.get(loop, ())}
+        if subscriptions:
+            _heartbeats[loop] = loop.call_later(heartbeat(), _beat, loop)
+        else:
+            del _heartbeats[loop]
+    _fan_out(subscriptions, KEEPALIVE)
+
+
+def _fan_out(subscriptions, frame):
+    for subscription in subscriptions:
+        subscription.deliver(frame)
+
+
+def publish(topic, event):
+    """
+    Send `event` (a JSON-serialisable dict) to every subscriber of `topic`,
+    named after the topic's prefix ('leaderboard:all' -> 'leaderboard').
+    Safe from any thread.
+    """
+    with _lock:
+        targets = [(loop, list(subscriptions)) for loop, subscriptions in _subscriptions.get(topic, {}).items()]
+    if not targets:
+        return
+    frame = format_event(topic.split(':', 1)[0], event)
+    for loop, subscriptions in targets:
+        try:
+            loop.call_soon_threadsafe(_fan_out, subscriptions, frame)
+        except RuntimeError:
+            # The loop has been closed; its subscriptions go away with it
+            pass
+
+
+def format_event(name, data, event_id=None):
+    """Encode one server-sent event as bytes. `data` is a str of JSON or a value to serialise."""
+    if not isinstance(data, str):
+        data = json.dumps(data, separators=(',', ':'))
+    lines = [f'event: {name}']
+    if event_id is not None:
+        lines.append(f'id: {event_id}')
+    lines.append(f'data: {data}')
+    return ('\n'.join(lines) + '\n\n').encode()
@@ -0,0 +1,82 @@
+"""
+Password hashing off the request thread.
+
+The login and register views are async and await the hashes computed here
+on a pool of PASSWORD_HASH_WORKERS threads (default: one per CPU). As sync
+views, each login hashed on the request's own thread, so a login storm meant
+as many threads hashing at once as there were logins in flight, every one of
+them slower the bigger the storm, and nothing pushing back. Threads rather
+than processes: PBKDF2 (hashlib) and the other Django hashers release the
+GIL while hashing, so the pool uses every core without pickling anything
+across processes.
+
+At most PASSWORD_HASH_MAX_PENDING hashes are queued or running per process;
+beyond that the helpers raise QueueFullError and the views answer 503 with a
+Retry-After of PASSWORD_HASH_RETRY_AFTER seconds rather than letting the
+queue, and every client's wait, grow without bound.
+"""
+import asyncio
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.contrib.auth import hashers
+
+_lock = threading.Lock()
+_executor = None
+_pending = 0
+
+
+class QueueFullError(Exception):
+    """Raised when PASSWORD_HASH_MAX_PENDING hashes are already waiting"""
+
+
+def workers():
+    return getattr(settings, 'PASSWORD_HASH_WORKERS', None) or os.cpu_count() or 1
+
+
+def max_pending():
+    return getattr(settings, 'PASSWORD_HASH_MAX_PENDING', 64)
+
+
+def retry_after():
+    return getattr(settings, 'PASSWORD_HASH_RETRY_AFTER', 2)
+
+
+def pending():
+    return _pending
+
+
+def _get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=workers(), thread_name_prefix='password-hash')
+    return _executor
+
+
+def _done(future):
+    global _pending
+    with _lock:
+        _pending -= 1
+
+
+async def _run(fn, *args):
+    global _pending
+    with _lock:
+        if _pending >= max_pending():
+            raise QueueFullError("Too many logins in progress, try again shortly")
+        _pending += 1
+        future = _get_executor().submit(fn, *args)
+    # Counted until the hash finishes, even if the client has gone away meanwhile
+    future.add_done_callback(_done)
+    return await asyncio.wrap_future(future)
+
+
+async def verify_password(password, encoded):
+    """(is_correct, must_update) for a password against its stored hash"""
+    return await _run(hashers.verify_password, password, encoded)
+
+
+async def make_password(password):
+    return await _run(hashers.make_password, password)
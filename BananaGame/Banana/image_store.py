@@ -0,0 +1,186 @@
+"""
+Content-addressed store for puzzle images.
+
+Each image is downloaded once, written to PUZZLE_IMAGE_ROOT under its SHA-256
+digest and indexed by a PuzzleImage row. Puzzles are rewritten to point at
+the backend's own puzzle-image URL, which is immutable and therefore cached
+by clients for a year. The store is kept under PUZZLE_IMAGE_STORE_MAX_BYTES
+by evicting the least recently used images.
+"""
+import base64
+import binascii
+import hashlib
+import logging
+import os
+import re
+import tempfile
+from datetime import timedelta
+from pathlib import Path
+
+from django.conf import settings
+from django.db.models import F, Sum
+from django.urls import reverse
+from django.utils import timezone
+
+from .models import PuzzleImage
+from .upstream import get_client
+
+logger = logging.getLogger(__name__)
+
+DIGEST_RE = re.compile(r'^[0-9a-f]{64}$')
+DATA_URI_RE = re.compile(r'^data:(?P<content_type>[\w/+.-]+);base64,(?P<data>.*)$', re.DOTALL)
+
+# last_accessed is only rewritten when older than this, so serving stays read-mostly
+TOUCH_INTERVAL = timedelta(hours=1)
+
+
+def enabled():
+    return getattr(settings, 'PUZZLE_IMAGE_STORE', True)
+
+
+def store_root():
+    return Path(getattr(settings, 'PUZZLE_IMAGE_ROOT', settings.BASE_DIR / 'media' / 'puzzle_images'))
+
+
+def max_bytes():
+    return getattr(settings, 'PUZZLE_IMAGE_STORE_MAX_BYTES', 200 * 1024 * 1024)
+
+
+def path_for(digest):
+    return store_root() / digest[:2] / digest
+
+
+def url_for(digest):
+    return reverse('puzzle-image', kwargs={'digest': digest})
+
+
+def _write_atomically(path, content):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=path.parent, prefix='.tmp-')
+    try:
+        with os.fdopen(fd, 'wb') as handle:
+            handle.write(content)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+def put(content, content_type='image/png', source_url=''):
+    """Store image bytes under their digest and return (PuzzleImage, created)"""
+    digest = hashlib.sha256(content).hexdigest()
+    path = path_for(digest)
+    if not path.exists():
+        _write_atomically(path, content)
+    image, created = PuzzleImage.objects.get_or_create(
+        digest=digest,
+        defaults={'source_url': source_url, 'size': len(content), 'content_type': content_type},
+    )
+    if created:
+        evict()
+    return image, created
+
+
+def _lookup(source_url):
+    image = PuzzleImage.objects.filter(source_url=source_url).first()
+    if image is None or not path_for(image.digest).exists():
+        return None
+    return image
+
+
+def _record_hit(image):
+    PuzzleImage.objects.filter(digest=image.digest).update(hits=F('hits') + 1, last_accessed=timezone.now())
+
+
+def store_question(question):
+    """Return the local URL for a puzzle image URL or data URI, fetching it at most once"""
+    match = DATA_URI_RE.match(question)
+    if match:
+        try:
+            content = base64.b64decode(match.group('data'), validate=True)
+        except binascii.Error:
+            logger.error("Puzzle question is not a valid base64 data URI")
+            return question
+        image, created = put(content, match.group('content_type'))
+        if not created:
+            _record_hit(image)
+        return url_for(image.digest)
+
+    image = _lookup(question)
+    if image is not None:
+        _record_hit(image)
+        return url_for(image.digest)
+
+    res = get_client().get(question)
+    content_type = res.headers.get('Content-Type', 'image/png').split(';')[0]
+    image, _ = put(res.content, content_type, source_url=question)
+    return url_for(image.digest)
+
+
+def localize(puzzle):
+    """Rewrite a puzzle's question to the local image URL, leaving it untouched on failure"""
+    question = puzzle.get('question')
+    if not enabled() or not isinstance(question, str) or not question:
+        return puzzle
+    try:
+        puzzle['question'] = store_question(question)
+    except Exception as exc:
+        logger.error("Failed to store puzzle image: %s", exc)
+    return puzzle
+
+
+def open_image(digest):
+    """Return (file, PuzzleImage) for serving, or None if the image is not stored"""
+    if not DIGEST_RE.match(digest):
+        return None
+    image = PuzzleImage.objects.filter(digest=digest).first()
+    if image is None:
+        return None
+    try:
+        handle = open(path_for(digest), 'rb')
+    except FileNotFoundError:
+        return None
+    now = timezone.now()
+    if image.last_accessed < now - TOUCH_INTERVAL:
+        PuzzleImage.objects.filter(digest=digest).update(last_accessed=now)
+    return handle, image
+
+
+def total_size():
+    return PuzzleImage.objects.aggregate(total=Sum('size'))['total'] or 0
+
+
+def evict(limit=None):
+    """Delete least recently used images until the store fits in `limit` bytes"""
+    limit = max_bytes() if limit is None else limit
+    excess = total_size() - limit
+    removed = 0
+    if excess <= 0:
+        return removed
+    while excess > 0:
+        oldest = list(PuzzleImage.objects.order_by('last_accessed').values_list('digest', 'size')[:100])
+        if not oldest:
+            break
+        victims = []
+        for digest, size in oldest:
+            if excess <= 0:
+                break
+            victims.append(digest)
+            excess -= size
+        PuzzleImage.objects.filter(digest__in=victims).delete()
+        for digest in victims:
+            try:
+                path_for(digest).unlink()
+            except FileNotFoundError:
+                pass
+        removed += len(victims)
+    logger.info("Evicted %s puzzle images from the store", removed)
+    return removed
+
+
+def disk_usage():
+    """Bytes actually used on disk by stored images"""
+    root = store_root()
+    if not root.exists():
+        return 0
+    return sum(entry.stat().st_size for entry in root.glob('*/*') if entry.is_file())
@@ -0,0 +1,356 @@
+"""
+Leaderboard backed by the materialised LeaderboardEntry table.
+
+submit_score upserts the submitting user's best score, so reading the board
+is an indexed top-N scan instead of a GROUP BY over every Score row.
+
+The daily and weekly boards work the same way on WindowedLeaderboardEntry,
+one set of best scores per day or week (weeks start on Monday). Reading the
+current day or week is the same top-N scan however much history there is.
+Buckets older than LEADERBOARD_WINDOW_RETENTION are deleted the first time
+each process writes to a new bucket.
+
+page() walks a whole board with keyset pagination on (best_score DESC,
+user_id), so any page is an index range scan starting where the last one
+ended, however deep it is.
+
+cached_top() serves the polled top-N boards as pre-rendered JSON from the
+LEADERBOARD_CACHE alias, stamped with a per-board version that only moves
+when a submitted score can change the top N. The version is the ETag, so
+unchanged polls get a 304. One request re-renders after a change while the
+others wait for its result instead of all querying at once. Each bump also
+pushes a diff of the new top N to event stream subscribers (see events).
+"""
+import base64
+import binascii
+import datetime
+import json
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import IntegrityError, transaction
+from django.db.models import Max
+from django.utils import timezone
+
+from .models import LeaderboardEntry, Score, WindowedLeaderboardEntry
+from . import events, rank_index
+
+TOP_N = 10
+ALL_TIME = 'all'
+WINDOWS = (WindowedLeaderboardEntry.DAY, WindowedLeaderboardEntry.WEEK, ALL_TIME)
+
+_pruned = set()
+_prune_lock = threading.Lock()
+_published = {}  # window -> (board, top N last pushed to the event stream)
+_published_lock = threading.Lock()
+
+
+def retention():
+    """Number of buckets kept per window, the current one included"""
+    return getattr(settings, 'LEADERBOARD_WINDOW_RETENTION', {'day': 7, 'week': 4})
+
+
+def bucket_start(window, day):
+    if window == WindowedLeaderboardEntry.WEEK:
+        return day - datetime.timedelta(days=day.weekday())
+    return day
+
+
+def _bucket_length(window):
+    return datetime.timedelta(weeks=1) if window == WindowedLeaderboardEntry.WEEK else datetime.timedelta(days=1)
+
+
+def _upsert(model, lookup, score):
+    """Raise best_score on the row matching `lookup`, creating it if needed. Returns True if it changed."""
+    if model.objects.filter(best_score__lt=score, **lookup).update(best_score=score):
+        return True
+    try:
+        with transaction.atomic():
+            _, created = model.objects.get_or_create(defaults={'best_score': score}, **lookup)
+        return created
+    except IntegrityError:
+        # Another request created the row first; fall back to the conditional update
+        return bool(model.objects.filter(best_score__lt=score, **lookup).update(best_score=score))
+
+
+def _prune(window, bucket):
+    """Delete the window's expired buckets, once per process per bucket"""
+    with _prune_lock:
+        if (window, bucket) in _pruned:
+            return
+        _pruned.add((window, bucket))
+    oldest = bucket - _bucket_length(window) * (retention()[window] - 1)
+    WindowedLeaderboardEntry.objects.filter(window=window, bucket__lt=oldest).delete()
+
+
+def record_score(user, score, when=None):
+    """
+    Raise the user's all-time, daily and weekly best scores where `score`
+    beats them. Returns True if the all-time board changed.
+    """
+    day = timezone.localdate(when)
+    for window in (WindowedLeaderboardEntry.DAY, WindowedLeaderboardEntry.WEEK):
+        bucket = bucket_start(window, day)
+        if _upsert(WindowedLeaderboardEntry, {'window': window, 'bucket': bucket, 'user': user}, score):
+            board = _board(window, bucket)
+            if _note_change(board, score) and board == _board(window):
+                _publish_changes(window, board)
+        _prune(window, bucket)
+
+    rank_index.record_score(user.pk, score)
+    changed = _upsert(LeaderboardEntry, {'user': user}, score)
+    if changed and _note_change(ALL_TIME, score):
+        _publish_changes(ALL_TIME, ALL_TIME)
+    return changed
+
+
+def _entries(window):
+    if window == ALL_TIME:
+        return LeaderboardEntry.objects.all()
+    bucket = bucket_start(window, timezone.localdate())
+    return WindowedLeaderboardEntry.objects.filter(window=window, bucket=bucket)
+
+
+def top(n=TOP_N, window=ALL_TIME):
+    """The n best users of the current day, week or all time as [{'username', 'score'}], highest first"""
+    entries = _entries(window).order_by('-best_score', 'user_id').values_list('user__username', 'best_score')[:n]
+    return [{'username': username, 'score': score} for username, score in entries]
+
+
+def max_submitted_score():
+    return getattr(settings, 'MAX_SUBMITTED_SCORE', 1_000_000)
+
+
+def _cache():
+    return caches[getattr(settings, 'LEADERBOARD_CACHE', 'default')]
+
+
+def cache_ttl():
+    return getattr(settings, 'LEADERBOARD_CACHE_TTL', 60)
+
+
+def _board(window, bucket=None):
+    """Cache name of a board: the window plus, for day and week, the bucket it starts on"""
+    if window == ALL_TIME:
+        return ALL_TIME
+    bucket = bucket or bucket_start(window, timezone.localdate())
+    return f'{window}:{bucket.isoformat()}'
+
+
+def _version(cache, board):
+    """
+    Current version of a board. New versions are seeded from the clock, so
+    they keep increasing even after the cache loses the counter and an old
+    ETag can never match a newer body.
+    """
+    key = f'leaderboard:version:{board}'
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, time.time_ns() // 1000, timeout=None)
+        version = cache.get(key)
+    return version
+
+
+def _note_change(board, score):
+    """
+    Bump the board's version unless `score` is known to fall below its cached
+    top N. Returns True if it was bumped.
+    """
+    cache = _cache()
+    version = _version(cache, board)
+    rendered = cache.get(f'leaderboard:body:{board}')
+    if rendered and rendered['version'] == version and rendered['cutoff'] is not None and score < rendered['cutoff']:
+        return False
+    _bump(cache, board)
+    return True
+
+
+def _bump(cache, board):
+    try:
+        cache.incr(f'leaderboard:version:{board}')
+    except ValueError:
+        # The counter was evicted in between; the next read seeds a newer one
+        pass
+
+
+def cached_top(window=ALL_TIME):
+    """
+    The top-N board as (json_body_bytes, version). Only one caller renders a
+    board after its version moves; the rest wait up to LEADERBOARD_CACHE_LOCK_WAIT
+    seconds for that body before rendering it themselves.
+    """
+    cache = _cache()
+    board = _board(window)
+    body_key = f'leaderboard:body:{board}'
+    lock_key = f'leaderboard:lock:{board}'
+    version = _version(cache, board)
+
+    deadline = time.monotonic() + getattr(settings, 'LEADERBOARD_CACHE_LOCK_WAIT', 2.0)
+    while True:
+        rendered = cache.get(body_key)
+        if rendered and rendered['version'] == version:
+            return rendered['body'], version
+        locked = cache.add(lock_key, version, timeout=30)
+        if locked or time.monotonic() >= deadline:
+            break
+        time.sleep(0.05)
+
+    try:
+        entries = top(window=window)
+        rendered = {
+            'version': version,
+            'cutoff': entries[-1]['score'] if len(entries) >= TOP_N else None,
+            'body': json.dumps(entries, separators=(',', ':')).encode(),
+        }
+        cache.set(body_key, rendered, timeout=cache_ttl())
+    finally:
+        if locked:
+            cache.delete(lock_key)
+    return rendered['body'], version
+
+
+def diff(previous, current):
+    """
+    Compact difference between two top-N lists: the entries whose rank or score
+    changed (previous_rank is None for newcomers) and the usernames that dropped out.
+    """
+    before = {entry['username']: (rank, entry['score']) for rank, entry in enumerate(previous, 1)}
+    changes = []
+    for rank, entry in enumerate(current, 1):
+        old = before.get(entry['username'])
+        if old != (rank, entry['score']):
+            changes.append({
+                'rank': rank,
+                'username': entry['username'],
+                'score': entry['score'],
+                'previous_rank': old[0] if old else None,
+            })
+    current_names = {entry['username'] for entry in current}
+    removed = [entry['username'] for entry in previous if entry['username'] not in current_names]
+    return changes, removed
+
+
+def _publish_changes(window, board):
+    """Push the board's top-N diff to this process's event stream subscribers"""
+    topic = f'leaderboard:{window}'
+    if not events.has_subscribers(topic):
+        return
+    current = top(window=window)
+    with _published_lock:
+        published_board, previous = _published.get(window, (None, []))
+        _published[window] = (board, current)
+    if published_board != board:
+        previous = []
+    changes, removed = diff(previous, current)
+    if changes or removed:
+        events.publish(topic, {'window': window, 'changes': changes, 'removed': removed})
+
+
+def page_size():
+    return getattr(settings, 'LEADERBOARD_PAGE_SIZE', 50)
+
+
+def max_page_size():
+    return getattr(settings, 'LEADERBOARD_MAX_PAGE_SIZE', 200)
+
+
+def _encode_cursor(window, score, user_id):
+    raw = json.dumps([window, score, user_id], separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def _decode_cursor(cursor):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        window, score, user_id = json.loads(raw)
+    except (binascii.Error, UnicodeDecodeError, ValueError, TypeError):
+        raise ValueError("Invalid cursor")
+    if not isinstance(score, int) or not isinstance(user_id, int):
+        raise ValueError("Invalid cursor")
+    return window, score, user_id
+
+
+def page(cursor=None, size=None, window=ALL_TIME):
+    """
+    One page of the board after `cursor` (None for the first page). Returns
+    (rows, next_cursor) where rows are [{'username', 'score'}] and next_cursor
+    is None on the last page. Raises ValueError for a cursor that is malformed
+    or belongs to another window.
+    """
+    size = size or page_size()
+    entries = _entries(window)
+    if cursor:
+        cursor_window, score, user_id = _decode_cursor(cursor)
+        if cursor_window != window:
+            raise ValueError("Cursor belongs to a different window")
+        entries = entries.filter(best_score__lte=score).exclude(best_score=score, user_id__lte=user_id)
+    rows = list(
+        entries.order_by('-best_score', 'user_id')
+        .values_list('user_id', 'user__username', 'best_score')[:size + 1]
+    )
+    next_cursor = None
+    if len(rows) > size:
+        rows = rows[:size]
+        last_user_id, _, last_score = rows[-1]
+        next_cursor = _encode_cursor(window, last_score, last_user_id)
+    return [{'username': username, 'score': score} for _, username, score in rows], next_cursor
+
+
+def rebuild(chunk_size=10000):
+    """Recompute every entry from the Score table. Returns the number of all-time entries written."""
+    written = 0
+    with transaction.atomic():
+        LeaderboardEntry.objects.all().delete()
+        user_ids = Score.objects.values_list('user_id', flat=True).distinct().order_by('user_id')
+        last_user_id = 0
+        while True:
+            chunk = list(user_ids.filter(user_id__gt=last_user_id)[:chunk_size])
+            if not chunk:
+                break
+            last_user_id = chunk[-1]
+            best_scores = (
+                Score.objects
+                .filter(user_id__gte=chunk[0], user_id__lte=last_user_id)
+                .values('user_id')
+                .annotate(best_score=Max('score'))
+                .order_by()
+            )
+            LeaderboardEntry.objects.bulk_create(
+                [LeaderboardEntry(user_id=row['user_id'], best_score=row['best_score']) for row in best_scores],
+                batch_size=1000,
+            )
+            written += len(chunk)
+        _rebuild_windows()
+    rank_index.invalidate()
+    cache = _cache()
+    for window in WINDOWS:
+        _bump(cache, _board(window))
+    return written
+
+
+def _rebuild_windows():
+    """Recompute the retained day and week buckets from the Score rows they cover"""
+    WindowedLeaderboardEntry.objects.all().delete()
+    today = timezone.localdate()
+    for window, kept in retention().items():
+        length = _bucket_length(window)
+        current = bucket_start(window, today)
+        for age in range(kept):
+            bucket = current - length * age
+            start = timezone.make_aware(datetime.datetime.combine(bucket, datetime.time.min))
+            best_scores = (
+                Score.objects
+                .filter(date__gte=start, date__lt=start + length)
+                .values('user_id')
+                .annotate(best_score=Max('score'))
+                .order_by()
+            )
+            WindowedLeaderboardEntry.objects.bulk_create(
+                [
+                    WindowedLeaderboardEntry(window=window, bucket=bucket, user_id=row['user_id'], best_score=row['best_score'])
+                    for row in best_scores.iterator()
+                ],
+                batch_size=1000,
+            )
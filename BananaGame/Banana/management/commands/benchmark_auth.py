@@ -0,0 +1,93 @@
+import secrets
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test.utils import CaptureQueriesContext, override_settings
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from Banana import puzzle_sessions, snapshots, views
+from Banana.authentication import SnapshotJWTAuthentication
+from Banana.models import Player
+
+PUZZLE = {'question': 'benchmark', 'solution': '5'}
+
+
+class Command(BaseCommand):
+    help = (
+        "Count the queries and time per request of gameplay endpoints with simplejwt's "
+        "JWTAuthentication and no player snapshot (before) and with SnapshotJWTAuthentication "
+        "and warm snapshots (after). Uses a throwaway user, deleted afterwards."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=200)
+
+    def handle(self, *args, **options):
+        count = options['requests']
+        user = User.objects.create_user(f'benchmark-auth-{secrets.token_hex(4)}', password=None)
+        Player.objects.create(user=user, hints=10 ** 6)
+        client = APIClient(SERVER_NAME='localhost')
+        client.credentials(HTTP_AUTHORIZATION=f'Bearer {RefreshToken.for_user(user).access_token}')
+
+        def check_puzzle(answer):
+            def call():
+                puzzle_sessions.issue(user.pk, dict(PUZZLE))
+                return client.post('/banana/check-puzzle/', {'answer': answer}, format='json')
+            return call
+
+        def use_hint():
+            puzzle_sessions.issue(user.pk, dict(PUZZLE))
+            return client.post('/banana/use-hint/', format='json')
+
+        cases = [
+            ("GET player/", views.player_detail, lambda: client.get('/banana/player/')),
+            ("POST check-puzzle/ (right)", views.check_puzzle_answer, check_puzzle('5')),
+            ("POST check-puzzle/ (wrong)", views.check_puzzle_answer, check_puzzle('4')),
+            ("POST use-hint/", views.use_hint, use_hint),
+        ]
+        lines = []
+        try:
+            with override_settings(THROTTLES={}):
+                for name, view, call in cases:
+                    before = self.measure(view, JWTAuthentication, call, count, user, cold=True)
+                    after = self.measure(view, SnapshotJWTAuthentication, call, count, user, cold=False)
+                    lines.append(
+                        f"  {name:<28} {before[0]:.1f} -> {after[0]:.1f} queries, "
+                        f"{before[1]:.2f} -> {after[1]:.2f}ms per request"
+                    )
+        finally:
+            snapshots.forget_user(user.pk)
+            snapshots.forget_player(user.pk)
+            user.delete()
+
+        self.stdout.write(self.style.SUCCESS(
+            f"{count} requests each, JWTAuthentication -> SnapshotJWTAuthentication with snapshots:\n"
+            + "\n".join(lines)
+        ))
+
+    def measure(self, view, authentication_class, call, count, user, cold):
+        """(queries, milliseconds) per request"""
+        # api_view fixes the authentication classes when the view is defined
+        original = view.cls.authentication_classes
+        view.cls.authentication_classes = [authentication_class]
+        try:
+            call()  # warm up, and fill the snapshots for the warm case
+            queries = 0
+            elapsed = 0.0
+            for _ in range(count):
+                if cold:
+                    snapshots.forget_player(user.pk)
+                with CaptureQueriesContext(connection) as captured:
+                    started = time.perf_counter()
+                    response = call()
+                    elapsed += time.perf_counter() - started
+                if response.status_code >= 400:
+                    raise RuntimeError(f"{response.status_code}: {response.content[:200]}")
+                queries += len(captured)
+        finally:
+            view.cls.authentication_classes = original
+        return queries / count, elapsed / count * 1000
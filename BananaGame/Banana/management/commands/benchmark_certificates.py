@@ -0,0 +1,44 @@
+import datetime
+import tempfile
+import time
+from types import SimpleNamespace
+
+from django.core.management.base import BaseCommand
+from django.test.utils import override_settings
+
+from Banana import certificates
+
+
+class Command(BaseCommand):
+    help = (
+        "Time certificate rendering: the whole page drawn per certificate, the cached "
+        "layout with the details stamped on, and disk cache hits. Does not touch the database."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--renders', type=int, default=500)
+
+    def handle(self, *args, **options):
+        renders = options['renders']
+        date = datetime.date.today()
+        users = [SimpleNamespace(pk=n, username=f'player{n}') for n in range(renders)]
+
+        def rate(render):
+            started = time.perf_counter()
+            for n, user in enumerate(users):
+                render(user, n % 3 + 1, 1000 + n)
+            return renders / (time.perf_counter() - started)
+
+        # Draw the layout forms before timing anything
+        certificates.warm()
+
+        full = rate(lambda user, rank, score: certificates.render_full(user.username, rank, score, date))
+        stamped = rate(lambda user, rank, score: certificates.render(user.username, rank, score, date))
+        with tempfile.TemporaryDirectory() as root, override_settings(CERTIFICATE_CACHE_ROOT=root):
+            misses = rate(lambda user, rank, score: certificates.get_certificate(user, rank, score, date))
+            hits = rate(lambda user, rank, score: certificates.get_certificate(user, rank, score, date))
+
+        self.stdout.write(self.style.SUCCESS(
+            f"{renders} certificates: full redraw {full:,.0f}/s, cached layout {stamped:,.0f}/s "
+            f"({stamped / full:.1f}x), cache misses incl. write {misses:,.0f}/s, cache hits {hits:,.0f}/s"
+        ))
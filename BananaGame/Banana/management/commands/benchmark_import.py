@@ -0,0 +1,109 @@
+import copy
+import itertools
+import os
+import tempfile
+import time
+
+from django.contrib.auth.hashers import get_hasher, make_password
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from Banana import user_import
+from Banana.models import Player
+
+ALIAS = 'import_benchmark'
+
+
+class Command(BaseCommand):
+    help = (
+        "Time importing users with import_users' pipeline against the per-row path of /register/ "
+        "(two exists() queries, create_user, Player get_or_create). Database work is timed on the "
+        "full set and on a sample respectively; hashing, which costs the same per user either way, "
+        "is timed on a sample and projected. Uses a temporary SQLite database, not the configured one."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=100_000)
+        parser.add_argument('--existing', type=int, default=10_000, help="Users registered beforehand")
+        parser.add_argument('--sample', type=int, default=2000, help="Users created the per-row way")
+        parser.add_argument('--hash-sample', type=int, default=50, help="Passwords hashed per hashing timing")
+        parser.add_argument('--workers', type=int, default=None, help="Hashing processes (default: one per CPU)")
+
+    def handle(self, *args, **options):
+        fd, path = tempfile.mkstemp(suffix='.sqlite3', prefix='import-benchmark-')
+        os.close(fd)
+        connections.settings[ALIAS] = dict(
+            copy.deepcopy(connections.settings['default']), ENGINE='django.db.backends.sqlite3', NAME=path,
+        )
+        try:
+            self.run(options)
+        finally:
+            connections[ALIAS].close()
+            del connections[ALIAS]
+            del connections.settings[ALIAS]
+            os.unlink(path)
+
+    def run(self, options):
+        count = options['users']
+        with connections[ALIAS].schema_editor() as editor:
+            editor.create_model(User)
+            editor.create_model(Player)
+        User.objects.using(ALIAS).bulk_create(
+            [User(username=f'old{n}', email=f'old{n}@example.com', password='!') for n in range(options['existing'])],
+            batch_size=5000,
+        )
+        # Every hundredth row clashes with a registered user
+        rows = [
+            (number, {
+                'username': f'old{number}' if number % 100 == 0 else f'new{number}',
+                'email': f'new{number}@example.com',
+                'password': f'password-{number}',
+            })
+            for number in range(count)
+        ]
+        unusable = make_password(None)
+
+        started = time.perf_counter()
+        self.per_row(options['sample'], unusable)
+        per_row_seconds = (time.perf_counter() - started) / options['sample']
+
+        started = time.perf_counter()
+        usernames, emails = user_import.taken(ALIAS)
+        accepted, errors = user_import.validate(rows, usernames, emails)
+        validating = time.perf_counter() - started
+        started = time.perf_counter()
+        created, _ = user_import.create_users(accepted, itertools.repeat(unusable), using=ALIAS)
+        inserting = time.perf_counter() - started
+
+        passwords = [f'password-{n}' for n in range(options['hash_sample'])]
+        started = time.perf_counter()
+        for password in passwords:
+            make_password(password)
+        serial = options['hash_sample'] / (time.perf_counter() - started)
+        started = time.perf_counter()
+        list(user_import.hash_passwords(passwords, options['workers']))
+        pooled = options['hash_sample'] / (time.perf_counter() - started)
+
+        before = count * (per_row_seconds + 1 / serial)
+        after = validating + inserting + len(accepted) / pooled
+        self.stdout.write(self.style.SUCCESS(
+            f"{count:,} users to import, {options['existing']:,} already registered:\n"
+            f"  per-row register path: {per_row_seconds * 1000:.2f}ms per user without hashing "
+            f"(sample of {options['sample']:,}) -> {count * per_row_seconds:.0f}s\n"
+            f"  import_users: validated in {validating:.2f}s ({len(errors):,} rejected), "
+            f"created {created:,} users and players in {inserting:.1f}s ({created / inserting:,.0f}/s)\n"
+            f"  {get_hasher().algorithm} hashing: {serial:.1f}/s in one process, "
+            f"{pooled:.1f}/s across {options['workers'] or os.cpu_count()} processes\n"
+            f"  projected total with hashing: {before / 3600:.1f}h per row -> {after / 3600:.1f}h imported"
+        ))
+
+    def per_row(self, sample, password_hash):
+        """Create `sample` users the way /register/ does, minus the hashing"""
+        users = User.objects.using(ALIAS)
+        for number in range(sample):
+            username, email = f'register{number}', f'register{number}@example.com'
+            if users.filter(email=email).exists() or users.filter(username=username).exists():
+                continue
+            user = users.create(username=username, email=email, password=password_hash)
+            Player.objects.using(ALIAS).get_or_create(user=user)
@@ -0,0 +1,129 @@
+import copy
+import os
+import random
+import shutil
+import statistics
+import tempfile
+import time
+
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.db import connections, transaction
+from django.db.models import Max
+
+from Banana.models import LeaderboardEntry, Score
+
+ALIAS = 'leaderboard_benchmark'
+
+
+def _percentile(values, fraction):
+    values = sorted(values)
+    return values[max(int(len(values) * fraction) - 1, 0)]
+
+
+class Command(BaseCommand):
+    help = (
+        "Fill a temporary SQLite database with --rows Score rows and compare the old leaderboard "
+        "query (GROUP BY over Score joined to auth_user) with the top-N read from LeaderboardEntry, "
+        "and what each costs per submitted score. Does not touch the configured database."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=10_000_000)
+        parser.add_argument('--users', type=int, default=100_000)
+        parser.add_argument('--max-score', type=int, default=100_000)
+        parser.add_argument('--reads', type=int, default=5, help="Leaderboard reads timed per query")
+        parser.add_argument('--submissions', type=int, default=2000)
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        directory = tempfile.mkdtemp(prefix='leaderboard-benchmark-')
+        connections.settings[ALIAS] = dict(
+            copy.deepcopy(connections.settings['default']),
+            ENGINE='django.db.backends.sqlite3', NAME=os.path.join(directory, 'db.sqlite3'),
+        )
+        try:
+            call_command('migrate', database=ALIAS, verbosity=0)
+            started = time.perf_counter()
+            self.fill(rng, options)
+            fill = time.perf_counter() - started
+
+            scores = Score.objects.using(ALIAS)
+            grouped = self.timed(options['reads'], lambda: list(
+                scores.values('user__username').annotate(best=Max('score')).order_by('-best')[:10]
+            ))
+            entries = LeaderboardEntry.objects.using(ALIAS)
+            top_n = self.timed(options['reads'] * 100, lambda: list(
+                entries.order_by('-best_score', 'user_id').values_list('user__username', 'best_score')[:10]
+            ))
+
+            submissions = [
+                (rng.randint(1, options['users']), rng.randint(0, options['max_score']))
+                for _ in range(options['submissions'])
+            ]
+            insert_only = self.timed_writes(submissions, upsert=False)
+            with_upsert = self.timed_writes(submissions, upsert=True)
+        finally:
+            connections[ALIAS].close()
+            del connections[ALIAS]
+            del connections.settings[ALIAS]
+            shutil.rmtree(directory, ignore_errors=True)
+
+        self.stdout.write(self.style.SUCCESS(
+            f"{options['rows']:,} Score rows over {options['users']:,} users (filled in {fill:.0f}s):\n"
+            f"  GROUP BY over Score:    {self.describe(grouped)} per leaderboard read\n"
+            f"  LeaderboardEntry top-N: {self.describe(top_n)} per leaderboard read\n"
+            f"  submit_score writes:    {self.describe(insert_only)} for the Score row alone, "
+            f"{self.describe(with_upsert)} with the LeaderboardEntry upsert"
+        ))
+
+    def fill(self, rng, options):
+        """Users, Score rows and the LeaderboardEntry rows rebuild() would write for them"""
+        users, rows = options['users'], options['rows']
+        with connections[ALIAS].cursor() as cursor, transaction.atomic(using=ALIAS):
+            cursor.executemany(
+                'INSERT INTO auth_user (id, password, is_superuser, username, first_name, last_name, '
+                "email, is_staff, is_active, date_joined) VALUES (%s, '', 0, %s, '', '', '', 0, 1, '2026-01-01')",
+                [(user_id, f'player{user_id}') for user_id in range(1, users + 1)],
+            )
+            chunk = 100_000
+            for start in range(0, rows, chunk):
+                cursor.executemany(
+                    "INSERT INTO Banana_score (user_id, score, date) VALUES (%s, %s, '2026-01-01 00:00:00')",
+                    [
+                        (rng.randint(1, users), rng.randint(0, options['max_score']))
+                        for _ in range(min(chunk, rows - start))
+                    ],
+                )
+            cursor.execute(
+                'INSERT INTO Banana_leaderboardentry (user_id, best_score) '
+                'SELECT user_id, MAX(score) FROM Banana_score GROUP BY user_id'
+            )
+            cursor.execute('ANALYZE')
+
+    def timed(self, count, read):
+        waits = []
+        for _ in range(count):
+            started = time.perf_counter()
+            read()
+            waits.append(time.perf_counter() - started)
+        return waits
+
+    def timed_writes(self, submissions, upsert):
+        """Each submission in its own transaction, as submit_score commits them"""
+        waits = []
+        for user_id, score in submissions:
+            started = time.perf_counter()
+            with transaction.atomic(using=ALIAS):
+                Score.objects.using(ALIAS).create(user_id=user_id, score=score)
+                if upsert:
+                    # leaderboard._upsert: the conditional UPDATE, then an insert for a first score
+                    entries = LeaderboardEntry.objects.using(ALIAS)
+                    if not entries.filter(user_id=user_id, best_score__lt=score).update(best_score=score):
+                        entries.get_or_create(user_id=user_id, defaults={'best_score': score})
+            waits.append(time.perf_counter() - started)
+        return waits
+
+    def describe(self, waits):
+        return f"p50 {statistics.median(waits) * 1000:.2f}ms, p99 {_percentile(waits, 0.99) * 1000:.2f}ms"
@@ -0,0 +1,139 @@
+import copy
+import os
+import random
+import tempfile
+import time
+from datetime import timedelta
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import connections, transaction
+from django.utils import timezone
+
+from Banana.models import OTP
+
+ALIAS = 'otp_benchmark'
+INSERT_BATCH = 50_000
+
+
+class Command(BaseCommand):
+    help = (
+        "Time OTP generate/verify lookups and the expired-code purge against a table of "
+        "synthetic history, without and with the OTP indexes. Uses a temporary SQLite "
+        "database, not the configured one."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=1_000_000, help="Historical OTP rows (try 50000000)")
+        parser.add_argument('--users', type=int, default=10_000)
+        parser.add_argument('--queries', type=int, default=2000)
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        fd, path = tempfile.mkstemp(suffix='.sqlite3', prefix='otp-benchmark-')
+        os.close(fd)
+        connections.settings[ALIAS] = dict(
+            copy.deepcopy(connections.settings['default']), ENGINE='django.db.backends.sqlite3', NAME=path,
+        )
+        try:
+            self.run(options)
+        finally:
+            connections[ALIAS].close()
+            del connections[ALIAS]
+            del connections.settings[ALIAS]
+            os.unlink(path)
+
+    def run(self, options):
+        rng = random.Random(options['seed'])
+        connection = connections[ALIAS]
+        with connection.schema_editor() as editor:
+            editor.create_model(User)
+            editor.create_model(OTP)
+        # Time the schema as it was before this change: only the user_id foreign key index
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT name, sql FROM sqlite_master WHERE type = 'index' AND tbl_name = %s "
+                "AND sql IS NOT NULL AND name NOT LIKE %s",
+                [OTP._meta.db_table, '%user_id%'],
+            )
+            added_indexes = cursor.fetchall()
+            for name, _ in added_indexes:
+                cursor.execute(f'DROP INDEX "{name}"')
+
+        users = User.objects.using(ALIAS).bulk_create(
+            [User(username=f'bench{n}', password='!') for n in range(options['users'])], batch_size=5000,
+        )
+        started = time.perf_counter()
+        self.fill(connection, rng, [user.pk for user in users], options['rows'])
+        self.stdout.write(f"Inserted {options['rows']:,} OTP rows in {time.perf_counter() - started:.1f}s")
+
+        sample = [rng.choice(users) for _ in range(options['queries'])]
+        before = self.time_lookups(sample, legacy=True)
+
+        started = time.perf_counter()
+        with connection.cursor() as cursor:
+            for _, sql in added_indexes:
+                cursor.execute(sql)
+        indexing = time.perf_counter() - started
+        after = self.time_lookups(sample, legacy=False)
+        plan = self.active(sample[0]).order_by('-expires_at').explain()
+
+        started = time.perf_counter()
+        purged = OTP.objects.using(ALIAS).purge_expired()
+        purge = time.perf_counter() - started
+
+        queries = options['queries']
+        self.stdout.write(self.style.SUCCESS(
+            f"{options['rows']:,} rows, {options['users']:,} users, {queries:,} lookups of each kind:\n"
+            f"  without indexes: generate {before[0] / queries * 1000:.2f}ms, verify {before[1] / queries * 1000:.2f}ms\n"
+            f"  with indexes:    generate {after[0] / queries * 1000:.2f}ms, verify {after[1] / queries * 1000:.2f}ms "
+            f"(indexes built in {indexing:.1f}s)\n"
+            f"  verify plan: {plan}\n"
+            f"  purge_expired: {purged:,} rows in {purge:.1f}s ({purged / purge:,.0f} rows/s)"
+        ))
+
+    def fill(self, connection, rng, user_ids, rows):
+        """Mostly used or expired history, and one outstanding code for about a third of the users"""
+        now = timezone.now()
+        adapt = connection.ops.adapt_datetimefield_value
+        table = OTP._meta.db_table
+        sql = (
+            f'INSERT INTO "{table}" (user_id, otp_code, otp_type, contact_info, created_at, expires_at, is_used) '
+            f'VALUES (%s, %s, %s, %s, %s, %s, %s)'
+        )
+        outstanding = set(rng.sample(user_ids, len(user_ids) // 3))
+        history = rows - len(outstanding)
+        span = 365 * 24 * 60 * 60
+        with transaction.atomic(using=ALIAS), connection.cursor() as cursor:
+            for start in range(0, history, INSERT_BATCH):
+                batch = []
+                for _ in range(min(INSERT_BATCH, history - start)):
+                    created_at = now - timedelta(seconds=rng.randrange(span) + 3600)
+                    batch.append((
+                        rng.choice(user_ids), '%064x' % rng.getrandbits(256), OTP.EMAIL, 'player@example.com',
+                        adapt(created_at), adapt(created_at + timedelta(minutes=10)), rng.random() < 0.7,
+                    ))
+                cursor.executemany(sql, batch)
+            cursor.executemany(sql, [
+                (user_id, '%064x' % rng.getrandbits(256), OTP.EMAIL, 'player@example.com',
+                 adapt(now), adapt(now + timedelta(minutes=10)), False)
+                for user_id in outstanding
+            ])
+
+    def active(self, user):
+        return OTP.objects.using(ALIAS).active(user, OTP.EMAIL)
+
+    def time_lookups(self, sample, legacy):
+        """Seconds for the queries generate_otp and verify_otp make, over the sampled users"""
+        started = time.perf_counter()
+        for user in sample:
+            # generate_otp's invalidation; no row has an empty contact_info, so the data is left as it was
+            self.active(user).filter(contact_info='').update(is_used=True)
+        generate = time.perf_counter() - started
+
+        started = time.perf_counter()
+        for user in sample:
+            # verify_otp's lookup; before this change it took the newest by created_at
+            self.active(user).order_by('-created_at' if legacy else '-expires_at').first()
+        verify = time.perf_counter() - started
+        return generate, verify
@@ -0,0 +1,111 @@
+import socketserver
+import threading
+import time
+
+from django.core.mail import get_connection, send_mail
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.test.utils import override_settings
+
+from Banana import outbox
+
+
+class StandInSMTPHandler(socketserver.StreamRequestHandler):
+    """Just enough SMTP for Django's backend, with delays standing in for a slow server"""
+
+    def reply(self, line):
+        self.wfile.write(line + b'\r\n')
+
+    def handle(self):
+        # Connection setup (TCP, TLS handshake, greeting) on a real server
+        time.sleep(self.server.connect_delay)
+        self.reply(b'220 localhost ESMTP stand-in')
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            command = line[:4].upper()
+            time.sleep(self.server.command_delay)
+            if command == b'QUIT':
+                self.reply(b'221 Bye')
+                return
+            if command == b'DATA':
+                self.reply(b'354 End data with <CR><LF>.<CR><LF>')
+                while self.rfile.readline() not in (b'.\r\n', b''):
+                    pass
+                with self.server.lock:
+                    self.server.received += 1
+                self.reply(b'250 OK queued')
+            elif command in (b'EHLO', b'HELO', b'MAIL', b'RCPT', b'RSET', b'NOOP'):
+                self.reply(b'250 OK')
+            else:
+                self.reply(b'502 Command not implemented')
+
+
+class StandInSMTPServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, connect_delay, command_delay):
+        super().__init__(('127.0.0.1', 0), StandInSMTPHandler)
+        self.connect_delay = connect_delay
+        self.command_delay = command_delay
+        self.received = 0
+        self.lock = threading.Lock()
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare sending mail in the request (a new SMTP connection per message) with the "
+        "outbox (queue in the request, send over one connection) against a local SMTP stand-in. "
+        "Outbox rows are rolled back afterwards."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--messages', type=int, default=200)
+        parser.add_argument(
+            '--connect-delay', type=float, default=0.2,
+            help="Seconds the stand-in takes to accept a connection (TLS handshake and greeting)",
+        )
+        parser.add_argument('--command-delay', type=float, default=0.005, help="Seconds per SMTP command")
+
+    def handle(self, *args, **options):
+        count = options['messages']
+        server = StandInSMTPServer(options['connect_delay'], options['command_delay'])
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        host, port = server.server_address
+
+        def connection():
+            return get_connection(
+                'django.core.mail.backends.smtp.EmailBackend', host=host, port=port,
+                username='', password='', use_tls=False, use_ssl=False, fail_silently=False,
+            )
+
+        try:
+            started = time.perf_counter()
+            for n in range(count):
+                send_mail(f"Benchmark {n}", "Hello", 'bench@example.com', ['player@example.com'], connection=connection())
+            direct = time.perf_counter() - started
+
+            with override_settings(EMAIL_OUTBOX_BATCH_SIZE=max(outbox.batch_size(), 50)), transaction.atomic():
+                started = time.perf_counter()
+                for n in range(count):
+                    outbox.enqueue(f"Benchmark {n}", "Hello", ['player@example.com'], from_email='bench@example.com')
+                enqueued = time.perf_counter() - started
+
+                started = time.perf_counter()
+                sent, failed = outbox.drain(connection())
+                drained = time.perf_counter() - started
+                transaction.set_rollback(True)
+        finally:
+            server.shutdown()
+            server.server_close()
+
+        self.stdout.write(self.style.SUCCESS(
+            f"{count} messages, {options['connect_delay'] * 1000:.0f}ms connect, "
+            f"{options['command_delay'] * 1000:.0f}ms per command:\n"
+            f"  send_mail in the request: {direct / count * 1000:.1f}ms per request, {count / direct:,.1f} messages/s\n"
+            f"  outbox: {enqueued / count * 1000:.2f}ms per request to queue, "
+            f"sender {sent / drained:,.1f} messages/s over one connection ({failed} failed)\n"
+            f"  stand-in received {server.received} messages"
+        ))
@@ -0,0 +1,111 @@
+import json
+import random
+import statistics
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.test.utils import override_settings
+
+from Banana import puzzle_pool, upstream
+
+
+def _percentile(values, fraction):
+    values = sorted(values)
+    return values[max(int(len(values) * fraction) - 1, 0)]
+
+
+class StandInAPIHandler(BaseHTTPRequestHandler):
+    """Answers like api.php after a delay, with an occasional slow response"""
+
+    def do_GET(self):
+        server = self.server
+        with server.lock:
+            slow = server.random.random() < server.slow_fraction
+        time.sleep(server.slow_latency if slow else server.latency)
+        body = json.dumps({'question': 'https://example.com/banana.png', 'solution': 7}).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class StandInAPIServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, latency, slow_latency, slow_fraction, seed):
+        super().__init__(('127.0.0.1', 0), StandInAPIHandler)
+        self.latency = latency
+        self.slow_latency = slow_latency
+        self.slow_fraction = slow_fraction
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare fetching each puzzle from the Banana API in the request with popping it from "
+        "the local pool, against a local stand-in for api.php. Pool rows are rolled back afterwards."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--puzzles', type=int, default=100)
+        parser.add_argument('--latency', type=float, default=0.1, help="Seconds the stand-in takes to answer")
+        parser.add_argument('--slow-latency', type=float, default=1.0, help="Seconds for a slow answer")
+        parser.add_argument('--slow-fraction', type=float, default=0.05, help="Share of answers that are slow")
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        count = options['puzzles']
+        server = StandInAPIServer(
+            options['latency'], options['slow_latency'], options['slow_fraction'], options['seed'],
+        )
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        client = upstream.UpstreamClient(f'http://127.0.0.1:{server.server_address[1]}/api.php', timeout=10.0)
+        configured_client = upstream._client
+        upstream._client = client
+        # No background refill: the pool is filled up front so every pop is timed against a full pool
+        overrides = override_settings(PUZZLE_SOURCE='upstream', PUZZLE_IMAGE_STORE=False, PUZZLE_POOL_LOW_WATERMARK=0)
+        try:
+            with overrides, transaction.atomic():
+                direct = self.timed(count, puzzle_pool.fetch_from_upstream)
+
+                started = time.perf_counter()
+                added = puzzle_pool.refill(target=count)
+                refill = time.perf_counter() - started
+                pooled = self.timed(added, puzzle_pool.pop_puzzle)
+                transaction.set_rollback(True)
+        finally:
+            upstream._client = configured_client
+            client.session.close()
+            server.shutdown()
+            server.server_close()
+
+        self.stdout.write(self.style.SUCCESS(
+            f"{count} puzzles, stand-in answering in {options['latency'] * 1000:.0f}ms "
+            f"({options['slow_fraction']:.0%} in {options['slow_latency'] * 1000:.0f}ms):\n"
+            f"  API in the request: {self.describe(direct)}\n"
+            f"  pool:               {self.describe(pooled)}\n"
+            f"  refilling the pool took {refill:.2f}s off the request path"
+        ))
+
+    def timed(self, count, fetch):
+        waits = []
+        for _ in range(count):
+            started = time.perf_counter()
+            if fetch() is None:
+                raise RuntimeError("The puzzle pool ran dry during the benchmark")
+            waits.append(time.perf_counter() - started)
+        return waits
+
+    def describe(self, waits):
+        return (
+            f"p50 {statistics.median(waits) * 1000:.2f}ms, p99 {_percentile(waits, 0.99) * 1000:.2f}ms, "
+            f"max {max(waits) * 1000:.1f}ms"
+        )
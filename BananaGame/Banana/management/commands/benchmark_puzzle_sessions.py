@@ -0,0 +1,140 @@
+import copy
+import json
+import os
+import shutil
+import statistics
+import tempfile
+import threading
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import OperationalError, connections
+from django.test.utils import override_settings
+
+from Banana import puzzle_sessions
+
+ALIAS = 'puzzle_session_benchmark'
+PUZZLE = {'question': 'https://example.com/banana.png', 'solution': '7'}
+
+
+def _percentile(values, fraction):
+    values = sorted(values)
+    return values[max(int(len(values) * fraction) - 1, 0)]
+
+
+class Command(BaseCommand):
+    help = (
+        "Run threads of players fetching and answering puzzles, keeping the current puzzle in a "
+        "Player-style SQLite row (before) and in the PUZZLE_SESSION_CACHE store (after), and "
+        "report the write waits and how many unanswered puzzles survive. Uses a temporary "
+        "SQLite database and cache directory, not the configured ones."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=16)
+        parser.add_argument('--actions', type=int, default=200, help="Fetch/answer cycles per thread")
+        parser.add_argument(
+            '--players', type=int, default=2000,
+            help="Players left holding an unanswered puzzle, checked for survival afterwards",
+        )
+
+    def handle(self, *args, **options):
+        directory = tempfile.mkdtemp(prefix='puzzle-session-benchmark-')
+        connections.settings[ALIAS] = dict(
+            copy.deepcopy(connections.settings['default']),
+            ENGINE='django.db.backends.sqlite3', NAME=os.path.join(directory, 'db.sqlite3'),
+        )
+        # The configured session cache, moved to the scratch directory
+        alias = getattr(settings, 'PUZZLE_SESSION_CACHE', 'default')
+        cache_settings = dict(settings.CACHES[alias])
+        if 'FileBasedCache' in cache_settings['BACKEND']:
+            cache_settings['LOCATION'] = os.path.join(directory, 'cache')
+        caches = dict(settings.CACHES, **{alias: cache_settings})
+        try:
+            with connections[ALIAS].cursor() as cursor:
+                cursor.execute('CREATE TABLE player (id INTEGER PRIMARY KEY, current_puzzle TEXT NOT NULL)')
+                cursor.executemany(
+                    'INSERT INTO player (id, current_puzzle) VALUES (%s, %s)',
+                    [(number, '{}') for number in range(options['threads'])],
+                )
+            before = self.run_threads(options, self.row_cycle)
+            with override_settings(CACHES=caches):
+                after = self.run_threads(options, self.session_cycle)
+                survived = self.survival(options['players'])
+        finally:
+            connections[ALIAS].close()
+            del connections[ALIAS]
+            del connections.settings[ALIAS]
+            shutil.rmtree(directory, ignore_errors=True)
+
+        self.stdout.write(self.style.SUCCESS(
+            f"{options['threads']} threads x {options['actions']} fetch/answer cycles:\n"
+            f"  Player row:    {self.describe(before)}\n"
+            f"  session store: {self.describe(after)} ({cache_settings['BACKEND'].rsplit('.', 1)[-1]})\n"
+            f"  {survived:,} of {options['players']:,} unanswered puzzles still there afterwards"
+        ))
+
+    def describe(self, result):
+        elapsed, waits, failures = result
+        line = (
+            f"{len(waits) / elapsed:,.0f} writes/s, wait p50 {statistics.median(waits) * 1000:.2f}ms, "
+            f"p99 {_percentile(waits, 0.99) * 1000:.2f}ms, max {max(waits) * 1000:.1f}ms"
+        )
+        if failures:
+            line += f", {failures} 'database is locked' failures"
+        return line
+
+    def run_threads(self, options, cycle):
+        """(seconds, per-write latencies, failed writes) for every thread running `cycle`"""
+        waits = []
+        failures = []
+        barrier = threading.Barrier(options['threads'])
+
+        def player(number):
+            own_waits, own_failures = [], 0
+            barrier.wait()
+            try:
+                for _ in range(options['actions']):
+                    own_failures += cycle(number, own_waits)
+            finally:
+                connections.close_all()
+            waits.extend(own_waits)
+            failures.append(own_failures)
+
+        threads = [threading.Thread(target=player, args=(number,)) for number in range(options['threads'])]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return time.perf_counter() - started, waits, sum(failures)
+
+    def row_cycle(self, number, waits):
+        """fetch_puzzle and check_puzzle_answer as they were: write the puzzle to the row, then clear it"""
+        failed = 0
+        for value in (json.dumps(PUZZLE), '{}'):
+            started = time.perf_counter()
+            try:
+                with connections[ALIAS].cursor() as cursor:
+                    cursor.execute('UPDATE player SET current_puzzle = %s WHERE id = %s', [value, number])
+            except OperationalError:
+                failed += 1
+            waits.append(time.perf_counter() - started)
+        return failed
+
+    def session_cycle(self, number, waits):
+        started = time.perf_counter()
+        puzzle_sessions.issue(number, dict(PUZZLE))
+        waits.append(time.perf_counter() - started)
+        started = time.perf_counter()
+        puzzle_sessions.take(number)
+        waits.append(time.perf_counter() - started)
+        return 0
+
+    def survival(self, players):
+        """Leave `players` players holding a puzzle and count how many the store still has"""
+        user_ids = range(10 ** 6, 10 ** 6 + players)
+        for user_id in user_ids:
+            puzzle_sessions.issue(user_id, dict(PUZZLE))
+        return sum(1 for user_id in user_ids if puzzle_sessions.get(user_id))
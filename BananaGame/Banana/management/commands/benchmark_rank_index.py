@@ -0,0 +1,47 @@
+import random
+import time
+
+from django.core.management.base import BaseCommand
+
+from Banana.rank_index import RankIndex
+
+
+class Command(BaseCommand):
+    help = (
+        "Time the leaderboard rank index on synthetic players: build, rank lookups "
+        "and score updates. Does not touch the database."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--players', type=int, default=1_000_000)
+        parser.add_argument('--max-score', type=int, default=5000)
+        parser.add_argument('--queries', type=int, default=100_000)
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        players = options['players']
+        max_score = options['max_score']
+        queries = options['queries']
+
+        scores = {user_id: rng.randint(0, max_score) for user_id in range(1, players + 1)}
+        started = time.perf_counter()
+        index = RankIndex(scores)
+        build = time.perf_counter() - started
+
+        user_ids = [rng.randint(1, players) for _ in range(queries)]
+        started = time.perf_counter()
+        for user_id in user_ids:
+            index.rank(user_id)
+        lookups = time.perf_counter() - started
+
+        started = time.perf_counter()
+        for user_id in user_ids:
+            index.update(user_id, rng.randint(0, max_score))
+        updates = time.perf_counter() - started
+
+        self.stdout.write(self.style.SUCCESS(
+            f"{players} players: built in {build:.2f}s, "
+            f"{queries / lookups:,.0f} ranks/s ({lookups / queries * 1e6:.1f}us each), "
+            f"{queries / updates:,.0f} updates/s ({updates / queries * 1e6:.1f}us each)"
+        ))
@@ -0,0 +1,77 @@
+import random
+import time
+
+from django.core.management.base import BaseCommand
+
+from Banana import scoring
+
+
+class Command(BaseCommand):
+    help = (
+        "Rescore synthetic solves with score() one at a time and with score_batch(), check "
+        "they agree, and time both over the whole set and over check_puzzle_batch sized "
+        "slices. Needs NumPy. Does not touch the database."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--solves', type=int, default=1_000_000)
+        parser.add_argument('--batch-size', type=int, default=50, help="Answers per batch submission")
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        np = scoring.np
+        scoring._require_numpy()
+        rng = random.Random(options['seed'])
+        solves = options['solves']
+        batch_size = options['batch_size']
+
+        difficulty = [rng.choice(scoring.DIFFICULTIES) for _ in range(solves)]
+        time_taken = [rng.uniform(0, 60) for _ in range(solves)]
+        combo_count = [rng.randint(0, 20) for _ in range(solves)]
+        hints_used = [rng.choice((0, 0, 1, 2)) for _ in range(solves)]
+        lucky = [rng.random() < scoring.LUCKY_CHANCE for _ in range(solves)]
+
+        started = time.perf_counter()
+        expected = [
+            scoring.score(*solve)['xp']
+            for solve in zip(difficulty, time_taken, combo_count, hints_used, lucky)
+        ]
+        loop = time.perf_counter() - started
+
+        started = time.perf_counter()
+        columns = (
+            scoring.difficulty_codes(difficulty), np.array(time_taken), np.array(combo_count),
+            np.array(hints_used), np.array(lucky),
+        )
+        convert = time.perf_counter() - started
+        scoring.score_batch(*columns)  # Fault the result pages in before timing
+        started = time.perf_counter()
+        _, xp = scoring.score_batch(*columns)
+        scoring.levels_for_xp(xp)
+        batch = time.perf_counter() - started
+        if xp.tolist() != expected:
+            raise AssertionError("score_batch() disagrees with score()")
+
+        slices = [slice(start, start + batch_size) for start in range(0, solves, batch_size)]
+        started = time.perf_counter()
+        for rows in slices:
+            for solve in zip(difficulty[rows], time_taken[rows], combo_count[rows], hints_used[rows], lucky[rows]):
+                scoring.score(*solve)
+        small_loop = time.perf_counter() - started
+        started = time.perf_counter()
+        for rows in slices:
+            scoring.score_batch(
+                scoring.difficulty_codes(difficulty[rows]), time_taken[rows], combo_count[rows],
+                hints_used[rows], lucky[rows],
+            )
+        small_batch = time.perf_counter() - started
+
+        self.stdout.write(self.style.SUCCESS(
+            f"{solves:,} solves:\n"
+            f"  score() loop:  {loop:.2f}s ({solves / loop:,.0f} solves/s)\n"
+            f"  score_batch(): {batch * 1000:.0f}ms with levels ({solves / batch:,.0f} solves/s, "
+            f"{loop / batch:.0f}x), plus {convert * 1000:.0f}ms building the arrays from lists\n"
+            f"{len(slices):,} slices of {batch_size}:\n"
+            f"  score() loop:  {small_loop / len(slices) * 1e6:.1f}us each, with breakdowns\n"
+            f"  score_batch(): {small_batch / len(slices) * 1e6:.1f}us each, totals only"
+        ))
@@ -0,0 +1,68 @@
+import json
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.test import RequestFactory
+from django.test.utils import override_settings
+from django.urls import resolve
+from rest_framework_simplejwt.settings import api_settings as jwt_settings
+from rest_framework_simplejwt.tokens import AccessToken
+
+from Banana.throttling import ThrottleMiddleware
+
+# Addresses and ids nobody uses, so the real counters are left alone
+BENCH_IP = '198.51.100.7'
+BENCH_USER_ID = -1
+BENCH_EMAIL = 'throttle-benchmark@example.invalid'
+
+
+class Command(BaseCommand):
+    help = (
+        "Time ThrottleMiddleware's work per request: an unthrottled route, each scope "
+        "(ip, user from the JWT, email from the body), and a rejection, against the "
+        "THROTTLE_CACHE alias and an in-process cache for comparison"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=5000)
+
+    def handle(self, *args, **options):
+        count = options['requests']
+        factory = RequestFactory()
+        token = AccessToken()
+        token[jwt_settings.USER_ID_CLAIM] = BENCH_USER_ID
+        authorization = f'Bearer {token}'
+
+        def request(path, **extra):
+            body = json.dumps({'email': BENCH_EMAIL})
+            built = factory.post(path, body, content_type='application/json', REMOTE_ADDR=BENCH_IP, **extra)
+            built.resolver_match = resolve(path)
+            return built
+
+        cases = [
+            ("unthrottled route", request('/banana/leaderboard/'), {}),
+            ("ip", request('/banana/puzzle/'), {'ip': (10 ** 9, 60)}),
+            ("user (JWT)", request('/banana/puzzle/', HTTP_AUTHORIZATION=authorization), {'user': (10 ** 9, 60)}),
+            ("email (body)", request('/banana/login/request-otp/'), {'email': (10 ** 9, 60)}),
+            ("rejected", request('/banana/puzzle/'), {'ip': (0, 60)}),
+        ]
+        caches = dict(settings.CACHES, throttle_benchmark={'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'})
+        middleware = ThrottleMiddleware(lambda request: None)
+
+        lines = []
+        for alias in (getattr(settings, 'THROTTLE_CACHE', 'default'), 'throttle_benchmark'):
+            backend = caches[alias]['BACKEND'].rsplit('.', 1)[-1]
+            lines.append(f"  {alias} ({backend}):")
+            for name, built, limits in cases:
+                route = built.resolver_match.url_name
+                with override_settings(CACHES=caches, THROTTLE_CACHE=alias, THROTTLES={route: limits} if limits else {}):
+                    middleware.process_view(built, None, (), {})
+                    started = time.perf_counter()
+                    for _ in range(count):
+                        response = middleware.process_view(built, None, (), {})
+                    elapsed = time.perf_counter() - started
+                outcome = response.status_code if response is not None else 'allowed'
+                lines.append(f"    {name:<18} {elapsed / count * 1e6:8.1f}us per request ({outcome})")
+
+        self.stdout.write(self.style.SUCCESS(f"{count} requests per case:\n" + "\n".join(lines)))
@@ -0,0 +1,32 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from Banana import image_store, puzzle_generator
+from Banana.models import PooledPuzzle
+
+
+class Command(BaseCommand):
+    help = "Generate banana-equation puzzles locally and add them to the puzzle pool"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--count', type=int, default=1000, help="Number of puzzles to generate")
+        parser.add_argument('--workers', type=int, default=None, help="Worker processes (default: CPU count)")
+        parser.add_argument('--no-store', action='store_true', help="Only generate and report throughput")
+
+    def handle(self, *args, **options):
+        count = options['count']
+        started = time.perf_counter()
+        puzzles = puzzle_generator.generate_batch(count, workers=options['workers'])
+        elapsed = time.perf_counter() - started
+        self.stdout.write(
+            f"Generated {len(puzzles)} puzzles in {elapsed:.2f}s ({len(puzzles) / elapsed:.0f} puzzles/s)"
+        )
+
+        if options['no_store']:
+            return
+
+        PooledPuzzle.objects.bulk_create(
+            [PooledPuzzle(data=image_store.localize(puzzle)) for puzzle in puzzles], batch_size=500
+        )
+        self.stdout.write(self.style.SUCCESS(f"Pool size is now {PooledPuzzle.objects.count()}"))
@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Count, Sum
+
+from Banana import image_store
+from Banana.models import PuzzleImage
+
+
+class Command(BaseCommand):
+    help = "Report hit ratio and disk usage of the puzzle image store, optionally evicting down to the limit"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--evict', action='store_true', help="Evict least recently used images above the size limit")
+
+    def handle(self, *args, **options):
+        if options['evict']:
+            removed = image_store.evict()
+            self.stdout.write(f"Evicted {removed} images")
+
+        totals = PuzzleImage.objects.aggregate(images=Count('digest'), hits=Sum('hits'), size=Sum('size'))
+        images = totals['images']
+        hits = totals['hits'] or 0
+        # Every stored image was a miss once; hits are lookups that reused it
+        lookups = hits + images
+        hit_ratio = hits / lookups if lookups else 0.0
+        limit = image_store.max_bytes()
+
+        self.stdout.write(f"Images stored:   {images}")
+        self.stdout.write(f"Hits / misses:   {hits} / {images}")
+        self.stdout.write(f"Hit ratio:       {hit_ratio:.1%}")
+        self.stdout.write(f"Indexed size:    {(totals['size'] or 0) / 1024 / 1024:.2f} MiB")
+        self.stdout.write(f"Disk usage:      {image_store.disk_usage() / 1024 / 1024:.2f} MiB")
+        self.stdout.write(f"Size limit:      {limit / 1024 / 1024:.2f} MiB")
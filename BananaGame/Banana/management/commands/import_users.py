@@ -0,0 +1,61 @@
+import os
+import sys
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from Banana import user_import
+
+MAX_ERRORS_SHOWN = 20
+
+
+class Command(BaseCommand):
+    help = (
+        "Create users and their players from a CSV (username,email,password header) or NDJSON "
+        "file, '-' for stdin. Rows breaking the registration rules or clashing with existing "
+        "or earlier users are reported and skipped; a blank password means OTP sign-in only."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--format', choices=['csv', 'ndjson'], help="Default: from the file extension")
+        parser.add_argument('--chunk-size', type=int, default=2000)
+        parser.add_argument('--workers', type=int, default=None, help="Hashing processes (default: one per CPU)")
+        parser.add_argument('--dry-run', action='store_true', help="Validate and report without creating anyone")
+
+    def handle(self, *args, **options):
+        path = options['path']
+        file_format = options['format'] or ('csv' if path.lower().endswith('.csv') else 'ndjson')
+        try:
+            if path == '-':
+                rows = list(user_import.read_rows(sys.stdin, file_format))
+            else:
+                # utf-8-sig drops the byte order mark spreadsheets put at the start of CSV exports
+                with open(path, newline='', encoding='utf-8-sig') as stream:
+                    rows = list(user_import.read_rows(stream, file_format))
+        except (OSError, UnicodeDecodeError) as exc:
+            raise CommandError(f"Cannot read {path}: {exc}")
+
+        started = time.perf_counter()
+        usernames, emails = user_import.taken()
+        accepted, errors = user_import.validate(rows, usernames, emails)
+        for number, message in errors[:MAX_ERRORS_SHOWN]:
+            self.stderr.write(f"line {number}: {message}")
+        if len(errors) > MAX_ERRORS_SHOWN:
+            self.stderr.write(f"... and {len(errors) - MAX_ERRORS_SHOWN} more")
+
+        if options['dry_run']:
+            self.stdout.write(self.style.SUCCESS(
+                f"Would create {len(accepted)} of {len(rows)} users ({len(errors)} rejected)"
+            ))
+            return
+
+        hashes = user_import.hash_passwords([row['password'] for row in accepted], options['workers'])
+        created, skipped = user_import.create_users(accepted, hashes, options['chunk_size'])
+        elapsed = time.perf_counter() - started
+        if skipped:
+            self.stderr.write(f"Registered while importing, skipped: {', '.join(skipped)}")
+        self.stdout.write(self.style.SUCCESS(
+            f"Created {created} of {len(rows)} users ({len(errors)} rejected, {len(skipped)} skipped) "
+            f"in {elapsed:.1f}s with {options['workers'] or os.cpu_count()} hashing processes"
+        ))
@@ -0,0 +1,176 @@
+import asyncio
+import json
+import os
+import secrets
+import statistics
+import time
+
+from asgiref.sync import ThreadSensitiveContext, sync_to_async
+from django.conf import settings
+from django.contrib.auth import authenticate
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.asgi import get_asgi_application
+from django.core.management.base import BaseCommand
+from django.test.utils import override_settings
+
+from Banana import hashing
+
+PASSWORD = 'load-test-password'
+
+
+def _cores():
+    if hasattr(os, 'sched_getaffinity'):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+
+def _percentile(values, fraction):
+    values = sorted(values)
+    return values[max(int(len(values) * fraction) - 1, 0)]
+
+
+class Command(BaseCommand):
+    help = (
+        "Fire concurrent logins at the ASGI application in this process and report logins per "
+        "second per core, latency, 503s and the latency of a sync view meanwhile. For comparison, "
+        "runs the same logins through authenticate() on a thread per request, as the old sync "
+        "login view did under ASGI. Uses throwaway users, deleted afterwards."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=100)
+        parser.add_argument('--concurrency', type=int, default=50)
+        parser.add_argument('--users', type=int, default=20)
+        parser.add_argument(
+            '--max-pending', type=int, default=None,
+            help="Override PASSWORD_HASH_MAX_PENDING to see the 503s",
+        )
+        parser.add_argument('--no-baseline', action='store_true', help="Skip the sync authenticate() run")
+
+    def handle(self, *args, **options):
+        prefix = f'load-login-{secrets.token_hex(4)}-'
+        # One hash for every user; hashing each would take as long as the test
+        password_hash = make_password(PASSWORD)
+        User.objects.bulk_create(
+            User(username=f'{prefix}{number}', password=password_hash) for number in range(options['users'])
+        )
+        usernames = [f'{prefix}{number}' for number in range(options['users'])]
+        try:
+            overrides = {}
+            if options['max_pending'] is not None:
+                overrides['PASSWORD_HASH_MAX_PENDING'] = options['max_pending']
+            with override_settings(**overrides):
+                lines = []
+                if not options['no_baseline']:
+                    lines.append(self.report(
+                        "authenticate(), thread per request",
+                        asyncio.run(self.run(self.sync_login, usernames, options)),
+                    ))
+                lines.append(self.report(
+                    f"async login view, {hashing.workers()} hashing threads",
+                    asyncio.run(self.run(self.view_login, usernames, options)),
+                ))
+        finally:
+            User.objects.filter(username__startswith=prefix).delete()
+
+        self.stdout.write(self.style.SUCCESS(
+            f"{options['requests']} logins, {options['concurrency']} at a time, {_cores()} core(s):\n"
+            + "\n".join(lines)
+        ))
+
+    def report(self, name, result):
+        elapsed, latencies, statuses, probes = result
+        ok = statuses.count(200)
+        rate = ok / elapsed
+        line = (
+            f"  {name}: {rate:.1f} logins/s ({rate / _cores():.1f} per core), "
+            f"p50 {statistics.median(latencies) * 1000:.0f}ms, p95 {_percentile(latencies, 0.95) * 1000:.0f}ms, "
+            f"{statuses.count(503)} x 503"
+        )
+        others = len(statuses) - ok - statuses.count(503)
+        if others:
+            line += f", {others} other failures"
+        if probes:
+            line += (
+                f"; sync view meanwhile p50 {statistics.median(probes) * 1000:.0f}ms, "
+                f"max {max(probes) * 1000:.0f}ms"
+            )
+        return line
+
+    async def run(self, login, usernames, options):
+        """(seconds, latencies, statuses, probe latencies) for one storm of logins"""
+        self.application = get_asgi_application()
+        self.host = next(
+            (h for h in settings.ALLOWED_HOSTS if h not in ('*', '') and not h.startswith('.')), 'localhost'
+        )
+        semaphore = asyncio.Semaphore(options['concurrency'])
+        latencies = []
+        statuses = []
+        probes = []
+        done = asyncio.Event()
+
+        async def one(number):
+            async with semaphore:
+                started = time.perf_counter()
+                status = await login(usernames[number % len(usernames)])
+                latencies.append(time.perf_counter() - started)
+                statuses.append(status)
+
+        async def probe():
+            # A cheap sync view, competing with the hashing for the CPU
+            while not done.is_set():
+                started = time.perf_counter()
+                await self.request('GET', '/banana/ratings/')
+                probes.append(time.perf_counter() - started)
+                await asyncio.sleep(0.1)
+
+        prober = asyncio.create_task(probe())
+        started = time.perf_counter()
+        await asyncio.gather(*(one(number) for number in range(options['requests'])))
+        elapsed = time.perf_counter() - started
+        done.set()
+        await prober
+        return elapsed, latencies, statuses, probes
+
+    async def sync_login(self, username):
+        # Django's ASGI handler gives each request its own context, hence its own sync thread
+        async with ThreadSensitiveContext():
+            user = await sync_to_async(authenticate)(username=username, password=PASSWORD)
+        return 200 if user is not None else 400
+
+    async def view_login(self, username):
+        body = json.dumps({'username': username, 'password': PASSWORD}).encode()
+        return await self.request('POST', '/banana/login/', body)
+
+    async def request(self, method, path, body=b''):
+        """Status code of one request through the ASGI application"""
+        scope = {
+            'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1',
+            'method': method, 'scheme': 'http', 'path': path, 'raw_path': path.encode(),
+            'query_string': b'', 'root_path': '',
+            'headers': [
+                (b'host', self.host.encode()),
+                (b'content-type', b'application/json'),
+                (b'content-length', str(len(body)).encode()),
+            ],
+            'client': ('127.0.0.1', 10000), 'server': (self.host, 80),
+        }
+        status = None
+        sent = False
+
+        async def receive():
+            nonlocal sent
+            if not sent:
+                sent = True
+                return {'type': 'http.request', 'body': body, 'more_body': False}
+            # Stay connected: Django cancels async views when the client disconnects
+            await asyncio.Event().wait()
+
+        async def send(message):
+            nonlocal status
+            if message['type'] == 'http.response.start':
+                status = message['status']
+
+        await self.application(scope, receive, send)
+        return status
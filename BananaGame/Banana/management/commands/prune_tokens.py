@@ -0,0 +1,30 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from Banana import revocation
+
+
+class Command(BaseCommand):
+    help = (
+        "Delete expired refresh tokens from the outstanding list and the blacklist, and "
+        "logout-all revocations older than the refresh token lifetime, in chunks. "
+        "Run it from cron, or keep it running with --every."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=10000, help="Rows per DELETE")
+        parser.add_argument('--every', type=float, default=None, help="Repeat every this many seconds")
+
+    def handle(self, *args, **options):
+        while True:
+            started = time.perf_counter()
+            outstanding, blacklisted, revocations = revocation.prune(chunk_size=options['chunk_size'])
+            elapsed = time.perf_counter() - started
+            self.stdout.write(self.style.SUCCESS(
+                f"Pruned {outstanding} outstanding tokens, {blacklisted} blacklist entries and "
+                f"{revocations} revocations in {elapsed:.2f}s"
+            ))
+            if options['every'] is None:
+                return
+            time.sleep(options['every'])
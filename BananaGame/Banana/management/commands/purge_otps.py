@@ -0,0 +1,30 @@
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from Banana.models import OTP
+
+
+class Command(BaseCommand):
+    help = (
+        "Delete OTP codes that expired more than OTP_RETENTION_HOURS ago, in chunks. "
+        "Run it from cron, or keep it running with --every."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=10000, help="Rows per DELETE")
+        parser.add_argument('--every', type=float, default=None, help="Repeat every this many seconds")
+
+    def handle(self, *args, **options):
+        while True:
+            before = timezone.now() - timedelta(hours=getattr(settings, 'OTP_RETENTION_HOURS', 24))
+            started = time.perf_counter()
+            deleted = OTP.objects.purge_expired(before=before, chunk_size=options['chunk_size'])
+            elapsed = time.perf_counter() - started
+            self.stdout.write(self.style.SUCCESS(f"Purged {deleted} expired OTPs in {elapsed:.2f}s"))
+            if options['every'] is None:
+                return
+            time.sleep(options['every'])
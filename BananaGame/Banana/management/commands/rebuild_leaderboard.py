@@ -0,0 +1,21 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from Banana import leaderboard
+
+
+class Command(BaseCommand):
+    help = (
+        "Rebuild the materialised leaderboards (LeaderboardEntry and the retained day and "
+        "week buckets in WindowedLeaderboardEntry) from the Score table"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=10000, help="Users aggregated per query")
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        written = leaderboard.rebuild(chunk_size=options['chunk_size'])
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt {written} leaderboard entries in {elapsed:.2f}s"))
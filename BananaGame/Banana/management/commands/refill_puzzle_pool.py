@@ -0,0 +1,21 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from Banana import puzzle_pool
+from Banana.models import PooledPuzzle
+
+
+class Command(BaseCommand):
+    help = "Fill the local puzzle pool up to the high watermark (or --target)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--target', type=int, default=None, help="Number of puzzles the pool should hold")
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        added = puzzle_pool.refill(target=options['target'])
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f"Added {added} puzzles in {elapsed:.2f}s, pool size is now {PooledPuzzle.objects.count()}"
+        ))
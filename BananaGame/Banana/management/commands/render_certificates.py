@@ -0,0 +1,112 @@
+import csv
+import datetime
+import io
+import re
+import resource
+import time
+import zipfile
+from contextlib import contextmanager
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from Banana import certificates, leaderboard
+
+UNSAFE = re.compile(r'[^\w.@+-]')
+MANIFEST_FIELDS = ['file', 'category', 'rank', 'username', 'score', 'date', 'bytes']
+
+
+class Command(BaseCommand):
+    help = (
+        "Render certificates for a ranked list of players in parallel, from the current "
+        "leaderboards (--window/--top) or a CSV of username,rank,score[,category], into a "
+        "directory or a zip archive with a manifest.csv"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--window', action='append', choices=leaderboard.WINDOWS,
+            help="Leaderboard to take the top players from; repeat for several",
+        )
+        parser.add_argument('--top', type=int, default=3, help="Players per leaderboard")
+        parser.add_argument('--input', help="CSV with a username,rank,score[,category] header")
+        parser.add_argument('--date', type=datetime.date.fromisoformat, help="Date printed on the certificates (default: today)")
+        target = parser.add_mutually_exclusive_group(required=True)
+        target.add_argument('--output', help="Directory to write the PDFs to")
+        target.add_argument('--zip', help="Zip archive to write the PDFs to")
+        parser.add_argument('--workers', type=int, default=None, help="Worker processes (default: CPU count)")
+        parser.add_argument('--chunk-size', type=int, default=50, help="Certificates per task sent to a worker")
+
+    def handle(self, *args, **options):
+        entries = self.load_entries(options)
+        if not entries:
+            raise CommandError("Nothing to render: pass --window and/or --input")
+        date = options['date'] or timezone.localdate()
+
+        started = time.perf_counter()
+        rendered = certificates.render_batch(
+            [(username, rank, score) for _, rank, username, score in entries],
+            date, workers=options['workers'], chunk_size=options['chunk_size'],
+        )
+        manifest = []
+        total_bytes = 0
+        with self.open_target(options) as write:
+            for (category, rank, username, score), content in zip(entries, rendered, strict=True):
+                name = f"{UNSAFE.sub('_', category)}/{rank:03d}-{UNSAFE.sub('_', username)}.pdf"
+                write(name, content)
+                total_bytes += len(content)
+                manifest.append({
+                    'file': name, 'category': category, 'rank': rank, 'username': username,
+                    'score': score, 'date': date.isoformat(), 'bytes': len(content),
+                })
+            buffer = io.StringIO()
+            writer = csv.DictWriter(buffer, fieldnames=MANIFEST_FIELDS)
+            writer.writeheader()
+            writer.writerows(manifest)
+            write('manifest.csv', buffer.getvalue().encode())
+        elapsed = time.perf_counter() - started
+
+        # ru_maxrss is in KiB on Linux; RUSAGE_CHILDREN reports the largest worker
+        parent_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+        worker_mb = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024
+        self.stdout.write(self.style.SUCCESS(
+            f"Rendered {len(manifest)} certificates ({total_bytes / 1024 / 1024:.1f} MB) in {elapsed:.2f}s "
+            f"({len(manifest) / elapsed:,.0f} pages/s); peak RSS {parent_mb:.0f} MB, "
+            f"largest worker {worker_mb:.0f} MB"
+        ))
+
+    def load_entries(self, options):
+        """[(category, rank, username, score)] from the requested leaderboards and CSV"""
+        entries = []
+        for window in options['window'] or ():
+            for rank, row in enumerate(leaderboard.top(options['top'], window=window), 1):
+                entries.append((window, rank, row['username'], row['score']))
+        if options['input']:
+            with open(options['input'], newline='', encoding='utf-8') as handle:
+                for line, row in enumerate(csv.DictReader(handle), 2):
+                    try:
+                        entries.append((
+                            row.get('category') or 'list', int(row['rank']), row['username'], int(row['score'])
+                        ))
+                    except (KeyError, TypeError, ValueError) as exc:
+                        raise CommandError(f"{options['input']}:{line}: expected username, rank and score ({exc})")
+        return entries
+
+    @contextmanager
+    def open_target(self, options):
+        """Yield a write(name, content) callable for the zip archive or directory"""
+        if options['zip']:
+            # The PDFs are already compressed, so store them as they are
+            with zipfile.ZipFile(options['zip'], 'w', compression=zipfile.ZIP_STORED) as archive:
+                yield archive.writestr
+            return
+
+        root = Path(options['output'])
+
+        def write(name, content):
+            path = root / name
+            path.parent.mkdir(parents=True, exist_ok=True)
+            path.write_bytes(content)
+
+        yield write
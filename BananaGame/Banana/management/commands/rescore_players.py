@@ -0,0 +1,63 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from Banana import scoring
+from Banana.models import Player
+
+
+class Command(BaseCommand):
+    help = (
+        "Recompute XP and levels for every player in chunks, e.g. after changing the "
+        "XP-per-level curve or to scale existing XP when rebalancing the economy. "
+        "Run it while gameplay is paused: rows are rewritten from the values read."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--xp-scale', type=float, default=1.0, help="Multiply every player's XP by this factor")
+        parser.add_argument('--chunk-size', type=int, default=5000)
+        parser.add_argument('--dry-run', action='store_true', help="Report the changes without writing them")
+
+    def handle(self, *args, **options):
+        np = scoring.np
+        scoring._require_numpy()
+        chunk_size = options['chunk_size']
+        scale = options['xp_scale']
+
+        started = time.perf_counter()
+        scanned = changed = level_ups = level_downs = 0
+        last_pk = 0
+        while True:
+            rows = list(
+                Player.objects.filter(pk__gt=last_pk).order_by('pk')
+                .values_list('pk', 'xp', 'level', 'version')[:chunk_size]
+            )
+            if not rows:
+                break
+            last_pk = rows[-1][0]
+            pks, xp, levels, versions = (np.array(column, dtype=np.int64) for column in zip(*rows))
+
+            new_xp = np.floor(xp * scale).astype(np.int64) if scale != 1.0 else xp
+            new_levels = scoring.levels_for_xp(new_xp)
+            dirty = (new_xp != xp) | (new_levels != levels)
+            scanned += len(rows)
+            changed += int(dirty.sum())
+            level_ups += int((new_levels > levels).sum())
+            level_downs += int((new_levels < levels).sum())
+
+            if options['dry_run'] or not dirty.any():
+                continue
+            players = [
+                Player(pk=int(pk), xp=int(new), level=int(level), version=int(version) + 1)
+                for pk, new, level, version in zip(pks[dirty], new_xp[dirty], new_levels[dirty], versions[dirty])
+            ]
+            with transaction.atomic():
+                Player.objects.bulk_update(players, ['xp', 'level', 'version'], batch_size=1000)
+
+        elapsed = time.perf_counter() - started
+        verb = "Would update" if options['dry_run'] else "Updated"
+        self.stdout.write(self.style.SUCCESS(
+            f"{verb} {changed} of {scanned} players in {elapsed:.2f}s "
+            f"({level_ups} level ups, {level_downs} level downs)"
+        ))
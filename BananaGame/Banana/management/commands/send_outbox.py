@@ -0,0 +1,32 @@
+import threading
+
+from django.core.management.base import BaseCommand
+
+from Banana import outbox
+
+
+class Command(BaseCommand):
+    help = (
+        "Send queued email from the outbox. Runs until interrupted unless --once is given; "
+        "use it when EMAIL_OUTBOX_SENDER_THREAD is off, or to flush the queue by hand."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help="Send what is due now and exit")
+        parser.add_argument('--purge', action='store_true', help="Also delete sent mail past the retention period")
+
+    def handle(self, *args, **options):
+        if options['once']:
+            sent, failed = outbox.drain()
+            message = f"Sent {sent} emails, {failed} failed"
+            if options['purge']:
+                message += f", purged {outbox.purge()} old messages"
+            self.stdout.write(self.style.SUCCESS(message))
+            return
+
+        self.stdout.write("Sending outbox email, Ctrl+C to stop")
+        stop = threading.Event()
+        try:
+            outbox.run(stop)
+        except KeyboardInterrupt:
+            stop.set()
@@ -0,0 +1,108 @@
+import asyncio
+import re
+import resource
+import statistics
+import time
+
+from django.conf import settings
+from django.core.asgi import get_asgi_application
+from django.core.management.base import BaseCommand, CommandError
+
+from Banana import events
+
+SEQ = re.compile(rb'"seq":(\d+)')
+
+
+class Command(BaseCommand):
+    help = (
+        "Open a swarm of event streams against the ASGI application in this process, "
+        "publish synthetic leaderboard diffs and report the fan-out latency"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--clients', type=int, default=10000)
+        parser.add_argument('--events', type=int, default=20)
+        parser.add_argument('--interval', type=float, default=0.2, help="Seconds between published events")
+
+    def handle(self, *args, **options):
+        asyncio.run(self.run(options['clients'], options['events'], options['interval']))
+
+    async def run(self, clients, count, interval):
+        application = get_asgi_application()
+        host = next((h for h in settings.ALLOWED_HOSTS if h not in ('*', '') and not h.startswith('.')), 'localhost')
+        stop = asyncio.Event()
+        published = {}
+        received = {seq: [] for seq in range(count)}
+        statuses = {}
+
+        async def client(number):
+            scope = {
+                'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1',
+                'method': 'GET', 'scheme': 'http', 'path': '/banana/events/', 'raw_path': b'/banana/events/',
+                'query_string': b'window=all', 'root_path': '', 'headers': [(b'host', host.encode())],
+                'client': ('127.0.0.1', 10000 + number), 'server': (host, 80),
+            }
+            requested = False
+
+            async def receive():
+                nonlocal requested
+                if not requested:
+                    requested = True
+                    return {'type': 'http.request', 'body': b'', 'more_body': False}
+                await stop.wait()
+                return {'type': 'http.disconnect'}
+
+            async def send(message):
+                if message['type'] == 'http.response.start':
+                    statuses[number] = message['status']
+                elif message['type'] == 'http.response.body':
+                    now = time.perf_counter()
+                    for match in SEQ.finditer(message.get('body', b'')):
+                        received[int(match.group(1))].append(now)
+
+            await application(scope, receive, send)
+
+        started = time.perf_counter()
+        tasks = [asyncio.create_task(client(number)) for number in range(clients)]
+        while events.subscriber_count() < clients:
+            finished = next((task for task in tasks if task.done()), None)
+            if finished is not None:
+                stop.set()
+                await asyncio.gather(*tasks, return_exceptions=True)
+                error = finished.exception() or f"HTTP {statuses.get(tasks.index(finished))}"
+                raise CommandError(f"An event stream ended before the swarm connected: {error}")
+            await asyncio.sleep(0.05)
+        # Let the streams send their snapshots before timing anything
+        await asyncio.sleep(1)
+        connected = time.perf_counter() - started
+
+        loop = asyncio.get_running_loop()
+        for seq in range(count):
+            published[seq] = time.perf_counter()
+            # Publish from a worker thread, as submit_score would
+            await loop.run_in_executor(None, events.publish, 'leaderboard:all', {'window': 'all', 'seq': seq})
+            await asyncio.sleep(interval)
+        await asyncio.sleep(1)
+
+        stop.set()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+        latencies = []
+        completions = []
+        delivered = 0
+        for seq, times in received.items():
+            delivered += len(times)
+            if times:
+                latencies.extend(t - published[seq] for t in times)
+                completions.append(max(times) - published[seq])
+        rss_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+        if not latencies:
+            self.stderr.write("No events were delivered")
+            return
+        latencies.sort()
+        self.stdout.write(self.style.SUCCESS(
+            f"{clients} streams connected in {connected:.1f}s; delivered {delivered}/{clients * count} events. "
+            f"Latency p50 {statistics.median(latencies) * 1000:.1f}ms, "
+            f"p99 {latencies[int(len(latencies) * 0.99) - 1] * 1000:.1f}ms, "
+            f"full fan-out {max(completions) * 1000:.1f}ms worst; peak RSS {rss_mb:.0f} MB"
+        ))
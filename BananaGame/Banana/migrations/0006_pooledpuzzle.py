@@ -0,0 +1,21 @@
+# Generated by Django 5.2.18 on 2026-10-16 20:50
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Banana', '0005_contact_review_rating'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PooledPuzzle',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('data', models.JSONField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+    ]
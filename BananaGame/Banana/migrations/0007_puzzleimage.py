@@ -0,0 +1,26 @@
+# Generated by Django 5.2.18 on 2026-10-16 20:53
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Banana', '0006_pooledpuzzle'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PuzzleImage',
+            fields=[
+                ('digest', models.CharField(max_length=64, primary_key=True, serialize=False)),
+                ('source_url', models.CharField(blank=True, db_index=True, max_length=500)),
+                ('content_type', models.CharField(default='image/png', max_length=50)),
+                ('size', models.IntegerField()),
+                ('hits', models.IntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('last_accessed', models.DateTimeField(db_index=True, default=django.utils.timezone.now)),
+            ],
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.18 on 2026-10-16 20:54
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Banana', '0007_puzzleimage'),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name='player',
+            name='current_puzzle',
+        ),
+    ]
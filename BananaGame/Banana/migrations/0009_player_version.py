@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-16 20:55
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Banana', '0008_remove_player_current_puzzle'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='player',
+            name='version',
+            field=models.IntegerField(default=0),
+        ),
+    ]
@@ -0,0 +1,24 @@
+from django.db import migrations
+from django.db.models import Max
+
+
+def populate(apps, schema_editor):
+    Score = apps.get_model('Banana', 'Score')
+    LeaderboardEntry = apps.get_model('Banana', 'LeaderboardEntry')
+    alias = schema_editor.connection.alias
+    best_scores = Score.objects.using(alias).values('user_id').annotate(best_score=Max('score')).order_by()
+    LeaderboardEntry.objects.using(alias).bulk_create(
+        [LeaderboardEntry(user_id=row['user_id'], best_score=row['best_score']) for row in best_scores.iterator()],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Banana', '0010_leaderboardentry'),
+    ]
+
+    operations = [
+        migrations.RunPython(populate, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 5.2.18 on 2026-10-16 21:02
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Banana', '0011_populate_leaderboardentry'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='WindowedLeaderboardEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('window', models.CharField(choices=[('day', 'Day'), ('week', 'Week')], max_length=4)),
+                ('bucket', models.DateField(help_text='First day of the day or week')),
+                ('best_score', models.IntegerField()),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='windowed_leaderboard_entries', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['window', 'bucket', '-best_score', 'user'], name='leaderboard_window_rank_idx')],
+                'constraints': [models.UniqueConstraint(fields=('window', 'bucket', 'user'), name='unique_leaderboard_window_user')],
+            },
+        ),
+    ]
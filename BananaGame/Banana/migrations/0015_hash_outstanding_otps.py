@@ -0,0 +1,28 @@
+import hashlib
+import hmac
+
+from django.conf import settings
+from django.db import migrations
+from django.utils import timezone
+
+
+def hash_codes(apps, schema_editor):
+    """Hash the codes still waiting to be used; expired and used ones can never match again"""
+    OTP = apps.get_model('Banana', 'OTP')
+    key = settings.SECRET_KEY.encode()
+    outstanding = OTP.objects.using(schema_editor.connection.alias).filter(is_used=False, expires_at__gt=timezone.now())
+    for otp in outstanding.iterator():
+        message = f"{otp.user_id}:{otp.otp_type}:{otp.otp_code}".encode()
+        otp.otp_code = hmac.new(key, message, hashlib.sha256).hexdigest()
+        otp.save(update_fields=['otp_code'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Banana', '0014_otp_hashed_codes_and_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(hash_codes, migrations.RunPython.noop),
+    ]
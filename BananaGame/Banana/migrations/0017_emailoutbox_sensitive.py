@@ -0,0 +1,33 @@
+# Generated by Django 5.2.18 on 2026-10-16 23:18
+
+from django.db import migrations, models
+
+# The subject send_otp_email has always used
+OTP_SUBJECT = 'Your Banana Game Login OTP'
+
+
+def redact_queued_mail(apps, schema_editor):
+    """Drop delivered OTP mail and the bodies of other sent mail; flag OTP mail still queued"""
+    EmailOutbox = apps.get_model('Banana', 'EmailOutbox')
+    mail = EmailOutbox.objects.using(schema_editor.connection.alias)
+    otp_mail = mail.filter(subject=OTP_SUBJECT)
+    otp_mail.filter(status='sent').delete()
+    otp_mail.filter(status='failed').update(body='', sensitive=True)
+    otp_mail.update(sensitive=True)
+    mail.filter(status='sent').update(body='')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Banana', '0016_sessionrevocation'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='emailoutbox',
+            name='sensitive',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.RunPython(redact_queued_mail, migrations.RunPython.noop),
+    ]
@@ -1,8 +1,11 @@
+from django.conf import settings
 from django.db import models
 from django.contrib.auth.models import User
 from django.utils import timezone
 from datetime import timedelta
-import random
+import hashlib
+import hmac
+import secrets
 
 class Player(models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE)
@@ -12,7 +15,6 @@ class Player(models.Model):
     super_bananas = models.IntegerField(default=0)
     achievements = models.JSONField(default=list)  # list of unlocked achievement ids
     high_score = models.IntegerField(default=0)
-    current_puzzle = models.JSONField(default=dict, blank=True)
     # New game mechanics
     xp = models.IntegerField(default=0)  # Experience points
     level = models.IntegerField(default=1)  # Player level
@@ -24,6 +26,24 @@ class Player(models.Model):
     last_daily_challenge = models.DateField(null=True, blank=True)  # Last daily challenge date
     daily_challenge_streak = models.IntegerField(default=0)  # Consecutive daily challenges
     puzzle_history = models.JSONField(default=list)  # Track solved puzzle IDs
+    version = models.IntegerField(default=0)  # Bumped on every progress update (optimistic locking)
+
+class PooledPuzzle(models.Model):
+    """Pre-fetched puzzle waiting to be handed out by fetch_puzzle"""
+    data = models.JSONField()  # {question, solution} as returned by the Banana API
+    created_at = models.DateTimeField(auto_now_add=True)
+
+
+class PuzzleImage(models.Model):
+    """Puzzle image held in the content-addressed image store"""
+    digest = models.CharField(max_length=64, primary_key=True)  # SHA-256 of the image bytes
+    source_url = models.CharField(max_length=500, blank=True, db_index=True)
+    content_type = models.CharField(max_length=50, default='image/png')
+    size = models.IntegerField()
+    hits = models.IntegerField(default=0)  # Lookups answered without downloading again
+    created_at = models.DateTimeField(auto_now_add=True)
+    last_accessed = models.DateTimeField(default=timezone.now, db_index=True)
+
 
 class Score(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE)
@@ -31,6 +51,62 @@ class Score(models.Model):
     date = models.DateTimeField(auto_now_add=True)
 
 
+class LeaderboardEntry(models.Model):
+    """Best score per user, kept up to date by submit_score"""
+    user = models.OneToOneField(User, on_delete=models.CASCADE, primary_key=True, related_name='leaderboard_entry')
+    best_score = models.IntegerField()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['-best_score', 'user'], name='leaderboard_rank_idx'),
+        ]
+
+
+class WindowedLeaderboardEntry(models.Model):
+    """Best score per user within one day or week, kept up to date by submit_score"""
+    DAY = 'day'
+    WEEK = 'week'
+
+    WINDOW_CHOICES = (
+        (DAY, 'Day'),
+        (WEEK, 'Week'),
+    )
+
+    window = models.CharField(max_length=4, choices=WINDOW_CHOICES)
+    bucket = models.DateField(help_text="First day of the day or week")
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='windowed_leaderboard_entries')
+    best_score = models.IntegerField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['window', 'bucket', 'user'], name='unique_leaderboard_window_user'),
+        ]
+        indexes = [
+            models.Index(fields=['window', 'bucket', '-best_score', 'user'], name='leaderboard_window_rank_idx'),
+        ]
+
+
+class OTPQuerySet(models.QuerySet):
+    def active(self, user, otp_type):
+        """Unused, unexpired codes of one type for a user (served by otp_active_idx)"""
+        return self.filter(user=user, otp_type=otp_type, is_used=False, expires_at__gt=timezone.now())
+
+    def purge_expired(self, before=None, chunk_size=10000):
+        """
+        Delete codes that expired before `before` (default now), used or not,
+        chunk_size rows per DELETE so no single statement holds long locks.
+        Returns the number deleted.
+        """
+        before = before or timezone.now()
+        deleted = 0
+        while True:
+            ids = list(self.filter(expires_at__lt=before).order_by().values_list('pk', flat=True)[:chunk_size])
+            if not ids:
+                return deleted
+            count, _ = self.filter(pk__in=ids).delete()
+            deleted += count
+
+
 class OTP(models.Model):
     EMAIL = 'email'
 
@@ -39,60 +115,76 @@ class OTP(models.Model):
     )
 
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='otps')
-    otp_code = models.CharField(max_length=6)
+    otp_code = models.CharField(max_length=64)  # HMAC-SHA256 of the code, never the code itself
     otp_type = models.CharField(max_length=20, choices=OTP_TYPE_CHOICES)
     contact_info = models.CharField(max_length=255)
     created_at = models.DateTimeField(auto_now_add=True)
-    expires_at = models.DateTimeField()
+    expires_at = models.DateTimeField(db_index=True)  # Range-scanned by purge_expired
     is_used = models.BooleanField(default=False)
 
+    objects = OTPQuerySet.as_manager()
+
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            # Partial: only unused codes are indexed, so it stays as small as
+            # the set of outstanding codes however much history the table holds
+            models.Index(
+                fields=['user', 'otp_type', 'expires_at'],
+                name='otp_active_idx',
+                condition=models.Q(is_used=False),
+            ),
+        ]
 
     @classmethod
     def _generate_code(cls):
-        return f"{random.randint(100000, 999999)}"
+        return f"{secrets.randbelow(900000) + 100000}"
+
+    @classmethod
+    def hash_code(cls, user_id, otp_type, otp_code):
+        message = f"{user_id}:{otp_type}:{otp_code}".encode()
+        return hmac.new(settings.SECRET_KEY.encode(), message, hashlib.sha256).hexdigest()
 
     @classmethod
     def generate_otp(cls, user, otp_type, contact_info, validity_minutes=10):
-        cls.objects.filter(
-            user=user,
-            otp_type=otp_type,
-            is_used=False,
-            expires_at__gt=timezone.now()
-        ).update(is_used=True)
+        """Replace the user's outstanding codes with a new one. Returns (otp, code)."""
+        cls.objects.active(user, otp_type).update(is_used=True)
 
         otp_code = cls._generate_code()
         expires_at = timezone.now() + timedelta(minutes=validity_minutes)
 
-        return cls.objects.create(
+        otp = cls.objects.create(
             user=user,
-            otp_code=otp_code,
+            otp_code=cls.hash_code(user.pk, otp_type, otp_code),
             otp_type=otp_type,
             contact_info=contact_info,
             expires_at=expires_at
         )
+        return otp, otp_code
 
     @classmethod
     def verify_otp(cls, user, otp_code, otp_type):
-        otp = cls.objects.filter(
-            user=user,
-            otp_type=otp_type,
-            is_used=False,
-            expires_at__gt=timezone.now()
-        ).first()
+        # Codes share one validity period, so the latest expiry is the latest code
+        otp = cls.objects.active(user, otp_type).order_by('-expires_at').first()
 
         if not otp:
             return False, "OTP has expired or does not exist."
 
-        if otp.otp_code != otp_code:
+        if not hmac.compare_digest(otp.otp_code, cls.hash_code(user.pk, otp_type, otp_code)):
             return False, "Invalid OTP provided."
 
-        otp.is_used = True
-        otp.save(update_fields=['is_used'])
+        # Conditional, so two requests racing with the same code cannot both log in
+        if not cls.objects.filter(pk=otp.pk, is_used=False).update(is_used=True):
+            return False, "OTP has expired or does not exist."
         return True, "OTP verified successfully."
 
 
+class SessionRevocation(models.Model):
+    """Tokens issued to the user before revoked_before are no longer accepted (set by logout-all)"""
+    user = models.OneToOneField(User, on_delete=models.CASCADE, primary_key=True, related_name='session_revocation')
+    revoked_before = models.DateTimeField()
+
+
 class Contact(models.Model):
     """Contact form submissions"""
     name = models.CharField(max_length=100)
@@ -150,4 +242,50 @@ class Review(models.Model):
         verbose_name_plural = "Reviews"
     
     def __str__(self):
-        return f"{self.user.username} - {self.title}"
\ No newline at end of file
+        return f"{self.user.username} - {self.title}"
+
+class EmailOutbox(models.Model):
+    """Outgoing email waiting for the outbox sender (see Banana.outbox)"""
+    HIGH = 0
+    LOW = 10
+
+    PRIORITY_CHOICES = (
+        (HIGH, 'High'),
+        (LOW, 'Low'),
+    )
+
+    PENDING = 'pending'
+    SENDING = 'sending'
+    SENT = 'sent'
+    FAILED = 'failed'
+
+    STATUS_CHOICES = (
+        (PENDING, 'Pending'),
+        (SENDING, 'Sending'),
+        (SENT, 'Sent'),
+        (FAILED, 'Failed'),
+    )
+
+    priority = models.SmallIntegerField(choices=PRIORITY_CHOICES, default=LOW)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=PENDING)
+    subject = models.CharField(max_length=255)
+    body = models.TextField()
+    from_email = models.CharField(max_length=255)
+    recipients = models.JSONField(default=list)
+    attempts = models.IntegerField(default=0)
+    # When a pending message is due, or when a claimed one may be taken over
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    claim = models.CharField(max_length=32, blank=True)  # Token of the sender holding the message
+    last_error = models.TextField(blank=True)
+    # The body holds a secret (an OTP code): deleted once sent, never shown in the admin
+    sensitive = models.BooleanField(default=False)
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'priority', 'next_attempt_at'], name='email_outbox_queue_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.subject} -> {', '.join(self.recipients)} ({self.status})"
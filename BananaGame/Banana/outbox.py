@@ -0,0 +1,223 @@
+"""
+Transactional email outbox.
+
+The send_*_email helpers call enqueue(), which stores the message as an
+EmailOutbox row and wakes the sender, so a slow SMTP server no longer holds
+up the request. The sender claims due messages in batches, highest priority
+first (OTP codes are HIGH, thank-you mail LOW), and sends them over a single
+SMTP connection that stays open while there is mail to send. A message that
+fails is retried with exponential backoff, up to EMAIL_OUTBOX_MAX_ATTEMPTS
+attempts.
+
+With EMAIL_OUTBOX_SENDER_THREAD each server process runs a sender thread;
+otherwise run `manage.py send_outbox`. Messages are claimed with a
+conditional UPDATE, so any number of senders can share the table, and a
+message claimed by a sender that died is picked up again after
+EMAIL_OUTBOX_LEASE seconds.
+
+Bodies are only kept until delivery. Sent messages keep their subject and
+recipients for EMAIL_OUTBOX_RETENTION_DAYS but not their body, and
+messages queued as sensitive (OTP codes) are deleted as soon as they are
+sent, so the table never holds a code that has already been delivered.
+"""
+import logging
+import random
+import secrets
+import smtplib
+import threading
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.db import connection as db_connection, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import EmailOutbox
+
+logger = logging.getLogger(__name__)
+
+HIGH = EmailOutbox.HIGH
+LOW = EmailOutbox.LOW
+DUE = (EmailOutbox.PENDING, EmailOutbox.SENDING)
+PURGE_INTERVAL = 60 * 60
+
+_lock = threading.Lock()
+_wakeup = threading.Event()
+_sender = None
+
+
+def sender_thread_enabled():
+    return getattr(settings, 'EMAIL_OUTBOX_SENDER_THREAD', True)
+
+
+def batch_size():
+    return getattr(settings, 'EMAIL_OUTBOX_BATCH_SIZE', 20)
+
+
+def max_attempts():
+    return getattr(settings, 'EMAIL_OUTBOX_MAX_ATTEMPTS', 5)
+
+
+def backoff(attempts):
+    """Seconds to wait before retrying a message that has failed `attempts` times"""
+    base = getattr(settings, 'EMAIL_OUTBOX_BACKOFF', 30)
+    cap = getattr(settings, 'EMAIL_OUTBOX_BACKOFF_MAX', 60 * 60)
+    return min(base * 2 ** (attempts - 1), cap) * random.uniform(0.5, 1.0)
+
+
+def lease():
+    return getattr(settings, 'EMAIL_OUTBOX_LEASE', 5 * 60)
+
+
+def poll_interval():
+    return getattr(settings, 'EMAIL_OUTBOX_POLL_INTERVAL', 5.0)
+
+
+def retention():
+    return timedelta(days=getattr(settings, 'EMAIL_OUTBOX_RETENTION_DAYS', 7))
+
+
+def enqueue(subject, body, recipients, priority=LOW, from_email=None, sensitive=False):
+    """
+    Queue an email and wake the sender once the surrounding transaction
+    commits. Pass sensitive=True when the body holds a secret.
+    """
+    message = EmailOutbox.objects.create(
+        subject=subject,
+        body=body,
+        recipients=list(recipients),
+        priority=priority,
+        sensitive=sensitive,
+        from_email=from_email or getattr(settings, 'DEFAULT_FROM_EMAIL', getattr(settings, 'EMAIL_HOST_USER', '')),
+    )
+    transaction.on_commit(wake)
+    return message
+
+
+def claim(limit):
+    """Take up to `limit` due messages, highest priority first, for this sender"""
+    now = timezone.now()
+    ids = list(
+        EmailOutbox.objects.filter(status__in=DUE, next_attempt_at__lte=now)
+        .order_by('priority', 'next_attempt_at', 'id')
+        .values_list('id', flat=True)[:limit]
+    )
+    if not ids:
+        return []
+    token = secrets.token_hex(16)
+    # Another sender may have claimed some of these since; only rows still due are taken
+    EmailOutbox.objects.filter(id__in=ids, status__in=DUE, next_attempt_at__lte=now).update(
+        status=EmailOutbox.SENDING, claim=token, next_attempt_at=now + timedelta(seconds=lease()),
+    )
+    return list(EmailOutbox.objects.filter(id__in=ids, claim=token).order_by('priority', 'next_attempt_at', 'id'))
+
+
+def _send(messages, connection):
+    """Send claimed messages over an open connection and record the outcomes. Returns (sent, failed)."""
+    sent_ids = []
+    failed = 0
+    for message in messages:
+        email = EmailMessage(
+            message.subject, message.body, message.from_email, message.recipients, connection=connection
+        )
+        try:
+            # A no-op while the connection is open
+            connection.open()
+            connection.send_messages([email])
+        except OSError as exc:  # smtplib.SMTPException included
+            failed += 1
+            _record_failure(message, exc)
+            if isinstance(exc, smtplib.SMTPServerDisconnected) or not isinstance(exc, smtplib.SMTPException):
+                # Reconnect for the next message rather than reuse a dead socket
+                connection.close()
+        else:
+            sent_ids.append(message.id)
+    if sent_ids:
+        sent = EmailOutbox.objects.filter(id__in=sent_ids)
+        sent.filter(sensitive=True).delete()
+        sent.update(
+            status=EmailOutbox.SENT, sent_at=timezone.now(), claim='', attempts=F('attempts') + 1, last_error='',
+            body='',
+        )
+    return len(sent_ids), failed
+
+
+def _record_failure(message, exc):
+    attempts = message.attempts + 1
+    extra = {}
+    if attempts >= max_attempts():
+        logger.error("Giving up on email %s after %s attempts: %s", message.id, attempts, exc)
+        status, next_attempt_at = EmailOutbox.FAILED, timezone.now()
+        if message.sensitive:
+            extra['body'] = ''
+    else:
+        logger.warning("Email %s failed (attempt %s), retrying: %s", message.id, attempts, exc)
+        status = EmailOutbox.PENDING
+        next_attempt_at = timezone.now() + timedelta(seconds=backoff(attempts))
+    EmailOutbox.objects.filter(id=message.id).update(
+        status=status, attempts=attempts, next_attempt_at=next_attempt_at, claim='', last_error=str(exc), **extra,
+    )
+
+
+def drain(connection=None):
+    """
+    Send every due message, a batch at a time, over one SMTP connection that
+    is opened on the first message and closed once the queue is empty.
+    Returns (sent, failed).
+    """
+    connection = connection or get_connection(fail_silently=False)
+    sent = failed = 0
+    try:
+        while True:
+            messages = claim(batch_size())
+            if not messages:
+                break
+            batch_sent, batch_failed = _send(messages, connection)
+            sent += batch_sent
+            failed += batch_failed
+    finally:
+        connection.close()
+    return sent, failed
+
+
+def purge(older_than=None):
+    """Delete sent messages older than `older_than` (default EMAIL_OUTBOX_RETENTION_DAYS)"""
+    cutoff = timezone.now() - (retention() if older_than is None else older_than)
+    deleted, _ = EmailOutbox.objects.filter(status=EmailOutbox.SENT, sent_at__lt=cutoff).delete()
+    return deleted
+
+
+def run(stop=None):
+    """Sender loop: drain whenever woken, or every EMAIL_OUTBOX_POLL_INTERVAL seconds"""
+    last_purge = 0.0
+    while stop is None or not stop.is_set():
+        _wakeup.wait(poll_interval())
+        _wakeup.clear()
+        try:
+            drain()
+            if time.monotonic() - last_purge > PURGE_INTERVAL:
+                purge()
+                last_purge = time.monotonic()
+        except Exception as exc:
+            logger.error("Email outbox sender failed: %s", exc)
+        finally:
+            db_connection.close()
+
+
+def wake():
+    """Start this process's sender thread if enabled and have it drain now"""
+    if sender_thread_enabled():
+        _ensure_sender()
+    _wakeup.set()
+
+
+def _ensure_sender():
+    global _sender
+    if _sender is not None:
+        return
+    with _lock:
+        if _sender is None:
+            _sender = threading.Thread(target=run, name='email-outbox-sender', daemon=True)
+            _sender.start()
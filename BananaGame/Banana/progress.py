@@ -0,0 +1,179 @@
+"""
+Progress updates for answered puzzles.
+
+Each answer, or each batch of answers, becomes a single UPDATE of only the
+columns it changes. Counters are bumped with F() expressions; combo, level
+and history depend on the current row, so the UPDATE is guarded by the
+optimistic Player.version column and recomputed from a fresh read if another
+request got there first. The first attempt starts from the cached player
+snapshot when there is one (see Banana.snapshots); the version guard catches
+it too if it is stale. With PLAYER_WRITE_BEHIND enabled the same changes go
+to the write-behind buffer. Results are also pushed to the player's event
+stream when they have one open.
+"""
+import random
+
+from django.db import transaction
+from django.db.models import F
+
+from .models import Player
+from . import events, scoring, snapshots, write_behind
+
+HISTORY_LENGTH = 50
+MAX_ATTEMPTS = 10
+
+STATE_FIELDS = [
+    'id', 'version', 'difficulty', 'xp', 'level', 'combo_count', 'max_combo', 'puzzle_history',
+    # _play adds to these, so loading them avoids a deferred-field query each
+    'puzzles_solved', 'perfect_solves',
+]
+
+
+class ConcurrentUpdateError(Exception):
+    """Raised when the optimistic update keeps losing to concurrent writers"""
+
+
+def _solve(player, time_taken, hints_used, lucky, puzzle_id):
+    """Work out what a correct answer does to `player`. Returns (result, deltas, values)."""
+    perfect = hints_used == 0
+    breakdown = scoring.score(player.difficulty, time_taken, player.combo_count, hints_used, lucky)
+    total_points = breakdown.pop('total_points')
+    xp_gained = breakdown.pop('xp')
+    new_level = scoring.level_for_xp(player.xp + xp_gained)
+    combo = player.combo_count + 1
+
+    deltas = {'xp': xp_gained, 'puzzles_solved': 1}
+    if perfect:
+        deltas['perfect_solves'] = 1
+    values = {'level': new_level, 'combo_count': combo}
+    if combo > player.max_combo:
+        values['max_combo'] = combo
+    if puzzle_id and puzzle_id not in player.puzzle_history:
+        values['puzzle_history'] = (player.puzzle_history + [puzzle_id])[-HISTORY_LENGTH:]
+
+    leveled_up = new_level > player.level
+    result = {
+        "correct": True,
+        "points": total_points,
+        "xp_gained": xp_gained,
+        "combo": combo,
+        "leveled_up": leveled_up,
+        "new_level": new_level if leveled_up else None,
+        "perfect_solve": perfect,
+        "lucky_streak": lucky,
+        "breakdown": breakdown,
+    }
+    return result, deltas, values
+
+
+def _play(player, answers, luck):
+    """
+    Fold an ordered list of answers into `player`, carrying the combo from one
+    answer to the next. Returns (results, deltas, values) for the whole list.
+    """
+    results = []
+    deltas = {}
+    values = {}
+    for answer, lucky in zip(answers, luck):
+        if not answer['correct']:
+            player.combo_count = 0
+            values['combo_count'] = 0
+            results.append({"correct": False, "correct_answer": answer.get('solution', '')})
+            continue
+        result, solve_deltas, solve_values = _solve(
+            player, answer.get('time_taken', 0), answer.get('hints_used', 0), lucky, answer.get('puzzle_id', '')
+        )
+        for field, delta in solve_deltas.items():
+            deltas[field] = deltas.get(field, 0) + delta
+            setattr(player, field, getattr(player, field) + delta)
+        for field, value in solve_values.items():
+            values[field] = value
+            setattr(player, field, value)
+        results.append(result)
+    return results, deltas, values
+
+
+def _publish(user_id, results):
+    """Push the results to the player's own event stream, if they have one open"""
+    topic = f'progress:{user_id}'
+    if events.has_subscribers(topic):
+        events.publish(topic, {'results': results})
+
+
+def record_answers(user, answers):
+    """
+    Apply an ordered list of answers as one progress update and return one
+    result payload per answer. Each answer is a dict with `correct` plus
+    time_taken, hints_used and puzzle_id (correct answers) or solution
+    (wrong ones).
+    """
+    luck = [random.random() < scoring.LUCKY_CHANCE for _ in answers]
+
+    if write_behind.enabled():
+        with write_behind.player_lock(user.pk):
+            player, _ = Player.objects.get_or_create(user=user)
+            write_behind.merge(player)
+            results, deltas, values = _play(player, answers, luck)
+            # level is derived from xp when the buffer is flushed
+            values.pop('level', None)
+            write_behind.record(player.pk, deltas, values)
+        _publish(user.pk, results)
+        return results
+
+    player = snapshots.get_player(user.pk, STATE_FIELDS)
+    for _ in range(MAX_ATTEMPTS):
+        if player is None:
+            player = Player.objects.only(*STATE_FIELDS).filter(user=user).first()
+        if player is None:
+            player, _ = Player.objects.get_or_create(user=user)
+        version = player.version
+        results, deltas, values = _play(player, answers, luck)
+
+        updates = {field: F(field) + delta for field, delta in deltas.items()}
+        updates.update(values)
+        updates['version'] = F('version') + 1
+        with transaction.atomic():
+            updated = Player.objects.filter(pk=player.pk, version=version).update(**updates)
+        if updated:
+            player.version = version + 1
+            snapshots.store_player(user.pk, player, STATE_FIELDS)
+            _publish(user.pk, results)
+            return results
+        player = None
+    snapshots.forget_player(user.pk)
+    raise ConcurrentUpdateError("Too many concurrent updates to player progress")
+
+
+def record_correct(user, time_taken=0, hints_used=0, puzzle_id=''):
+    """Apply a correct answer and return the result payload for check_puzzle_answer"""
+    answer = {'correct': True, 'time_taken': time_taken, 'hints_used': hints_used, 'puzzle_id': puzzle_id}
+    return record_answers(user, [answer])[0]
+
+
+def record_wrong(user):
+    """Break the combo. Bumping the version makes any in-flight solve recompute its combo."""
+    if write_behind.enabled():
+        with write_behind.player_lock(user.pk):
+            player, _ = Player.objects.get_or_create(user=user)
+            write_behind.record(player.pk, values={'combo_count': 0})
+        return
+
+    updated = Player.objects.filter(user=user).update(combo_count=0, version=F('version') + 1)
+    if not updated:
+        Player.objects.get_or_create(user=user)
+    # Keep the snapshot in step; if it was already stale the next solve's version check catches it
+    player = snapshots.get_player(user.pk, STATE_FIELDS)
+    if player is not None:
+        player.combo_count = 0
+        player.version += 1
+        snapshots.store_player(user.pk, player, STATE_FIELDS)
+
+
+def consume_hint(user):
+    """Spend one hint atomically. Returns the hints left, or None if there were none."""
+    # The UPDATE's row lock is held until commit, so the read sees this spend and no later one
+    with transaction.atomic():
+        updated = Player.objects.filter(user=user, hints__gt=0).update(hints=F('hints') - 1)
+        if not updated:
+            return None
+        return Player.objects.filter(user=user).values_list('hints', flat=True).first()
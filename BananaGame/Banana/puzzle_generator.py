@@ -0,0 +1,129 @@
+"""
+Offline banana-equation puzzle generator.
+
+Renders equations such as "3 + [banana] = 8" with Pillow and returns the same
+{question, solution} shape as the Banana API, with the image inlined as a PNG
+data URI. Batches can be spread over a process pool to fill a cold puzzle
+pool quickly.
+"""
+import base64
+import io
+import os
+import random
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+
+from PIL import Image, ImageDraw, ImageFont
+
+WIDTH, HEIGHT = 480, 140
+BACKGROUND = (255, 251, 235)
+INK = (120, 53, 15)
+BANANA = (252, 211, 77)
+BANANA_SIZE = 70
+GAP = 16
+
+_font = None
+
+
+def _get_font():
+    global _font
+    if _font is None:
+        try:
+            _font = ImageFont.load_default(size=56)
+        except TypeError:
+            # Pillow without FreeType only ships the small bitmap font
+            _font = ImageFont.load_default()
+    return _font
+
+
+def _make_equation(rng):
+    """Return (tokens, solution) where exactly one operand token is None (the banana)"""
+    op = rng.choice(['+', '-', 'x'])
+    solution = rng.randint(1, 9)
+    other = rng.randint(1, 9)
+    if op == '+':
+        a, b = (solution, other) if rng.random() < 0.5 else (other, solution)
+        result = a + b
+    elif op == '-':
+        a, b = solution + other, solution
+        if rng.random() < 0.5:
+            a, b = solution, rng.randint(0, solution - 1)
+        result = a - b
+    else:
+        a, b = (solution, other) if rng.random() < 0.5 else (other, solution)
+        result = a * b
+    hidden = 0 if a == solution else 1
+    tokens = [a, op, b, '=', result]
+    tokens[hidden * 2] = None
+    return tokens, solution
+
+
+@lru_cache(maxsize=None)
+def _glyph(token):
+    """Rendered mask for one token. Cached, so a puzzle is mostly pastes plus PNG encoding."""
+    if token is None:
+        # Crescent: a full disc with an offset disc cut out of its upper part
+        mask = Image.new('L', (BANANA_SIZE, BANANA_SIZE), 0)
+        draw = ImageDraw.Draw(mask)
+        draw.ellipse([0, 0, BANANA_SIZE - 1, BANANA_SIZE - 1], fill=255)
+        draw.ellipse([-4, -BANANA_SIZE * 0.3, BANANA_SIZE + 3, BANANA_SIZE * 0.7], fill=0)
+        return mask.crop(mask.getbbox())
+    font = _get_font()
+    left, top, right, bottom = font.getbbox(str(token))
+    mask = Image.new('L', (right - left, bottom - top), 0)
+    ImageDraw.Draw(mask).text((-left, -top), str(token), fill=255, font=font)
+    return mask
+
+
+@lru_cache(maxsize=1024)
+def render_png(tokens):
+    """
+    Render a tuple of equation tokens to PNG bytes, drawing a banana where a
+    token is None. There are only a few hundred distinct equations, so after
+    warm-up almost every puzzle is served from this cache.
+    """
+    image = Image.new('RGB', (WIDTH, HEIGHT), BACKGROUND)
+    glyphs = [_glyph(token) for token in tokens]
+    x = (WIDTH - sum(glyph.width for glyph in glyphs) - GAP * (len(glyphs) - 1)) // 2
+    for token, glyph in zip(tokens, glyphs):
+        y = (HEIGHT - glyph.height) // 2
+        image.paste(BANANA if token is None else INK, (x, y, x + glyph.width, y + glyph.height), glyph)
+        x += glyph.width + GAP
+    buffer = io.BytesIO()
+    image.save(buffer, format='PNG', compress_level=1)
+    return buffer.getvalue()
+
+
+def generate_puzzle(rng=None):
+    """Generate one puzzle as {'question': <PNG data URI>, 'solution': int}"""
+    rng = rng or random
+    tokens, solution = _make_equation(rng)
+    png = render_png(tuple(tokens))
+    return {
+        'question': 'data:image/png;base64,' + base64.b64encode(png).decode('ascii'),
+        'solution': solution,
+    }
+
+
+def _generate_chunk(args):
+    count, seed = args
+    rng = random.Random(seed)
+    return [generate_puzzle(rng) for _ in range(count)]
+
+
+def generate_batch(count, workers=None, chunk_size=250):
+    """Generate `count` puzzles, spread across a process pool when workers > 1"""
+    workers = workers or os.cpu_count() or 1
+    chunks = []
+    remaining = count
+    while remaining > 0:
+        size = min(chunk_size, remaining)
+        chunks.append((size, random.getrandbits(64)))
+        remaining -= size
+    if workers <= 1 or len(chunks) <= 1:
+        return [puzzle for chunk in chunks for puzzle in _generate_chunk(chunk)]
+    puzzles = []
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        for chunk in executor.map(_generate_chunk, chunks):
+            puzzles.extend(chunk)
+    return puzzles
@@ -0,0 +1,127 @@
+"""
+Local pool of pre-fetched puzzles.
+
+fetch_puzzle pops from the PooledPuzzle table instead of calling the Banana
+API inside the request. A background thread refills the pool up to the high
+watermark whenever it drops below the low watermark. Puzzles come from the
+Banana API, or from the local generator when PUZZLE_SOURCE is 'local' or the
+API is unavailable.
+"""
+import logging
+import threading
+
+import requests
+from django.conf import settings
+from django.db import connection
+
+from .models import PooledPuzzle
+from .upstream import get_client
+from . import image_store, puzzle_generator
+
+logger = logging.getLogger(__name__)
+
+_refill_lock = threading.Lock()
+_refill_thread = None
+
+
+def low_watermark():
+    return getattr(settings, 'PUZZLE_POOL_LOW_WATERMARK', 20)
+
+
+def high_watermark():
+    return getattr(settings, 'PUZZLE_POOL_HIGH_WATERMARK', 100)
+
+
+def fetch_from_upstream():
+    """Fetch a single puzzle from the Banana API, raising on failure"""
+    return get_client().fetch_puzzle()
+
+
+def _fetch_raw_puzzle():
+    if getattr(settings, 'PUZZLE_SOURCE', 'upstream') == 'local':
+        return puzzle_generator.generate_puzzle()
+    try:
+        return fetch_from_upstream()
+    except requests.RequestException as exc:
+        if not getattr(settings, 'PUZZLE_LOCAL_FALLBACK', True):
+            raise
+        logger.warning("Banana API unavailable (%s), generating puzzle locally", exc)
+        return puzzle_generator.generate_puzzle()
+
+
+def fetch_new_puzzle():
+    """Produce one fresh puzzle from the configured source, with its image in the local store"""
+    return image_store.localize(_fetch_raw_puzzle())
+
+
+def pop_puzzle():
+    """
+    Take the oldest puzzle out of the pool, or return None if it is empty.
+    Claiming is a primary-key lookup plus a delete, so it stays O(1) however
+    many workers are popping at once; a lost race simply retries.
+    """
+    try:
+        for _ in range(5):
+            row = PooledPuzzle.objects.order_by('pk').values_list('pk', 'data').first()
+            if row is None:
+                return None
+            pk, data = row
+            deleted, _ = PooledPuzzle.objects.filter(pk=pk).delete()
+            if deleted:
+                return data
+        return None
+    finally:
+        ensure_refill()
+
+
+def get_puzzle():
+    """Return a puzzle from the pool, falling back to fetching one in the request"""
+    data = pop_puzzle()
+    if data is None:
+        logger.warning("Puzzle pool is empty, fetching a puzzle in the request")
+        data = fetch_new_puzzle()
+    return data
+
+
+def refill(target=None, batch_size=10):
+    """Fetch puzzles until the pool holds `target` rows. Returns the number added."""
+    target = high_watermark() if target is None else target
+    added = 0
+    missing = target - PooledPuzzle.objects.count()
+    while missing > 0:
+        batch = []
+        for _ in range(min(batch_size, missing)):
+            try:
+                batch.append(PooledPuzzle(data=fetch_new_puzzle()))
+            except Exception as exc:
+                logger.error("Failed to fetch puzzle for pool: %s", exc)
+                break
+        if not batch:
+            break
+        PooledPuzzle.objects.bulk_create(batch)
+        added += len(batch)
+        missing -= len(batch)
+    return added
+
+
+def _refill_worker():
+    try:
+        added = refill()
+        logger.info("Puzzle pool refilled with %s puzzles", added)
+    except Exception as exc:
+        logger.error("Puzzle pool refill failed: %s", exc)
+    finally:
+        connection.close()
+
+
+def ensure_refill():
+    """Start the background refill thread if the pool is below the low watermark"""
+    global _refill_thread
+    if PooledPuzzle.objects.count() >= low_watermark():
+        return False
+    with _refill_lock:
+        if _refill_thread is not None and _refill_thread.is_alive():
+            return False
+        _refill_thread = threading.Thread(target=_refill_worker, name='puzzle-pool-refill', daemon=True)
+        _refill_thread.start()
+    return True
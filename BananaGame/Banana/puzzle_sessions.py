@@ -0,0 +1,85 @@
+"""
+Store for the puzzles each player is currently solving.
+
+Active puzzles are short-lived, so they live in a Django cache (the
+PUZZLE_SESSION_CACHE alias) keyed by user id with a per-entry TTL, rather than
+in the Player row. Gameplay actions therefore no longer rewrite Player just
+to swap the current puzzle. Any cache backend works: locmem for a single
+process, the file backend for several workers on one host, Redis for several
+hosts.
+
+Every issued puzzle gets an opaque puzzle_id and its own cache entry, so a
+player can hold several unanswered puzzles (for batch submission). A second
+entry points at the most recently issued one for the single-answer endpoints.
+"""
+import secrets
+
+from django.conf import settings
+from django.core.cache import caches
+
+
+def _cache():
+    return caches[getattr(settings, 'PUZZLE_SESSION_CACHE', 'default')]
+
+
+def _current_key(user_id):
+    return f'puzzle-session:{user_id}'
+
+
+def _puzzle_key(user_id, puzzle_id):
+    return f'puzzle-session:{user_id}:{puzzle_id}'
+
+
+def ttl():
+    return getattr(settings, 'PUZZLE_SESSION_TTL', 15 * 60)
+
+
+def issue(user_id, puzzle, timeout=None):
+    """Store a newly fetched puzzle as the user's current one and return its puzzle_id"""
+    puzzle_id = secrets.token_urlsafe(9)
+    _cache().set_many(
+        {_puzzle_key(user_id, puzzle_id): puzzle, _current_key(user_id): puzzle_id},
+        timeout=ttl() if timeout is None else timeout,
+    )
+    return puzzle_id
+
+
+def get(user_id):
+    """Return the current puzzle for a user, or an empty dict"""
+    cache = _cache()
+    puzzle_id = cache.get(_current_key(user_id))
+    if not puzzle_id:
+        return {}
+    return cache.get(_puzzle_key(user_id, puzzle_id)) or {}
+
+
+def take_many(user_id, puzzle_ids):
+    """
+    Remove and return the requested puzzles as {puzzle_id: puzzle}. A puzzle is
+    only returned to the caller whose delete succeeds, so no puzzle can be
+    scored twice, whichever endpoint the answers arrive through.
+    """
+    cache = _cache()
+    keys = {_puzzle_key(user_id, puzzle_id): puzzle_id for puzzle_id in puzzle_ids}
+    found = cache.get_many(list(keys))
+    taken = {}
+    for key, puzzle in found.items():
+        if puzzle and cache.delete(key):
+            taken[keys[key]] = puzzle
+    return taken
+
+
+def put_back(user_id, puzzles):
+    """Return puzzles taken with take_many() whose answers could not be recorded, with a fresh TTL"""
+    if puzzles:
+        _cache().set_many(
+            {_puzzle_key(user_id, puzzle_id): puzzle for puzzle_id, puzzle in puzzles.items()}, timeout=ttl()
+        )
+
+
+def take(user_id):
+    """Remove and return the current puzzle, or an empty dict"""
+    puzzle_id = _cache().get(_current_key(user_id))
+    if not puzzle_id:
+        return {}
+    return take_many(user_id, [puzzle_id]).get(puzzle_id, {})
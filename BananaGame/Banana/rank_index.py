@@ -0,0 +1,203 @@
+"""
+In-memory rank index over the leaderboard.
+
+A Fenwick tree counts players per best score, so the number of players above
+a score, and therefore anyone's rank, is an O(log n) prefix sum instead of a
+COUNT over LeaderboardEntry. Ranks are competition ranks: players on the same
+score share a rank (1, 2, 2, 4).
+
+The index is per process. It is built from LeaderboardEntry on first use,
+kept current by this process's submit_score calls and rebuilt once it is
+older than RANK_INDEX_MAX_AGE seconds, which is how long scores submitted
+through other workers can take to show up. Scores below zero count as zero.
+
+The tree has a bucket per score up to the top score, but never more than
+RANK_INDEX_MAX_BUCKETS. Scores beyond the last bucket are kept in a sorted
+list instead, which stays short as long as such scores are rare, so one
+absurd score cannot make every worker allocate an enormous array.
+"""
+import bisect
+import threading
+import time
+
+from django.conf import settings
+
+from .models import LeaderboardEntry
+
+AROUND_MAX = 25
+
+_index = None
+_build_lock = threading.Lock()
+
+
+def max_age():
+    return getattr(settings, 'RANK_INDEX_MAX_AGE', 300)
+
+
+def max_buckets():
+    return getattr(settings, 'RANK_INDEX_MAX_BUCKETS', 2 ** 20)
+
+
+class FenwickTree:
+    """Counts per integer bucket with O(log n) point updates and prefix sums"""
+
+    def __init__(self, counts):
+        self.size = len(counts)
+        tree = [0] + list(counts)
+        for i in range(1, self.size + 1):
+            parent = i + (i & -i)
+            if parent <= self.size:
+                tree[parent] += tree[i]
+        self._tree = tree
+
+    def add(self, bucket, delta):
+        i = bucket + 1
+        while i <= self.size:
+            self._tree[i] += delta
+            i += i & -i
+
+    def prefix(self, bucket):
+        """Sum of the counts in buckets 0..bucket inclusive"""
+        i = min(bucket + 1, self.size)
+        total = 0
+        while i > 0:
+            total += self._tree[i]
+            i -= i & -i
+        return total
+
+
+class RankIndex:
+    def __init__(self, scores):
+        """`scores` maps user_id to best score"""
+        self._lock = threading.Lock()
+        self._scores = {user_id: max(score, 0) for user_id, score in scores.items()}
+        self.built_at = time.monotonic()
+        self._build(max(self._scores.values(), default=0))
+
+    @classmethod
+    def from_db(cls):
+        entries = LeaderboardEntry.objects.values_list('user_id', 'best_score').iterator(chunk_size=10000)
+        return cls(dict(entries))
+
+    def _build(self, top_score):
+        capacity = 1024
+        while capacity <= top_score and capacity < max_buckets():
+            capacity *= 2
+        counts = [0] * capacity
+        overflow = []
+        for score in self._scores.values():
+            if score < capacity:
+                counts[score] += 1
+            else:
+                overflow.append(score)
+        self._tree = FenwickTree(counts)
+        self._overflow = sorted(overflow)
+
+    def is_stale(self):
+        return time.monotonic() - self.built_at > max_age()
+
+    def __len__(self):
+        return len(self._scores)
+
+    def count_above(self, score):
+        """Number of players whose best score is strictly higher than `score`"""
+        score = max(score, 0)
+        with self._lock:
+            if score >= self._tree.size:
+                return len(self._overflow) - bisect.bisect_right(self._overflow, score)
+            return len(self._scores) - self._tree.prefix(score)
+
+    def rank(self, user_id):
+        """(rank, best score) for a user, or (None, None) if they have no score"""
+        score = self._scores.get(user_id)
+        if score is None:
+            return None, None
+        return self.count_above(score) + 1, score
+
+    def update(self, user_id, score):
+        """Record a submitted score; only raises the user's best"""
+        score = max(score, 0)
+        with self._lock:
+            old = self._scores.get(user_id)
+            if old is not None and old >= score:
+                return
+            self._scores[user_id] = score
+            if score >= self._tree.size and self._tree.size < max_buckets():
+                self._build(score)
+                return
+            if old is not None:
+                self._remove(old)
+            if score < self._tree.size:
+                self._tree.add(score, 1)
+            else:
+                bisect.insort(self._overflow, score)
+
+    def _remove(self, score):
+        if score < self._tree.size:
+            self._tree.add(score, -1)
+        else:
+            del self._overflow[bisect.bisect_left(self._overflow, score)]
+
+
+def get_index():
+    """The shared index, built on first use and rebuilt once stale"""
+    global _index
+    index = _index
+    if index is not None and not index.is_stale():
+        return index
+    # While one request rebuilds, the others keep answering from the stale copy
+    if not _build_lock.acquire(blocking=index is None):
+        return index
+    try:
+        if _index is None or _index.is_stale():
+            _index = RankIndex.from_db()
+        return _index
+    finally:
+        _build_lock.release()
+
+
+def invalidate():
+    """Drop the index so the next reader rebuilds it, e.g. after the leaderboard is rebuilt"""
+    global _index
+    _index = None
+
+
+def record_score(user_id, score):
+    """Keep an already built index current; building is left to the next reader"""
+    if _index is not None:
+        _index.update(user_id, score)
+
+
+def count_above(score):
+    return get_index().count_above(score)
+
+
+def rank(user):
+    """(rank, best score) for `user`, or (None, None) if they have not submitted a score"""
+    return get_index().rank(user.pk)
+
+
+def around(user, k=5):
+    """
+    The user's entry with up to k neighbours either side, highest first, as
+    [{'rank', 'username', 'score'}]. Neighbours come from an indexed range scan
+    on LeaderboardEntry in board order, and their ranks from the index.
+    """
+    index = get_index()
+    user_rank, score = index.rank(user.pk)
+    if user_rank is None:
+        return []
+    entries = LeaderboardEntry.objects.values_list('user__username', 'best_score')
+    above = list(
+        entries.filter(best_score__gte=score).exclude(best_score=score, user_id__gte=user.pk)
+        .order_by('best_score', '-user_id')[:k]
+    )
+    below = list(
+        entries.filter(best_score__lte=score).exclude(best_score=score, user_id__lte=user.pk)
+        .order_by('-best_score', 'user_id')[:k]
+    )
+    rows = above[::-1] + [(user.username, score)] + below
+    return [
+        {'rank': index.count_above(best_score) + 1, 'username': username, 'score': best_score}
+        for username, best_score in rows
+    ]
@@ -0,0 +1,145 @@
+"""
+Refresh token revocation.
+
+logout-all blacklists every outstanding refresh token of the user with one
+bulk INSERT and records a SessionRevocation: tokens issued before its
+revoked_before are refused. Refreshes check that timestamp instead of joining
+the blacklist, and the answers are kept in the TOKEN_REVOCATION_CACHE alias,
+so most refreshes make no revocation query at all:
+
+- revoked_before per user, replaced by revoke_all() and otherwise cached for
+  TOKEN_REVOCATION_CACHE_TTL seconds;
+- whether a token (by jti) is blacklisted: set by revoke() on logout, and
+  otherwise looked up once and cached for the same TTL. A token blacklisted
+  some other way (the admin) is refused once that cached answer expires.
+
+prune() deletes expired outstanding tokens with their blacklist entries, and
+revocations older than the refresh token lifetime, in chunks.
+"""
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.utils import timezone
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.settings import api_settings as jwt_settings
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken, OutstandingToken
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from .models import SessionRevocation
+
+NEVER = 0  # revoked_before of a user who has never logged out everywhere
+
+
+def _cache():
+    return caches[getattr(settings, 'TOKEN_REVOCATION_CACHE', 'default')]
+
+
+def cache_ttl():
+    return getattr(settings, 'TOKEN_REVOCATION_CACHE_TTL', 5 * 60)
+
+
+def _user_key(user_id):
+    return f'revoked-before:{user_id}'
+
+
+def _token_key(jti):
+    return f'revoked-token:{jti}'
+
+
+def _until_expiry(payload):
+    return max(1, int(payload['exp'] - time.time()))
+
+
+def revoked_before(user_id):
+    """POSIX time (whole seconds) before which the user's tokens are refused, NEVER if none"""
+    cache = _cache()
+    value = cache.get(_user_key(user_id))
+    if value is None:
+        revoked = SessionRevocation.objects.filter(user_id=user_id).values_list('revoked_before', flat=True).first()
+        value = int(revoked.timestamp()) if revoked else NEVER
+        cache.set(_user_key(user_id), value, cache_ttl())
+    return value
+
+
+def is_blacklisted(payload):
+    cache = _cache()
+    jti = payload[jwt_settings.JTI_CLAIM]
+    value = cache.get(_token_key(jti))
+    if value is None:
+        value = BlacklistedToken.objects.filter(token__jti=jti).exists()
+        # A blacklisted token stays blacklisted, so that answer can be kept until it expires
+        cache.set(_token_key(jti), value, _until_expiry(payload) if value else cache_ttl())
+    return value
+
+
+def is_revoked(payload):
+    user_id = payload.get(jwt_settings.USER_ID_CLAIM)
+    if user_id is not None and payload.get('iat', 0) < revoked_before(user_id):
+        return True
+    return is_blacklisted(payload)
+
+
+class RevocableRefreshToken(RefreshToken):
+    """A refresh token checked against revoke_all() and the cached blacklist"""
+
+    def check_blacklist(self):
+        if is_revoked(self.payload):
+            raise TokenError(_("Token is blacklisted"))
+
+
+def revoke(token):
+    """Blacklist one refresh token (logout)"""
+    token.blacklist()
+    _cache().set(_token_key(token[jwt_settings.JTI_CLAIM]), True, _until_expiry(token.payload))
+
+
+def revoke_all(user):
+    """Refuse every refresh token issued to the user so far. Returns how many were blacklisted."""
+    now = timezone.now()
+    with transaction.atomic():
+        tokens = list(
+            OutstandingToken.objects.filter(user=user, expires_at__gt=now, blacklistedtoken__isnull=True)
+            .values_list('id', 'jti', 'expires_at')
+        )
+        BlacklistedToken.objects.bulk_create(
+            [BlacklistedToken(token_id=token_id) for token_id, _, _ in tokens], ignore_conflicts=True
+        )
+        SessionRevocation.objects.update_or_create(user=user, defaults={'revoked_before': now})
+    # Rounded down: iat is in whole seconds, so a token issued later in this same
+    # second is not refused. Earlier ones in it are blacklisted above, and their
+    # cached "not blacklisted" answers replaced.
+    cache = _cache()
+    cache.set(_user_key(user.pk), int(now.timestamp()), cache_ttl())
+    if tokens:
+        latest = max(expires_at for _, _, expires_at in tokens)
+        cache.set_many(
+            {_token_key(jti): True for _, jti, _ in tokens},
+            max(1, int((latest - now).total_seconds())),
+        )
+    return len(tokens)
+
+
+def _delete_in_chunks(queryset, chunk_size):
+    deleted = 0
+    while True:
+        ids = list(queryset.order_by().values_list('pk', flat=True)[:chunk_size])
+        if not ids:
+            return deleted
+        deleted += queryset.model.objects.filter(pk__in=ids).delete()[0]
+
+
+def prune(chunk_size=10000):
+    """
+    Delete expired outstanding tokens and their blacklist entries, and
+    revocations no unexpired token predates. Returns (outstanding, blacklisted, revocations).
+    """
+    now = timezone.now()
+    blacklisted = _delete_in_chunks(BlacklistedToken.objects.filter(token__expires_at__lte=now), chunk_size)
+    outstanding = _delete_in_chunks(OutstandingToken.objects.filter(expires_at__lte=now), chunk_size)
+    revocations = _delete_in_chunks(
+        SessionRevocation.objects.filter(revoked_before__lte=now - jwt_settings.REFRESH_TOKEN_LIFETIME), chunk_size
+    )
+    return outstanding, blacklisted, revocations
@@ -0,0 +1,93 @@
+"""
+Points, XP and level formulas.
+
+score() works out a single solve for check_puzzle_answer. score_batch() and
+levels_for_xp() apply the same formulas to NumPy arrays so the whole player
+base can be rescored when the economy is rebalanced.
+"""
+try:
+    import numpy as np
+except ImportError:  # Only the batch API needs NumPy
+    np = None
+
+DIFFICULTY_MULTIPLIERS = {'easy': 0.7, 'medium': 1.0, 'hard': 1.5}
+DIFFICULTIES = ('easy', 'medium', 'hard')
+BASE_POINTS = 10
+TIME_LIMIT = 40
+TIME_BONUS_CAP = 15
+COMBO_BONUS = 2
+PERFECT_BONUS = 10
+PERFECT_XP_BONUS = 5
+LUCKY_MULTIPLIER = 2.0
+LUCKY_CHANCE = 0.05
+XP_PER_LEVEL = 100
+
+
+def level_for_xp(xp):
+    return xp // XP_PER_LEVEL + 1
+
+
+def xp_for_level(level):
+    """XP at which `level` starts"""
+    return (level - 1) * XP_PER_LEVEL
+
+
+def score(difficulty, time_taken, combo_count, hints_used, lucky=False):
+    """Score one correct answer. Returns the point breakdown plus total points and XP."""
+    base_points = BASE_POINTS * DIFFICULTY_MULTIPLIERS.get(difficulty, 1.0)
+    time_bonus = max(0, (TIME_LIMIT - time_taken) / 2) if time_taken > 0 else 0
+    time_bonus = min(time_bonus, TIME_BONUS_CAP)
+    combo_bonus = combo_count * COMBO_BONUS
+    perfect = hints_used == 0
+    perfect_bonus = PERFECT_BONUS if perfect else 0
+    lucky_multiplier = LUCKY_MULTIPLIER if lucky else 1.0
+    total_points = int((base_points + time_bonus + combo_bonus + perfect_bonus) * lucky_multiplier)
+    return {
+        "total_points": total_points,
+        "xp": total_points + (PERFECT_XP_BONUS if perfect else 0),
+        "base_points": int(base_points),
+        "time_bonus": int(time_bonus),
+        "combo_bonus": combo_bonus,
+        "perfect_bonus": perfect_bonus,
+        "lucky_multiplier": lucky_multiplier,
+    }
+
+
+def _require_numpy():
+    if np is None:
+        raise ImportError("The batch scoring API needs NumPy: pip install numpy")
+
+
+def difficulty_codes(difficulties):
+    """Map difficulty names to indexes into DIFFICULTIES (unknown names count as medium)"""
+    _require_numpy()
+    lookup = {name: index for index, name in enumerate(DIFFICULTIES)}
+    return np.fromiter((lookup.get(name, 1) for name in difficulties), dtype=np.int8, count=len(difficulties))
+
+
+def score_batch(difficulty, time_taken, combo_count, hints_used, lucky=None):
+    """
+    Vectorised score(). `difficulty` is an array of DIFFICULTIES indexes (see
+    difficulty_codes); the other arguments are equal-length arrays. Returns
+    (total_points, xp) as int64 arrays.
+    """
+    _require_numpy()
+    multipliers = np.array([DIFFICULTY_MULTIPLIERS[name] for name in DIFFICULTIES])
+    time_taken = np.asarray(time_taken, dtype=np.float64)
+    hints_used = np.asarray(hints_used)
+
+    base_points = BASE_POINTS * multipliers[np.asarray(difficulty)]
+    time_bonus = np.where(time_taken > 0, np.clip((TIME_LIMIT - time_taken) / 2, 0, TIME_BONUS_CAP), 0)
+    combo_bonus = np.asarray(combo_count, dtype=np.int64) * COMBO_BONUS
+    perfect = hints_used == 0
+    total = base_points + time_bonus + combo_bonus + np.where(perfect, PERFECT_BONUS, 0)
+    if lucky is not None:
+        total = total * np.where(np.asarray(lucky), LUCKY_MULTIPLIER, 1.0)
+    total_points = total.astype(np.int64)
+    return total_points, total_points + np.where(perfect, PERFECT_XP_BONUS, 0)
+
+
+def levels_for_xp(xp):
+    """Vectorised level_for_xp()"""
+    _require_numpy()
+    return np.asarray(xp, dtype=np.int64) // XP_PER_LEVEL + 1
@@ -1,10 +1,10 @@
 from rest_framework import serializers
 from django.contrib.auth.models import User
 from django.core.exceptions import ValidationError
-from rest_framework_simplejwt.serializers import TokenObtainPairSerializer
-from django.contrib.auth import authenticate
-from rest_framework_simplejwt.tokens import RefreshToken
+from rest_framework_simplejwt.serializers import TokenRefreshSerializer
+from django.conf import settings
 from .models import Player, Score, Contact, Rating, Review
+from .revocation import RevocableRefreshToken
 
 def validate_register_data(data):
     if not data.get('username') or len(data['username']) < 3:
@@ -25,6 +25,7 @@ def validate_register_data(data):
     return data
 
 class RegisterSerializer(serializers.ModelSerializer):
+    """Validates a registration; the async register view hashes the password and creates the user"""
     confirm_password = serializers.CharField(write_only=True, required=True)
 
     class Meta:
@@ -39,38 +40,16 @@ class RegisterSerializer(serializers.ModelSerializer):
     def validate(self, data):
         return validate_register_data(data)
 
-    def create(self, validated_data):
-        validated_data.pop('confirm_password')
-        user = User.objects.create_user(
-            username=validated_data['username'],
-            email=validated_data['email'],
-            password=validated_data['password']
-        )
-        return user
-
-class CustomTokenObtainPairSerializer(TokenObtainPairSerializer):
-    def __init__(self, *args, **kwargs):
-        super().__init__(*args, **kwargs)
-        self.fields['username'] = serializers.CharField()
-        self.fields['password'] = serializers.CharField()
+class LoginSerializer(serializers.Serializer):
+    """Username and password for the async login view, which checks them itself"""
+    username = serializers.CharField()
+    password = serializers.CharField()
 
-    def validate(self, attrs):
-        username = attrs.get('username')
-        password = attrs.get('password')
 
-        if not username or not password:
-            raise ValidationError({"detail": "Missing fields"})
+class RevocableTokenRefreshSerializer(TokenRefreshSerializer):
+    """Checks the refresh token against logout-all and the cached blacklist rather than joining the blacklist"""
+    token_class = RevocableRefreshToken
 
-        authenticated_user = authenticate(username=username, password=password)
-        if not authenticated_user:
-            raise ValidationError({"detail": "Invalid username or password"})
-
-        refresh = RefreshToken.for_user(authenticated_user)
-        return {
-            'refresh': str(refresh),
-            'access': str(refresh.access_token),
-            'username': authenticated_user.username,
-        }
 
 class PlayerSerializer(serializers.ModelSerializer):
     class Meta:
@@ -87,6 +66,26 @@ class ScoreSerializer(serializers.ModelSerializer):
         fields = ['username', 'score', 'date']
 
 
+class PuzzleAnswerSerializer(serializers.Serializer):
+    puzzle_id = serializers.CharField(max_length=64)
+    answer = serializers.CharField(trim_whitespace=True)
+    time_taken = serializers.FloatField(required=False, default=0)
+    hints_used = serializers.IntegerField(required=False, default=0, min_value=0)
+
+
+class PuzzleAnswerBatchSerializer(serializers.Serializer):
+    answers = PuzzleAnswerSerializer(many=True, allow_empty=False)
+
+    def validate_answers(self, value):
+        limit = getattr(settings, 'PUZZLE_BATCH_MAX_ANSWERS', 50)
+        if len(value) > limit:
+            raise ValidationError(f"At most {limit} answers can be submitted at once")
+        puzzle_ids = [item['puzzle_id'] for item in value]
+        if len(set(puzzle_ids)) != len(puzzle_ids):
+            raise ValidationError("Each puzzle can only be answered once")
+        return value
+
+
 class EmailOTPRequestSerializer(serializers.Serializer):
     email = serializers.EmailField()
 
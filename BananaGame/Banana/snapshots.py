@@ -0,0 +1,92 @@
+"""
+Short-lived snapshots of users and player state in the AUTH_SNAPSHOT_CACHE
+alias, so authenticated gameplay requests skip the auth_user and Player reads.
+
+User snapshots hold the auth_user columns views use, plus the user's
+logout-all time. SnapshotJWTAuthentication builds request.user from one
+instead of loading the row. They are kept for AUTH_SNAPSHOT_TTL seconds and
+dropped when the user is saved or deleted (deactivation included), logs out,
+or logs out everywhere. Deactivating through QuerySet.update() skips the
+signals and takes effect when the snapshot expires.
+
+Player snapshots hold progress.STATE_FIELDS and are the starting point of
+progress.record_answers. They may be stale: the UPDATE is guarded by
+Player.version, so a stale snapshot only costs a retry from a fresh read.
+Writers of those fields therefore only have to bump the version, as they
+already must for concurrent solves.
+"""
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import caches
+from django.db import router
+
+from . import revocation
+from .models import Player
+
+USER_FIELDS = ('id', 'username', 'email', 'first_name', 'last_name', 'is_active', 'is_staff', 'is_superuser')
+
+
+def _cache():
+    return caches[getattr(settings, 'AUTH_SNAPSHOT_CACHE', 'default')]
+
+
+def ttl():
+    return getattr(settings, 'AUTH_SNAPSHOT_TTL', 60)
+
+
+def _instance(model, values):
+    """A model instance with only `values` ({attname: value}) loaded"""
+    # from_db takes the values in the model's field order
+    names = [field.attname for field in model._meta.concrete_fields if field.attname in values]
+    return model.from_db(router.db_for_read(model), names, [values[name] for name in names])
+
+
+def _user_key(user_id):
+    return f'user-snapshot:{user_id}'
+
+
+def _player_key(user_id):
+    return f'player-snapshot:{user_id}'
+
+
+def get_user(user_id):
+    """
+    (user, revoked_before) for the user id. The user is a User instance with
+    only USER_FIELDS loaded, so reading any other field queries the row and
+    save() writes only those fields. (None, None) if there is no such user.
+    """
+    cache = _cache()
+    snapshot = cache.get(_user_key(user_id))
+    if snapshot is None:
+        values = User.objects.filter(pk=user_id).values(*USER_FIELDS).first()
+        if values is None:
+            return None, None
+        snapshot = {'values': values, 'revoked_before': revocation.revoked_before(user_id)}
+        cache.set(_user_key(user_id), snapshot, ttl())
+    return _instance(User, snapshot['values']), snapshot['revoked_before']
+
+
+def forget_user(user_id):
+    _cache().delete(_user_key(user_id))
+
+
+def get_player(user_id, fields):
+    """A Player with `fields` loaded from the snapshot, or None if there is none"""
+    values = _cache().get(_player_key(user_id))
+    if values is None or set(values) != set(fields):
+        return None
+    return _instance(Player, values)
+
+
+def store_player(user_id, player, fields):
+    _cache().set(_player_key(user_id), {field: getattr(player, field) for field in fields}, ttl())
+
+
+def forget_player(user_id):
+    _cache().delete(_player_key(user_id))
+
+
+def user_changed(sender, instance, **kwargs):
+    """post_save / post_delete receiver for User"""
+    forget_user(instance.pk)
+    forget_player(instance.pk)
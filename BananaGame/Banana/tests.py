@@ -1,3 +1,1027 @@
-from django.test import TestCase
+import csv
+import datetime
+import io
+import json
+import logging
+import os
+import random
+import shutil
+import tempfile
+import threading
+import time
+import zipfile
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import mock
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib.admin.sites import site as admin_site
+from django.contrib.auth.hashers import PBKDF2PasswordHasher
+from django.contrib.auth.models import User
+from django.core import mail
+from django.core.cache import caches
+from django.core.exceptions import ImproperlyConfigured
+from django.core.mail import get_connection
+from django.core.management import call_command
+from django.db import connections
+from django.db.models import F
+from django.test import RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+import requests
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken, OutstandingToken
+from rest_framework_simplejwt.tokens import AccessToken, RefreshToken
+
+from . import certificate_jobs, certificates, leaderboard, outbox, progress, puzzle_pool, puzzle_sessions, rank_index, revocation, scoring, snapshots, throttling, upstream, user_import, write_behind
+from .models import EmailOutbox, LeaderboardEntry, Player, PooledPuzzle, Score, SessionRevocation
+
+PUZZLE = {'question': 'https://example.com/banana.png', 'solution': '7'}
+
+# Every cache in process memory, so tests leave the cache directories alone
+LOCMEM_CACHES = {
+    alias: {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': alias}
+    for alias in settings.CACHES
+}
+
+
+def quiet_logs(test):
+    """Silence the warnings the code under test logs on purpose"""
+    logging.disable(logging.ERROR)
+    test.addCleanup(logging.disable, logging.NOTSET)
+
+
+def scratch_cache(test, alias, **options):
+    """Settings for CACHES with `alias` configured as in settings but kept in a scratch directory"""
+    directory = tempfile.mkdtemp()
+    test.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+    config = dict(settings.CACHES[alias], LOCATION=directory)
+    config['OPTIONS'] = dict(config.get('OPTIONS', {}), **options)
+    return dict(settings.CACHES, **{alias: config})
+
+
+class PuzzleSessionTests(SimpleTestCase):
+
+    def setUp(self):
+        overrides = override_settings(CACHES=scratch_cache(self, settings.PUZZLE_SESSION_CACHE))
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+
+    def test_capacity_covers_peak_players(self):
+        options = settings.CACHES[settings.PUZZLE_SESSION_CACHE].get('OPTIONS', {})
+        # A current-puzzle pointer and at least one puzzle per player
+        self.assertGreaterEqual(options.get('MAX_ENTRIES', 300), settings.PEAK_CONCURRENT_PLAYERS * 2)
+
+    def test_sessions_survive_beyond_default_capacity(self):
+        # 400 players hold 800 entries, well past FileBasedCache's default MAX_ENTRIES of 300
+        for user_id in range(400):
+            puzzle_sessions.issue(user_id, dict(PUZZLE, solution=str(user_id)))
+        for user_id in range(400):
+            self.assertEqual(puzzle_sessions.take(user_id)['solution'], str(user_id))
+
+    def test_expired_entries_are_culled_before_live_ones(self):
+        with override_settings(CACHES=scratch_cache(self, settings.PUZZLE_SESSION_CACHE, MAX_ENTRIES=300)):
+            # Puzzles abandoned by players who never came back
+            for user_id in range(1000, 1150):
+                puzzle_sessions.issue(user_id, dict(PUZZLE), timeout=0)
+            for user_id in range(140):
+                puzzle_sessions.issue(user_id, dict(PUZZLE))
+            self.assertEqual(sum(1 for user_id in range(140) if puzzle_sessions.get(user_id)), 140)
+
+    def test_concurrent_answers_take_a_puzzle_once(self):
+        puzzle_ids = [puzzle_sessions.issue(1, dict(PUZZLE)) for _ in range(20)]
+        taken = []
+        barrier = threading.Barrier(8)
+
+        def answer():
+            barrier.wait()
+            taken.extend(puzzle_sessions.take_many(1, puzzle_ids))
+
+        threads = [threading.Thread(target=answer) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(sorted(taken), sorted(puzzle_ids))
+
+
+class RankIndexTests(SimpleTestCase):
+
+    def test_ranks(self):
+        index = rank_index.RankIndex({1: 50, 2: 70, 3: 50, 4: 10})
+        self.assertEqual([index.rank(user_id)[0] for user_id in (2, 1, 3, 4)], [1, 2, 2, 4])
+        self.assertEqual(index.rank(5), (None, None))
+        index.update(4, 80)
+        self.assertEqual(index.rank(4), (1, 80))
+        self.assertEqual(index.count_above(50), 2)
+
+    @override_settings(RANK_INDEX_MAX_BUCKETS=4096)
+    def test_scores_beyond_the_buckets_do_not_grow_the_tree(self):
+        index = rank_index.RankIndex({1: 100, 2: 10 ** 12})
+        self.assertEqual(index._tree.size, 4096)
+        index.update(3, 10 ** 10)
+        index.update(4, 3000)
+        self.assertEqual(index._tree.size, 4096)
+        self.assertEqual([index.rank(user_id)[0] for user_id in (2, 3, 4, 1)], [1, 2, 3, 4])
+        self.assertEqual(index.count_above(5000), 2)
+        self.assertEqual(index.count_above(10 ** 10), 1)
+        # Raising an overflowed best moves it within the overflow list
+        index.update(3, 10 ** 13)
+        self.assertEqual(index.rank(3)[0], 1)
+        self.assertEqual(index.rank(2)[0], 2)
+
+
+class ScoringTests(SimpleTestCase):
+
+    def test_score_batch_matches_score(self):
+        rng = random.Random(0)
+        difficulty = [rng.choice(scoring.DIFFICULTIES + ('unknown',)) for _ in range(2000)]
+        solves = [
+            (rng.choice((0, 0.5, 7, 25.3, 39, 60)), rng.randint(0, 30), rng.choice((0, 1, 3)), rng.random() < 0.3)
+            for _ in range(2000)
+        ]
+        expected = [scoring.score(name, *solve) for name, solve in zip(difficulty, solves)]
+        total_points, xp = scoring.score_batch(scoring.difficulty_codes(difficulty), *zip(*solves))
+        self.assertEqual(total_points.tolist(), [breakdown['total_points'] for breakdown in expected])
+        self.assertEqual(xp.tolist(), [breakdown['xp'] for breakdown in expected])
+        self.assertEqual(scoring.levels_for_xp(xp).tolist(), [scoring.level_for_xp(x) for x in xp.tolist()])
+
+
+@override_settings(CACHES=LOCMEM_CACHES, PLAYER_WRITE_BEHIND=False)
+class ProgressStressTests(TransactionTestCase):
+    THREADS = 8
+    ROUNDS = 25
+
+    def test_counters_are_exact_under_contention(self):
+        user = User.objects.create_user('stressed', password=None)
+        Player.objects.create(user=user, hints=self.THREADS * self.ROUNDS // 2)
+        answers = [
+            {'correct': True, 'time_taken': 12, 'hints_used': 0, 'puzzle_id': ''},
+            {'correct': True, 'time_taken': 30, 'hints_used': 1, 'puzzle_id': ''},
+        ]
+        results, hints_left, gave_up, errors = [], [], [], []
+        barrier = threading.Barrier(self.THREADS)
+
+        def play():
+            try:
+                barrier.wait()
+                for _ in range(self.ROUNDS):
+                    try:
+                        results.extend(progress.record_answers(user, answers))
+                    except progress.ConcurrentUpdateError:
+                        # Allowed after MAX_ATTEMPTS lost races, as long as it changed nothing
+                        gave_up.append(True)
+                    hints_left.append(progress.consume_hint(user))
+            except Exception as exc:
+                errors.append(exc)
+            finally:
+                connections.close_all()
+
+        threads = [threading.Thread(target=play) for _ in range(self.THREADS)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(errors, [])
+        rounds = self.THREADS * self.ROUNDS
+        solves = len(results)
+        self.assertEqual(solves, (rounds - len(gave_up)) * len(answers))
+        self.assertGreater(solves, rounds)
+        player = Player.objects.get(user=user)
+        self.assertEqual(player.xp, sum(result['xp_gained'] for result in results))
+        self.assertEqual(player.level, scoring.level_for_xp(player.xp))
+        self.assertEqual(player.puzzles_solved, solves)
+        self.assertEqual(player.perfect_solves, solves // 2)
+        self.assertEqual(player.version, solves // 2)
+        # Every solve lands on the streak exactly once, whatever order they commit in
+        self.assertEqual(player.combo_count, solves)
+        self.assertEqual(player.max_combo, solves)
+        self.assertEqual(sorted(result['combo'] for result in results), list(range(1, solves + 1)))
+        # Half the hint requests get one, each hint is spent once and the count never goes negative
+        self.assertEqual(player.hints, 0)
+        self.assertEqual(hints_left.count(None), rounds // 2)
+        self.assertEqual(sorted(left for left in hints_left if left is not None), list(range(rounds // 2)))
+
+
+@override_settings(CACHES=LOCMEM_CACHES, THROTTLES={}, PLAYER_WRITE_BEHIND=False)
+class BatchAnswerTests(TestCase):
+
+    def setUp(self):
+        for alias in settings.CACHES:
+            caches[alias].clear()
+        self.user = User.objects.create_user('batcher', password=None)
+        self.client = APIClient(SERVER_NAME='localhost')
+        self.client.force_authenticate(self.user)
+
+    def issue(self, count):
+        return [
+            puzzle_sessions.issue(self.user.pk, dict(PUZZLE, question=f'https://example.com/{n}.png'))
+            for n in range(count)
+        ]
+
+    def submit(self, *answers):
+        answers = [{'puzzle_id': puzzle_id, 'answer': answer} for puzzle_id, answer in answers]
+        return self.client.post('/banana/check-puzzle/batch/', {'answers': answers}, format='json')
+
+    def test_mixed_answers_carry_the_combo(self):
+        first, second, third, fourth = self.issue(4)
+
+        body = self.submit((first, '7'), ('never-issued', '7'), (second, '7')).json()
+        self.assertEqual([result.get('combo') for result in body['results']], [1, None, 2])
+        self.assertEqual(body['results'][1], {'puzzle_id': 'never-issued', 'error': 'Unknown or expired puzzle'})
+        self.assertEqual(body['correct'], 2)
+
+        # The combo carries over from the previous batch until a wrong answer breaks it
+        body = self.submit((third, '7'), (fourth, '4')).json()
+        self.assertEqual(body['results'][0]['combo'], 3)
+        self.assertEqual(body['results'][1], {'puzzle_id': fourth, 'correct': False, 'correct_answer': '7'})
+
+        # An answered puzzle cannot be scored again, in the same batch or a later one
+        self.assertEqual(self.submit((first, '7'), (first, '7')).status_code, 400)
+        body = self.submit((first, '7')).json()
+        self.assertEqual(body['results'], [{'puzzle_id': first, 'error': 'Unknown or expired puzzle'}])
+
+        player = Player.objects.get(user=self.user)
+        self.assertEqual((player.puzzles_solved, player.combo_count, player.max_combo), (3, 0, 3))
+        self.assertEqual(len(player.puzzle_history), 3)
+
+    def test_lost_update_returns_the_puzzles(self):
+        first, second = self.issue(2)
+        with mock.patch.object(progress, 'record_answers', side_effect=progress.ConcurrentUpdateError('busy')):
+            response = self.submit((first, '7'), (second, '4'))
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response['Retry-After'], '1')
+        self.assertFalse(Player.objects.filter(user=self.user, puzzles_solved__gt=0).exists())
+
+        body = self.submit((first, '7'), (second, '4')).json()
+        self.assertEqual([result['correct'] for result in body['results']], [True, False])
+
+
+@override_settings(CACHES=LOCMEM_CACHES, PLAYER_WRITE_BEHIND=True, PLAYER_WRITE_BEHIND_MAX_PENDING=1000)
+class WriteBehindTests(TestCase):
+    ANSWER = {'correct': True, 'time_taken': 10, 'hints_used': 0, 'puzzle_id': ''}
+
+    def setUp(self):
+        self.user = User.objects.create_user('buffered', password=None)
+        self.player = Player.objects.create(user=self.user)
+        # No interval flusher: the tests flush by hand
+        patcher = mock.patch.object(write_behind, '_flusher', object())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(write_behind._pending.clear)
+
+    def test_the_batch_being_flushed_stays_visible(self):
+        progress.record_answers(self.user, [self.ANSWER] * 2)
+        seen = {}
+        bulk_update = Player.objects.bulk_update
+
+        def during_flush(players, fields, **kwargs):
+            # The row as other requests read it until the flush commits
+            seen['stats'] = write_behind.merge(Player.objects.get(pk=self.player.pk))
+            progress.record_answers(self.user, [self.ANSWER])
+            return bulk_update(players, fields, **kwargs)
+
+        with mock.patch.object(Player.objects, 'bulk_update', side_effect=during_flush):
+            write_behind.flush()
+        self.assertEqual((seen['stats'].puzzles_solved, seen['stats'].combo_count), (2, 2))
+
+        # Committed and still pending: counted once each, and the combo carried on
+        merged = write_behind.merge(Player.objects.get(pk=self.player.pk))
+        self.assertEqual((merged.puzzles_solved, merged.combo_count), (3, 3))
+        write_behind.flush()
+        player = Player.objects.get(pk=self.player.pk)
+        self.assertEqual((player.puzzles_solved, player.combo_count, player.max_combo), (3, 3, 3))
+        self.assertEqual(write_behind.merge(player).puzzles_solved, 3)
+
+    @override_settings(PLAYER_WRITE_BEHIND_MAX_PENDING=1)
+    def test_a_full_buffer_starts_one_flush(self):
+        self.addCleanup(setattr, write_behind, '_full_flush_started', False)
+        with mock.patch.object(write_behind.threading, 'Thread') as thread:
+            for player_id in range(10):
+                write_behind.record(player_id, deltas={'xp': 1})
+        self.assertEqual(thread.call_count, 1)
+
+
+@override_settings(
+    CACHES=LOCMEM_CACHES, THROTTLES={},
+    PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher', 'django.contrib.auth.hashers.PBKDF2PasswordHasher'],
+)
+class AuthViewTests(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user('alice', email='alice@example.com', password='banana-split')
+
+    def post(self, path, data):
+        return self.client.post(path, json.dumps(data), content_type='application/json')
+
+    def test_login_returns_a_token_pair(self):
+        response = self.post('/banana/login/', {'username': 'alice', 'password': 'banana-split'})
+        self.assertEqual(response.status_code, 200)
+        body = response.json()
+        self.assertEqual(sorted(body), ['access', 'refresh', 'username'])
+        self.assertEqual(body['username'], 'alice')
+        self.assertEqual(str(AccessToken(body['access'])['user_id']), str(self.user.pk))
+
+    def test_wrong_password_and_unknown_user_look_the_same(self):
+        wrong = self.post('/banana/login/', {'username': 'alice', 'password': 'not-it'})
+        unknown = self.post('/banana/login/', {'username': 'nobody', 'password': 'banana-split'})
+        self.assertEqual((wrong.status_code, unknown.status_code), (400, 400))
+        self.assertEqual(wrong.json(), unknown.json())
+        self.assertEqual(self.post('/banana/login/', {'username': 'alice'}).status_code, 400)
+
+    def test_register_validates_then_creates_the_player(self):
+        invalid = [
+            ({'username': 'al', 'email': 'x@example.com', 'password': 'secret1', 'confirm_password': 'secret1'}, 'username'),
+            ({'username': 'bobby', 'email': 'b@example.com', 'password': 'secret1', 'confirm_password': 'other1'}, 'confirm_password'),
+            ({'username': 'alice', 'email': 'new@example.com', 'password': 'secret1', 'confirm_password': 'secret1'}, 'username'),
+        ]
+        for data, field in invalid:
+            response = self.post('/banana/register/', data)
+            self.assertEqual(response.status_code, 400, data)
+            self.assertIn(field, response.json()['detail'])
+
+        response = self.post('/banana/register/', {
+            'username': 'bobby', 'email': 'bob@example.com', 'password': 'secret1', 'confirm_password': 'secret1',
+        })
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(sorted(response.json()), ['access', 'refresh', 'username'])
+        user = User.objects.get(username='bobby')
+        self.assertTrue(user.check_password('secret1'))
+        self.assertTrue(Player.objects.filter(user=user).exists())
+
+    def test_login_upgrades_an_outdated_hash(self):
+        User.objects.filter(pk=self.user.pk).update(
+            password=PBKDF2PasswordHasher().encode('banana-split', 'pepper', iterations=1000)
+        )
+        response = self.post('/banana/login/', {'username': 'alice', 'password': 'banana-split'})
+        self.assertEqual(response.status_code, 200)
+        self.user.refresh_from_db()
+        self.assertTrue(self.user.password.startswith('md5$'))
+        self.assertTrue(self.user.check_password('banana-split'))
+
+    @override_settings(PASSWORD_HASH_MAX_PENDING=0, PASSWORD_HASH_RETRY_AFTER=3)
+    def test_a_full_hashing_queue_answers_503(self):
+        for path, data in (
+            ('/banana/login/', {'username': 'alice', 'password': 'banana-split'}),
+            ('/banana/register/', {'username': 'bobby', 'email': 'bob@example.com', 'password': 'secret1', 'confirm_password': 'secret1'}),
+        ):
+            response = self.post(path, data)
+            self.assertEqual(response.status_code, 503, path)
+            self.assertEqual(response['Retry-After'], '3')
+        self.assertFalse(User.objects.filter(username='bobby').exists())
+
+
+@override_settings(CACHES=LOCMEM_CACHES, THROTTLES={}, PLAYER_WRITE_BEHIND=False)
+class SnapshotAuthTests(TestCase):
+
+    def setUp(self):
+        # Cached snapshots and revocations outlive the rolled-back rows whose pks get reused
+        for alias in settings.CACHES:
+            caches[alias].clear()
+        self.user = User.objects.create_user('snapshot', password=None)
+        Player.objects.create(user=self.user, hints=10)
+        self.client = APIClient(SERVER_NAME='localhost')
+        self.authorize(AccessToken.for_user(self.user))
+
+    def authorize(self, token):
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {token}')
+
+    def answer(self, answer):
+        puzzle_sessions.issue(self.user.pk, dict(PUZZLE))
+        return self.client.post('/banana/check-puzzle/', {'answer': answer}, format='json')
+
+    def test_deactivating_a_user_drops_their_snapshot(self):
+        self.assertEqual(self.client.get('/banana/player/').status_code, 200)
+        self.user.is_active = False
+        self.user.save()
+        self.assertEqual(self.client.get('/banana/player/').status_code, 401)
+
+    def test_logout_all_refuses_earlier_access_tokens(self):
+        earlier = AccessToken.for_user(self.user)
+        earlier['iat'] = int(time.time()) - 10
+        self.authorize(earlier)
+        self.assertEqual(self.client.get('/banana/player/').status_code, 200)
+        self.assertEqual(self.client.post('/banana/logout-all/').status_code, 205)
+        self.assertEqual(self.client.get('/banana/player/').status_code, 401)
+
+        time.sleep(1)  # iat has whole seconds; tokens issued in the revocation's second still pass
+        self.authorize(AccessToken.for_user(self.user))
+        self.assertEqual(self.client.get('/banana/player/').status_code, 200)
+
+    def test_event_stream_refuses_tokens_the_api_refuses(self):
+        earlier = AccessToken.for_user(self.user)
+        earlier['iat'] = int(time.time()) - 10
+        revocation.revoke_all(self.user)
+        self.assertEqual(self.client.get('/banana/events/', {'token': str(earlier)}).status_code, 401)
+
+        self.user.is_active = False
+        self.user.save()
+        fresh = AccessToken.for_user(self.user)
+        self.assertEqual(self.client.get('/banana/events/', {'token': str(fresh)}).status_code, 401)
+
+    def test_a_stale_player_snapshot_is_read_again(self):
+        self.assertTrue(self.answer('7').json()['correct'])
+        # Changed behind the snapshot's back, with the version bump every writer makes
+        Player.objects.filter(user=self.user).update(xp=F('xp') + 1000, version=F('version') + 1)
+        with self.assertNumQueries(7):  # the guarded UPDATE misses, then a fresh read and a retry
+            result = progress.record_correct(self.user, time_taken=10)
+        player = Player.objects.get(user=self.user)
+        self.assertEqual(result['combo'], 2)
+        self.assertEqual(player.combo_count, 2)
+        # level is worked out from the re-read xp, not the snapshot's
+        self.assertEqual(player.level, scoring.level_for_xp(player.xp))
+        self.assertGreater(player.level, 1)
+        self.assertEqual(snapshots.get_player(self.user.pk, progress.STATE_FIELDS).version, player.version)
+
+    def test_query_counts_with_warm_snapshots(self):
+        self.answer('7')
+        self.client.get('/banana/player/')
+        with self.assertNumQueries(1):  # Player
+            self.assertEqual(self.client.get('/banana/player/').status_code, 200)
+        with self.assertNumQueries(3):  # the guarded UPDATE in its transaction
+            self.assertTrue(self.answer('7').json()['correct'])
+        with self.assertNumQueries(1):  # resetting the combo
+            self.assertFalse(self.answer('4').json()['correct'])
+        puzzle_sessions.issue(self.user.pk, dict(PUZZLE))
+        with self.assertNumQueries(4):  # spending the hint and reading what is left, in one transaction
+            self.assertEqual(self.client.post('/banana/use-hint/').status_code, 200)
+
+
+@override_settings(CACHES=LOCMEM_CACHES, THROTTLES={})
+class RevocationTests(TestCase):
+
+    def setUp(self):
+        # Cached snapshots and revocations outlive the rolled-back rows whose pks get reused
+        for alias in settings.CACHES:
+            caches[alias].clear()
+        self.user = User.objects.create_user('revoked', password=None)
+        self.client = APIClient(SERVER_NAME='localhost')
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(self.user)}')
+
+    def refresh(self, token):
+        return self.client.post('/banana/token/refresh/', {'refresh': str(token)}, format='json')
+
+    def test_logout_all_refuses_every_refresh_token(self):
+        tokens = [RefreshToken.for_user(self.user) for _ in range(3)]
+        other = RefreshToken.for_user(User.objects.create_user('bystander', password=None))
+        for token in tokens:  # warm the cached "not blacklisted" answers
+            self.assertEqual(self.refresh(token).status_code, 200)
+
+        self.assertEqual(self.client.post('/banana/logout-all/').status_code, 205)
+
+        self.assertEqual(BlacklistedToken.objects.filter(token__user=self.user).count(), 3)
+        for token in tokens:
+            self.assertEqual(self.refresh(token).status_code, 401)
+        self.assertEqual(self.refresh(other).status_code, 200)
+
+    def test_logout_refuses_the_token_at_once(self):
+        token = RefreshToken.for_user(self.user)
+        kept = RefreshToken.for_user(self.user)
+        self.assertEqual(self.refresh(token).status_code, 200)
+
+        response = self.client.post('/banana/logout/', {'refresh': str(token)}, format='json')
+
+        self.assertEqual(response.status_code, 205)
+        self.assertEqual(self.refresh(token).status_code, 401)
+        self.assertEqual(self.refresh(kept).status_code, 200)
+
+    def test_prune_deletes_only_expired_tokens_and_old_revocations(self):
+        now = timezone.now()
+        lifetime = settings.SIMPLE_JWT['REFRESH_TOKEN_LIFETIME']
+        expired = [
+            OutstandingToken.objects.create(user=self.user, jti=f'expired-{n}', token='', expires_at=now - datetime.timedelta(hours=1))
+            for n in range(2)
+        ]
+        BlacklistedToken.objects.create(token=expired[0])
+        live = RefreshToken.for_user(self.user)
+        revocation.revoke(live)
+        recent = User.objects.create_user('recent', password=None)
+        SessionRevocation.objects.create(user=self.user, revoked_before=now - lifetime - datetime.timedelta(minutes=1))
+        SessionRevocation.objects.create(user=recent, revoked_before=now - datetime.timedelta(minutes=1))
+
+        stdout = io.StringIO()
+        call_command('prune_tokens', chunk_size=1, stdout=stdout)
+
+        self.assertIn('Pruned 2 outstanding tokens, 1 blacklist entries and 1 revocations', stdout.getvalue())
+        self.assertEqual(list(OutstandingToken.objects.values_list('jti', flat=True)), [live['jti']])
+        self.assertTrue(BlacklistedToken.objects.filter(token__jti=live['jti']).exists())
+        self.assertEqual(list(SessionRevocation.objects.values_list('user_id', flat=True)), [recent.pk])
+
+
+@override_settings(CACHES=LOCMEM_CACHES, THROTTLES={}, MAX_SUBMITTED_SCORE=1000)
+class SubmitScoreTests(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user('scorer', password=None)
+        self.client = APIClient(SERVER_NAME='localhost')
+        self.client.force_authenticate(self.user)
+        self.addCleanup(rank_index.invalidate)
+
+    def test_accepts_scores_in_range(self):
+        response = self.client.post('/banana/submit-score/', {'score': 1000}, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(LeaderboardEntry.objects.get(user=self.user).best_score, 1000)
+
+    def test_rejects_out_of_range_and_malformed_scores(self):
+        for score in (10 ** 10, -1, 'lots', None, [5]):
+            response = self.client.post('/banana/submit-score/', {'score': score}, format='json')
+            self.assertEqual(response.status_code, 400, score)
+        self.assertFalse(Score.objects.exists())
+
+
+@override_settings(CACHES=LOCMEM_CACHES, THROTTLES={})
+class LeaderboardTests(TestCase):
+
+    def setUp(self):
+        self.users = [User.objects.create_user(f'player{n}', password=None) for n in range(5)]
+        self.addCleanup(rank_index.invalidate)
+
+    def test_record_score_only_raises_the_best(self):
+        user = self.users[0]
+        self.assertTrue(leaderboard.record_score(user, 50))
+        self.assertFalse(leaderboard.record_score(user, 40))
+        self.assertEqual(LeaderboardEntry.objects.get(user=user).best_score, 50)
+        self.assertTrue(leaderboard.record_score(user, 70))
+        self.assertEqual(LeaderboardEntry.objects.get(user=user).best_score, 70)
+
+    def test_top_orders_by_score_then_user(self):
+        for user, score in zip(self.users, (30, 50, 30)):
+            leaderboard.record_score(user, score)
+        self.assertEqual(leaderboard.top(), [
+            {'username': 'player1', 'score': 50},
+            {'username': 'player0', 'score': 30},
+            {'username': 'player2', 'score': 30},
+        ])
+        self.assertEqual(leaderboard.top(n=1), [{'username': 'player1', 'score': 50}])
+
+    def test_windows_only_hold_their_own_day_and_week(self):
+        leaderboard.record_score(self.users[0], 90, when=timezone.now() - datetime.timedelta(days=10))
+        leaderboard.record_score(self.users[1], 20)
+        self.assertEqual([entry['username'] for entry in leaderboard.top()], ['player0', 'player1'])
+        for window in ('day', 'week'):
+            self.assertEqual(leaderboard.top(window=window), [{'username': 'player1', 'score': 20}])
+
+    def test_pages_walk_the_whole_board(self):
+        for user, score in zip(self.users, (10, 20, 20, 30, 40)):
+            leaderboard.record_score(user, score)
+        rows, cursor, pages = [], None, 0
+        while True:
+            page, cursor = leaderboard.page(cursor, size=2)
+            rows += page
+            pages += 1
+            if cursor is None:
+                break
+        self.assertEqual(pages, 3)
+        self.assertEqual(rows, leaderboard.top(n=10))
+
+        _, cursor = leaderboard.page(size=2)
+        with self.assertRaises(ValueError):
+            leaderboard.page(cursor, size=2, window='day')
+        with self.assertRaises(ValueError):
+            leaderboard.page('not-a-cursor', size=2)
+
+    def test_rebuild_matches_the_score_table(self):
+        Score.objects.bulk_create(
+            Score(user=user, score=score) for user, score in zip(self.users * 2, range(10, 110, 10))
+        )
+        self.assertEqual(leaderboard.rebuild(chunk_size=2), 5)
+        self.assertEqual(
+            dict(LeaderboardEntry.objects.values_list('user__username', 'best_score')),
+            {f'player{n}': 60 + n * 10 for n in range(5)},
+        )
+        self.assertEqual(leaderboard.top(n=1, window='day'), [{'username': 'player4', 'score': 100}])
+
+    def test_leaderboard_view_revalidates_with_the_etag(self):
+        client = APIClient(SERVER_NAME='localhost')
+        leaderboard.record_score(self.users[0], 10)
+        response = client.get('/banana/leaderboard/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(json.loads(response.content), [{'username': 'player0', 'score': 10}])
+        etag = response['ETag']
+        self.assertEqual(client.get('/banana/leaderboard/', HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        leaderboard.record_score(self.users[1], 20)
+        response = client.get('/banana/leaderboard/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(json.loads(response.content)[0], {'username': 'player1', 'score': 20})
+
+
+class HeldExecutor:
+    """Stands in for the certificate process pool: runs the submitted jobs inline when told to"""
+
+    def __init__(self):
+        self.jobs = []
+
+    def submit(self, fn, *args):
+        future = Future()
+        self.jobs.append((future, fn, args))
+        return future
+
+    def run(self):
+        jobs, self.jobs = self.jobs, []
+        for future, fn, args in jobs:
+            future.set_result(fn(*args))
+
+
+@override_settings(CACHES=LOCMEM_CACHES, THROTTLES={}, CERTIFICATE_WORKERS=1)
+class CertificateJobTests(TestCase):
+
+    def setUp(self):
+        root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, root, ignore_errors=True)
+        overrides = override_settings(CERTIFICATE_CACHE_ROOT=root)
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+        caches[settings.CERTIFICATE_JOB_CACHE].clear()
+        self.executor = HeldExecutor()
+        patcher = mock.patch.object(certificate_jobs, '_get_executor', return_value=self.executor)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(certificate_jobs._futures.clear)
+        self.addCleanup(rank_index.invalidate)
+        rank_index.invalidate()
+
+        self.user = User.objects.create_user('champion', password=None)
+        leaderboard.record_score(self.user, 900)
+        self.client = APIClient(SERVER_NAME='localhost')
+        self.client.force_authenticate(self.user)
+
+    def start(self):
+        response = self.client.post('/banana/certificate/')
+        self.assertEqual(response.status_code, 202)
+        return response.json()
+
+    def test_identical_requests_share_one_job(self):
+        first, second = self.start(), self.start()
+        self.assertEqual(first['job_id'], second['job_id'])
+        self.assertEqual(len(self.executor.jobs), 1)
+
+    def test_poll_until_done_then_download(self):
+        job = self.start()
+        status_path = f"/banana/certificate/{job['job_id']}/"
+        self.assertEqual(self.client.get(status_path).json()['status'], certificate_jobs.PENDING)
+        self.assertEqual(self.client.get(f'{status_path}download/').status_code, 409)
+
+        self.executor.run()
+        polled = self.client.get(status_path).json()
+        self.assertEqual(polled['status'], certificate_jobs.DONE)
+        self.assertTrue(polled['download_url'].endswith(f'{status_path}download/'))
+
+        response = self.client.get(f'{status_path}download/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'application/pdf')
+        self.assertIn(certificates.filename('champion', 1), response['Content-Disposition'])
+        content = b''.join(response.streaming_content)
+        path = certificates.cached(self.user.pk, 1, 900, timezone.localdate())
+        self.assertEqual(content, path.read_bytes())
+        self.assertTrue(content.startswith(b'%PDF'))
+
+        # Rendered once: a new request for the same certificate is answered from the disk cache
+        self.assertEqual(self.client.post('/banana/certificate/').json()['status'], certificate_jobs.DONE)
+        self.assertEqual(self.executor.jobs, [])
+
+    def test_refuses_another_players_job(self):
+        job = self.start()
+        self.executor.run()
+        other = User.objects.create_user('onlooker', password=None)
+        self.client.force_authenticate(other)
+        self.assertEqual(self.client.get(f"/banana/certificate/{job['job_id']}/").status_code, 404)
+        self.assertEqual(self.client.get(f"/banana/certificate/{job['job_id']}/download/").status_code, 404)
+
+    @override_settings(CERTIFICATE_MAX_PENDING=0)
+    def test_full_queue_answers_503(self):
+        response = self.client.post('/banana/certificate/')
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response['Retry-After'], '5')
+        self.assertEqual(self.executor.jobs, [])
+
+
+class CertificateTests(SimpleTestCase):
+    DATE = datetime.date(2026, 1, 2)
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root, ignore_errors=True)
+
+    def test_each_rank_reuses_its_layout(self):
+        certificates._layout_stream.cache_clear()
+        for rank in (1, 2, 3, 17):
+            with self.subTest(rank=rank):
+                first = certificates.render('champion', rank, 900, self.DATE)
+                second = certificates.render('runner', rank, 800, self.DATE)
+                self.assertTrue(first.startswith(b'%PDF'))
+                self.assertNotEqual(first, second)
+        info = certificates._layout_stream.cache_info()
+        self.assertEqual((info.misses, info.hits), (4, 4))
+
+    def test_cache_evicts_the_least_recently_used(self):
+        contents = {user_id: certificates.render(f'player{user_id}', 1, 100, self.DATE) for user_id in (1, 2, 3)}
+        overrides = override_settings(
+            CERTIFICATE_CACHE_ROOT=self.root, CERTIFICATE_CACHE_MAX_BYTES=sum(map(len, contents.values())) - 1,
+        )
+        with overrides, mock.patch.object(certificates, '_cached_bytes', None):
+            now = time.time()
+            for user_id, age in ((1, 100), (2, 50)):
+                certificates.store(user_id, 1, 100, self.DATE, contents[user_id])
+                os.utime(certificates.path_for(user_id, 1, 100, self.DATE), (now - age, now - age))
+            # Reading player 1's certificate makes player 2's the least recently used
+            user = User(pk=1, username='player1')
+            self.assertEqual(certificates.get_certificate(user, 1, 100, self.DATE), contents[1])
+
+            certificates.store(3, 1, 100, self.DATE, contents[3])
+
+            self.assertIsNotNone(certificates.cached(1, 1, 100, self.DATE))
+            self.assertIsNone(certificates.cached(2, 1, 100, self.DATE))
+            self.assertIsNotNone(certificates.cached(3, 1, 100, self.DATE))
+
+    def test_render_certificates_writes_a_zip_with_a_manifest(self):
+        source = os.path.join(self.root, 'winners.csv')
+        with open(source, 'w', newline='', encoding='utf-8') as handle:
+            handle.write("username,rank,score,category\nchampion,1,900,spring cup\nrunner,2,800,\n")
+        archive = os.path.join(self.root, 'certificates.zip')
+
+        call_command(
+            'render_certificates', input=source, zip=archive, date=self.DATE, workers=1, stdout=io.StringIO(),
+        )
+
+        with zipfile.ZipFile(archive) as rendered:
+            self.assertEqual(
+                sorted(rendered.namelist()),
+                ['list/002-runner.pdf', 'manifest.csv', 'spring_cup/001-champion.pdf'],
+            )
+            manifest = list(csv.DictReader(io.StringIO(rendered.read('manifest.csv').decode())))
+            self.assertEqual(
+                [(row['file'], row['rank'], row['username'], row['score'], row['date']) for row in manifest],
+                [
+                    ('spring_cup/001-champion.pdf', '1', 'champion', '900', '2026-01-02'),
+                    ('list/002-runner.pdf', '2', 'runner', '800', '2026-01-02'),
+                ],
+            )
+            for row in manifest:
+                content = rendered.read(row['file'])
+                self.assertTrue(content.startswith(b'%PDF'))
+                self.assertEqual(int(row['bytes']), len(content))
+
+
+class UserImportTests(TestCase):
+
+    def test_non_string_fields_are_reported_not_fatal(self):
+        lines = [
+            '{"username": 123, "email": "a@example.com"}',
+            '{"username": "bob", "email": ["b@example.com"]}',
+            '{"username": "carol", "email": "c@example.com", "password": 12345678}',
+            '{"username": "dave", "email": "d@example.com", "password": null}',
+            '{"username": "erin", "email": "e@example.com", "password": "banana-split"}',
+        ]
+        rows = user_import.read_rows(io.StringIO("\n".join(lines)), 'ndjson')
+        accepted, errors = user_import.validate(rows, set(), set())
+        self.assertEqual([row['username'] for row in accepted], ['dave', 'erin'])
+        self.assertEqual(errors, [
+            (1, "Username must be a string"),
+            (2, "Email must be a string"),
+            (3, "Password must be a string"),
+        ])
+
+        with tempfile.NamedTemporaryFile('w', suffix='.ndjson') as stream:
+            stream.write("\n".join(lines))
+            stream.flush()
+            out, err = io.StringIO(), io.StringIO()
+            call_command('import_users', stream.name, '--dry-run', stdout=out, stderr=err)
+        self.assertIn("Would create 2 of 5 users (3 rejected)", out.getvalue())
+        self.assertIn("line 1: Username must be a string", err.getvalue())
+
+
+class ThrottleCacheTests(SimpleTestCase):
+
+    def test_refuses_caches_without_an_atomic_incr(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        for backend in ('filebased.FileBasedCache', 'db.DatabaseCache', 'dummy.DummyCache'):
+            throttle = {'BACKEND': f'django.core.cache.backends.{backend}', 'LOCATION': directory}
+            with self.subTest(backend), override_settings(CACHES=dict(LOCMEM_CACHES, throttle=throttle)):
+                self.assertEqual([error.id for error in throttling.check_cache(None)], ['Banana.E001'])
+                with self.assertRaises(ImproperlyConfigured):
+                    throttling.ThrottleMiddleware(lambda request: None)
+                with override_settings(THROTTLES={}):
+                    self.assertEqual(throttling.check_cache(None), [])
+
+    def test_accepts_the_configured_cache(self):
+        self.assertEqual(throttling.check_cache(None), [])
+
+
+class FakeBananaAPI(BaseHTTPRequestHandler):
+    """Stand-in for api.php; `mode` picks the answer: ok, error (500), redirect (a loop) or garbage"""
+    mode = 'ok'
+    hits = 0
+
+    def do_GET(self):
+        type(self).hits += 1
+        if self.mode == 'redirect':
+            self.send_response(302)
+            self.send_header('Location', self.path)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        if self.mode == 'error':
+            body, code = b'upstream trouble', 500
+        elif self.mode == 'garbage':
+            body, code = b'<html>not json', 200
+        else:
+            body, code = json.dumps({'question': 'https://example.com/q.png', 'solution': 4}).encode(), 200
+        self.send_response(code)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def serve_fake_api(test_class):
+    """Start a FakeBananaAPI for the test class and return its api.php URL"""
+    server = ThreadingHTTPServer(('127.0.0.1', 0), FakeBananaAPI)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    test_class.addClassCleanup(server.server_close)
+    test_class.addClassCleanup(server.shutdown)
+    return f'http://127.0.0.1:{server.server_address[1]}/api.php'
+
+
+class UpstreamClientTests(SimpleTestCase):
+    RESET = 0.2
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.url = serve_fake_api(cls)
+
+    def setUp(self):
+        quiet_logs(self)
+        FakeBananaAPI.mode = 'ok'
+        FakeBananaAPI.hits = 0
+        self.client = upstream.UpstreamClient(
+            self.url, retries=0, timeout=2.0,
+            breaker=upstream.CircuitBreaker(failure_threshold=2, reset_timeout=self.RESET),
+        )
+        self.addCleanup(self.client.session.close)
+
+    def open_breaker(self):
+        FakeBananaAPI.mode = 'error'
+        for _ in range(2):
+            with self.assertRaises(requests.HTTPError):
+                self.client.fetch_puzzle()
+        self.assertEqual(self.client.breaker.state, upstream.CircuitBreaker.OPEN)
+
+    def test_fetches_over_a_kept_alive_connection(self):
+        for _ in range(3):
+            self.assertEqual(self.client.fetch_puzzle()['solution'], 4)
+        metrics = self.client.metrics()
+        self.assertEqual(metrics['requests'], 3)
+        self.assertEqual(metrics['open_connections'], 1)
+        self.assertEqual(metrics['breaker']['state'], upstream.CircuitBreaker.CLOSED)
+
+    def test_retries_server_errors(self):
+        self.client.retries = 2
+        self.client.backoff = 0
+        FakeBananaAPI.mode = 'error'
+        with self.assertRaises(requests.HTTPError):
+            self.client.fetch_puzzle()
+        self.assertEqual(FakeBananaAPI.hits, 3)
+
+    def test_opens_then_half_opens_then_closes(self):
+        self.open_breaker()
+        hits = FakeBananaAPI.hits
+        with self.assertRaises(upstream.CircuitOpenError):
+            self.client.fetch_puzzle()
+        self.assertEqual(FakeBananaAPI.hits, hits)
+
+        time.sleep(self.RESET * 1.5)
+        self.assertEqual(self.client.breaker.state, upstream.CircuitBreaker.HALF_OPEN)
+        FakeBananaAPI.mode = 'ok'
+        self.assertEqual(self.client.fetch_puzzle()['solution'], 4)
+        self.assertEqual(self.client.breaker.state, upstream.CircuitBreaker.CLOSED)
+
+    def test_failed_probe_opens_again(self):
+        self.open_breaker()
+        time.sleep(self.RESET * 1.5)
+        with self.assertRaises(requests.HTTPError):
+            self.client.fetch_puzzle()
+        self.assertEqual(self.client.breaker.state, upstream.CircuitBreaker.OPEN)
+
+    def test_any_request_error_releases_the_probe(self):
+        for mode, error in (('redirect', requests.TooManyRedirects), ('garbage', ValueError)):
+            with self.subTest(mode=mode):
+                self.open_breaker()
+                time.sleep(self.RESET * 1.5)
+                FakeBananaAPI.mode = mode
+                with self.assertRaises(error):
+                    self.client.fetch_puzzle()
+                self.assertEqual(self.client.breaker.state, upstream.CircuitBreaker.OPEN)
+                # Not stuck: once the reset timeout passes again, a probe goes out and closes it
+                time.sleep(self.RESET * 1.5)
+                FakeBananaAPI.mode = 'ok'
+                self.assertEqual(self.client.fetch_puzzle()['solution'], 4)
+                self.assertEqual(self.client.breaker.state, upstream.CircuitBreaker.CLOSED)
+
+
+@override_settings(
+    CACHES=LOCMEM_CACHES, THROTTLES={}, PUZZLE_SOURCE='upstream', PUZZLE_IMAGE_STORE=False,
+    PUZZLE_POOL_LOW_WATERMARK=3, PUZZLE_POOL_HIGH_WATERMARK=6,
+)
+class PuzzlePoolTests(TransactionTestCase):
+    """The pool against a FakeBananaAPI; a TransactionTestCase so the refill thread sees the rows"""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.url = serve_fake_api(cls)
+
+    def setUp(self):
+        quiet_logs(self)
+        FakeBananaAPI.mode = 'ok'
+        FakeBananaAPI.hits = 0
+        configured_client = upstream._client
+        upstream._client = upstream.UpstreamClient(self.url, retries=0, timeout=2.0)
+        self.addCleanup(setattr, upstream, '_client', configured_client)
+        self.addCleanup(upstream._client.session.close)
+
+    def wait_for_refill(self):
+        thread = puzzle_pool._refill_thread
+        if thread is not None:
+            thread.join(timeout=10)
+
+    def test_refills_in_the_background_below_the_low_watermark(self):
+        PooledPuzzle.objects.bulk_create(PooledPuzzle(data=dict(PUZZLE)) for _ in range(4))
+        self.assertEqual(puzzle_pool.pop_puzzle(), PUZZLE)
+        self.wait_for_refill()
+        # Still at the low watermark: nothing fetched
+        self.assertEqual(FakeBananaAPI.hits, 0)
+
+        self.assertEqual(puzzle_pool.pop_puzzle(), PUZZLE)
+        self.wait_for_refill()
+        self.assertEqual(PooledPuzzle.objects.count(), 6)
+        self.assertEqual(FakeBananaAPI.hits, 4)
+        self.assertEqual(PooledPuzzle.objects.order_by('-pk').first().data['solution'], 4)
+
+    @override_settings(PUZZLE_POOL_LOW_WATERMARK=0, PUZZLE_LOCAL_FALLBACK=False)
+    def test_fetch_puzzle_falls_back_to_the_api_when_the_pool_is_empty(self):
+        client = APIClient(SERVER_NAME='localhost')
+        client.force_authenticate(User.objects.create_user('player', password=None))
+        response = client.get('/banana/puzzle/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(FakeBananaAPI.hits, 1)
+        self.assertIn('puzzle_id', response.json())
+        self.assertNotIn('solution', response.json())
+
+        FakeBananaAPI.mode = 'error'
+        self.assertEqual(client.get('/banana/puzzle/').status_code, 502)
+
+
+@override_settings(
+    CACHES=LOCMEM_CACHES, THROTTLES={}, EMAIL_OUTBOX_SENDER_THREAD=False,
+    EMAIL_BACKEND='django.core.mail.backends.locmem.EmailBackend',
+)
+class OutboxTests(TestCase):
+
+    def setUp(self):
+        quiet_logs(self)
+
+    def drain(self):
+        return outbox.drain(get_connection())
+
+    def test_otp_mail_is_deleted_once_sent(self):
+        User.objects.create_user('otp-player', email='otp@example.com', password=None)
+        client = APIClient(SERVER_NAME='localhost')
+        response = client.post('/banana/login/request-otp/', {'email': 'otp@example.com'}, format='json')
+        self.assertEqual(response.status_code, 200)
+        queued = EmailOutbox.objects.get()
+        self.assertTrue(queued.sensitive)
+
+        self.assertEqual(self.drain(), (1, 0))
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertIn('Your OTP for Banana Game login is', mail.outbox[0].body)
+        self.assertFalse(EmailOutbox.objects.exists())
+
+    def test_sent_mail_keeps_no_body(self):
+        outbox.enqueue('Thanks', 'Thank you for your review', ['player@example.com'])
+        self.assertEqual(self.drain(), (1, 0))
+        sent = EmailOutbox.objects.get()
+        self.assertEqual((sent.status, sent.body), (EmailOutbox.SENT, ''))
+        self.assertEqual(mail.outbox[0].body, 'Thank you for your review')
+
+    @override_settings(EMAIL_OUTBOX_MAX_ATTEMPTS=1, EMAIL_BACKEND='django.core.mail.backends.smtp.EmailBackend',
+                       EMAIL_HOST='127.0.0.1', EMAIL_PORT=9, EMAIL_USE_TLS=False, EMAIL_TIMEOUT=1)
+    def test_undeliverable_otp_mail_loses_its_body(self):
+        outbox.enqueue('Code', 'Your OTP is 123456', ['player@example.com'], sensitive=True)
+        self.assertEqual(self.drain(), (0, 1))
+        failed = EmailOutbox.objects.get()
+        self.assertEqual((failed.status, failed.body), (EmailOutbox.FAILED, ''))
+
+    def test_admin_hides_sensitive_bodies(self):
+        model_admin = admin_site._registry[EmailOutbox]
+        request = RequestFactory().get('/')
+        request.user = User(is_staff=True, is_superuser=True)
+        otp = outbox.enqueue('Code', 'Your OTP is 123456', ['player@example.com'], sensitive=True)
+        other = outbox.enqueue('Thanks', 'Thank you', ['player@example.com'])
+        self.assertNotIn('body', model_admin.get_form(request, otp).base_fields)
+        self.assertIn('body', model_admin.get_form(request, other).base_fields)
@@ -0,0 +1,217 @@
+"""
+Per-route request throttling.
+
+THROTTLES maps URL names from Banana/urls.py to limits per scope:
+
+    THROTTLES = {
+        'request-email-otp': {'ip': (20, 60 * 60), 'email': (5, 15 * 60)},
+    }
+
+allows 20 requests an hour from one address and 5 every 15 minutes for one
+email. Scopes are 'ip' (REMOTE_ADDR), 'user' (the user id in the JWT access
+token, read without touching the database) and 'email' (the email field of
+the request body). ThrottleMiddleware checks them in process_view, before the
+view runs, so a rejected request costs a few cache operations and no database
+or network work. It is answered 429 with a Retry-After header.
+
+Each limit is a sliding window, approximated from two fixed-window counters
+in the THROTTLE_CACHE alias: the current window's count plus the previous
+window's, weighted by how much of it the sliding window still covers. That
+needs two counters per key whatever the limit. Rejected requests are not
+counted, so a client that keeps retrying gets in again once its earlier
+requests age out. If the cache is unavailable requests are let through.
+
+The counters rely on an atomic cache incr(). Redis, Memcached and LocMemCache
+have one (LocMemCache counts per process, so each worker enforces the limits
+on its own); the file and database backends read and rewrite the value, which
+loses counts under concurrent requests, so check_cache() and the middleware
+refuse them at startup.
+"""
+import hashlib
+import json
+import logging
+import math
+import time
+
+from django.conf import settings
+from django.core import checks
+from django.core.cache import caches
+from django.core.cache.backends.db import DatabaseCache
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.filebased import FileBasedCache
+from django.core.exceptions import ImproperlyConfigured
+from django.http import JsonResponse
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.settings import api_settings as jwt_settings
+from rest_framework_simplejwt.tokens import AccessToken
+
+logger = logging.getLogger(__name__)
+
+SCOPES = ('ip', 'user', 'email')
+
+# Backends whose incr() is a get followed by a set, or that keep nothing
+NON_ATOMIC_BACKENDS = (FileBasedCache, DatabaseCache, DummyCache)
+
+
+def rules():
+    return getattr(settings, 'THROTTLES', {})
+
+
+def _cache():
+    return caches[getattr(settings, 'THROTTLE_CACHE', 'default')]
+
+
+def check_cache(app_configs, **kwargs):
+    """System check: THROTTLES needs a THROTTLE_CACHE backend that counts atomically"""
+    if not rules():
+        return []
+    alias = getattr(settings, 'THROTTLE_CACHE', 'default')
+    try:
+        cache = caches[alias]
+    except Exception as exc:
+        return [checks.Error(f"THROTTLE_CACHE {alias!r} is not usable: {exc}", id='Banana.E001')]
+    if isinstance(cache, NON_ATOMIC_BACKENDS):
+        return [checks.Error(
+            f"THROTTLE_CACHE {alias!r} uses {type(cache).__name__}, which cannot count requests atomically",
+            hint="Use LocMemCache (limits per process), RedisCache or a Memcached backend.",
+            id='Banana.E001',
+        )]
+    return []
+
+
+def _key(route, scope, ident, window, index):
+    # Hashed so emails are not stored as they are and keys stay short and safe for any backend
+    digest = hashlib.md5(ident.encode()).hexdigest()
+    return f'throttle:{route}:{scope}:{window}:{digest}:{index}'
+
+
+def _token_user_id(request):
+    parts = request.META.get('HTTP_AUTHORIZATION', '').split()
+    if len(parts) != 2 or parts[0] not in jwt_settings.AUTH_HEADER_TYPES:
+        return None
+    try:
+        # Checks the signature and expiry; the user row is not looked up
+        token = AccessToken(parts[1])
+    except TokenError:
+        return None
+    user_id = token.get(jwt_settings.USER_ID_CLAIM)
+    return None if user_id is None else str(user_id)
+
+
+def _body_email(request):
+    if request.content_type == 'application/json':
+        try:
+            data = json.loads(request.body or b'{}')
+        except ValueError:
+            return None
+        email = data.get('email') if isinstance(data, dict) else None
+    else:
+        email = request.POST.get('email')
+    if not isinstance(email, str) or not email.strip():
+        return None
+    return email.strip().lower()
+
+
+def identify(request, scope):
+    """The value requests are counted by for `scope`, or None if the request has none"""
+    if scope == 'ip':
+        return request.META.get('REMOTE_ADDR')
+    if scope == 'user':
+        return _token_user_id(request)
+    if scope == 'email':
+        return _body_email(request)
+    raise ImproperlyConfigured(f"Unknown throttle scope {scope!r}, expected one of {', '.join(SCOPES)}")
+
+
+def retry_after(previous, current, limit, window, offset):
+    """
+    Seconds until one more request fits under `limit`, given the previous and
+    current window counts and how far into the current window we are; 0 if
+    it fits now.
+    """
+    if previous * (1 - offset / window) + current + 1 <= limit:
+        return 0
+    if current + 1 <= limit:
+        # The previous window's share has to shrink as the sliding window moves off it
+        wait = window * (1 - (limit - 1 - current) / previous) - offset
+    else:
+        # Only once this window has ended and its count is itself fading out
+        wait = window - offset + window * (1 - (limit - 1) / current)
+    return max(1, math.ceil(wait))
+
+
+def check(request, route, limits, now=None):
+    """
+    Count the request against each of the route's limits. Returns 0 if it is
+    allowed, otherwise the seconds to wait (and nothing is counted).
+    """
+    now = time.time() if now is None else now
+    counters = []
+    for scope, (limit, window) in limits.items():
+        ident = identify(request, scope)
+        if ident is None:
+            continue
+        index, offset = divmod(now, window)
+        counters.append((
+            limit, window, offset,
+            _key(route, scope, ident, window, int(index) - 1),
+            _key(route, scope, ident, window, int(index)),
+        ))
+    if not counters:
+        return 0
+
+    cache = _cache()
+    counts = cache.get_many([key for counter in counters for key in counter[3:]])
+    wait = max(
+        retry_after(counts.get(previous, 0), counts.get(current, 0), limit, window, offset)
+        for limit, window, offset, previous, current in counters
+    )
+    if wait:
+        return wait
+    for _, window, _, _, current in counters:
+        _increment(cache, current, window)
+    return 0
+
+
+def _increment(cache, key, window):
+    # Kept for two windows: one as the current window and one as the previous
+    try:
+        cache.incr(key)
+    except ValueError:
+        if not cache.add(key, 1, 2 * window):
+            cache.incr(key)
+
+
+def throttled_response(wait):
+    response = JsonResponse(
+        {"detail": f"Request was throttled. Expected available in {wait} seconds."}, status=429
+    )
+    response['Retry-After'] = str(wait)
+    return response
+
+
+class ThrottleMiddleware:
+    """Applies THROTTLES to the routes named in it before their views run"""
+
+    def __init__(self, get_response):
+        # System checks don't run under an ASGI server, so refuse to start here too
+        for error in check_cache(None):
+            raise ImproperlyConfigured(f"{error.msg}. {error.hint or ''}".strip())
+        self.get_response = get_response
+
+    def __call__(self, request):
+        return self.get_response(request)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        match = request.resolver_match
+        limits = rules().get(match.url_name) if match else None
+        if not limits:
+            return None
+        try:
+            wait = check(request, match.url_name, limits)
+        except ImproperlyConfigured:
+            raise
+        except Exception as exc:
+            logger.warning("Throttle check for %s failed, letting the request through: %s", match.url_name, exc)
+            return None
+        return throttled_response(wait) if wait else None
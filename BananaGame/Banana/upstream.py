@@ -0,0 +1,218 @@
+"""
+Shared client for the external Banana puzzle API.
+
+All upstream calls go through one requests.Session so connections are kept
+alive and pooled. Concurrency is capped with a semaphore, transient failures
+are retried with jittered exponential backoff, and a circuit breaker fails
+fast while the upstream is down instead of letting every worker pile up on it.
+"""
+import logging
+import random
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PUZZLE_API_URL = 'https://marcconrad.com/uob/banana/api.php'
+
+
+class CircuitOpenError(requests.RequestException):
+    """Raised without touching the network while the breaker is open"""
+
+
+class UpstreamBusyError(requests.RequestException):
+    """Raised when every upstream slot stays busy for longer than the acquire timeout"""
+
+
+class CircuitBreaker:
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, failure_threshold=5, reset_timeout=30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._lock = threading.Lock()
+        self._state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+
+    @property
+    def state(self):
+        with self._lock:
+            if self._state == self.OPEN and time.monotonic() - self._opened_at >= self.reset_timeout:
+                return self.HALF_OPEN
+            return self._state
+
+    def allow(self):
+        """Return True if a call may go out. Half-open lets a single probe through."""
+        with self._lock:
+            if self._state == self.CLOSED:
+                return True
+            if self._state == self.OPEN:
+                if time.monotonic() - self._opened_at < self.reset_timeout:
+                    return False
+                self._state = self.HALF_OPEN
+            if self._probe_in_flight:
+                return False
+            self._probe_in_flight = True
+            return True
+
+    def record_success(self):
+        with self._lock:
+            self._state = self.CLOSED
+            self._failures = 0
+            self._probe_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            self._probe_in_flight = False
+            if self._state == self.HALF_OPEN or self._failures >= self.failure_threshold:
+                if self._state != self.OPEN:
+                    logger.warning("Upstream circuit breaker opened after %s failures", self._failures)
+                self._state = self.OPEN
+                self._opened_at = time.monotonic()
+
+    def snapshot(self):
+        state = self.state
+        with self._lock:
+            return {'state': state, 'consecutive_failures': self._failures}
+
+
+class UpstreamClient:
+    def __init__(self, url, pool_size=10, max_concurrency=10, retries=2, backoff=0.2,
+                 timeout=5.0, acquire_timeout=1.0, breaker=None):
+        self.url = url
+        self.retries = retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self.acquire_timeout = acquire_timeout
+        self.breaker = breaker or CircuitBreaker()
+        self.session = requests.Session()
+        # Retries are handled here so they count against the breaker, not inside urllib3
+        self.adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_size, max_retries=0)
+        self.session.mount('http://', self.adapter)
+        self.session.mount('https://', self.adapter)
+        self._slots = threading.BoundedSemaphore(max_concurrency)
+        self._stats_lock = threading.Lock()
+        self._in_flight = 0
+        self._requests = 0
+        self._failures = 0
+        self._rejected = 0
+
+    def _count(self, field, delta=1):
+        with self._stats_lock:
+            setattr(self, field, getattr(self, field) + delta)
+
+    def _sleep_before_retry(self, attempt):
+        # Full jitter keeps retrying workers from synchronising on the upstream
+        time.sleep(random.uniform(0, self.backoff * (2 ** attempt)))
+
+    def get(self, url=None, decode=None, **kwargs):
+        """
+        GET through the pool, retrying connection errors, timeouts and 5xx
+        responses. Returns the response, or decode(response) if given; a body
+        that fails to decode counts against the breaker like any other failure.
+        """
+        if self.breaker.state == CircuitBreaker.OPEN:
+            self._count('_rejected')
+            raise CircuitOpenError("Upstream circuit breaker is open")
+        if not self._slots.acquire(timeout=self.acquire_timeout):
+            self._count('_rejected')
+            raise UpstreamBusyError("All upstream connections are busy")
+        if not self.breaker.allow():
+            self._slots.release()
+            self._count('_rejected')
+            raise CircuitOpenError("Upstream circuit breaker is open")
+        self._count('_in_flight')
+        settled = False
+        try:
+            attempt = 0
+            while True:
+                self._count('_requests')
+                try:
+                    res = self.session.get(url or self.url, timeout=self.timeout, **kwargs)
+                    if res.status_code < 500:
+                        res.raise_for_status()
+                        result = decode(res) if decode else res
+                        self.breaker.record_success()
+                        settled = True
+                        return result
+                    error = requests.HTTPError(f"Upstream returned {res.status_code}", response=res)
+                except (requests.ConnectionError, requests.Timeout, requests.exceptions.ChunkedEncodingError) as exc:
+                    error = exc
+                except requests.HTTPError:
+                    # 4xx means the request itself is wrong; retrying won't help
+                    self.breaker.record_success()
+                    settled = True
+                    raise
+                except requests.RequestException:
+                    # Redirect loops, bad URLs, undecodable bodies and the like: not worth retrying
+                    self._count('_failures')
+                    raise
+                self._count('_failures')
+                if attempt >= self.retries:
+                    raise error
+                attempt += 1
+                self._sleep_before_retry(attempt)
+        finally:
+            if not settled:
+                # Every other way out is a failure, which also frees the half-open probe
+                self.breaker.record_failure()
+            self._count('_in_flight', -1)
+            self._slots.release()
+
+    def fetch_puzzle(self):
+        return self.get(decode=requests.Response.json)
+
+    def open_connections(self):
+        """Idle keep-alive connections in the pool plus the ones currently in use"""
+        idle = 0
+        pools = self.adapter.poolmanager.pools
+        for key in list(pools.keys()):
+            pool = pools.get(key)
+            if pool is not None and pool.pool is not None:
+                idle += sum(1 for conn in list(pool.pool.queue) if conn is not None)
+        return idle + self._in_flight
+
+    def metrics(self):
+        with self._stats_lock:
+            stats = {
+                'in_flight': self._in_flight,
+                'requests': self._requests,
+                'failures': self._failures,
+                'rejected': self._rejected,
+            }
+        stats['open_connections'] = self.open_connections()
+        stats['breaker'] = self.breaker.snapshot()
+        return stats
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_client():
+    """Return the process-wide client for the Banana API, built from settings on first use"""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = UpstreamClient(
+                    url=getattr(settings, 'PUZZLE_API_URL', DEFAULT_PUZZLE_API_URL),
+                    pool_size=getattr(settings, 'PUZZLE_API_POOL_SIZE', 10),
+                    max_concurrency=getattr(settings, 'PUZZLE_API_MAX_CONCURRENCY', 10),
+                    retries=getattr(settings, 'PUZZLE_API_RETRIES', 2),
+                    timeout=getattr(settings, 'PUZZLE_API_TIMEOUT', 5.0),
+                    breaker=CircuitBreaker(
+                        failure_threshold=getattr(settings, 'PUZZLE_API_BREAKER_THRESHOLD', 5),
+                        reset_timeout=getattr(settings, 'PUZZLE_API_BREAKER_RESET_SECONDS', 30.0),
+                    ),
+                )
+    return _client
@@ -13,8 +13,14 @@ urlpatterns = [
     path('player/', views.player_detail, name='player-detail'),
     path('submit-score/', views.submit_score, name='submit-score'),
     path('leaderboard/', views.leaderboard, name='leaderboard'),
+    path('leaderboard/pages/', views.leaderboard_pages, name='leaderboard-pages'),
+    path('leaderboard/rank/', views.leaderboard_rank, name='leaderboard-rank'),
+    path('events/', views.event_stream, name='event-stream'),
     path('puzzle/', views.fetch_puzzle, name='fetch-puzzle'),
+    path('upstream/metrics/', views.upstream_metrics, name='upstream-metrics'),
+    path('puzzle-images/<str:digest>/', views.puzzle_image, name='puzzle-image'),
     path('check-puzzle/', views.check_puzzle_answer, name='check-puzzle'),
+    path('check-puzzle/batch/', views.check_puzzle_answers_batch, name='check-puzzle-batch'),
     path('use-hint/', views.use_hint, name='use-hint'),
     path('set-difficulty/', views.set_difficulty, name='set-difficulty'),
     path('daily-challenge/', views.get_daily_challenge, name='get-daily-challenge'),
@@ -34,5 +40,7 @@ urlpatterns = [
     
     
     path('certificate/', views.get_certificate, name='get-certificate'),
+    path('certificate/<str:job_id>/', views.certificate_job, name='certificate-job'),
+    path('certificate/<str:job_id>/download/', views.certificate_download, name='certificate-download'),
 
 ]
\ No newline at end of file
@@ -0,0 +1,160 @@
+"""
+Bulk creation of users and their players, for bringing in a cohort (a school
+class, an event) in one go instead of one /register/ call per player.
+
+Rows follow the registration rules, but uniqueness is checked against sets of
+the usernames and emails already taken, loaded once, rather than with two
+queries per row; duplicates within the file are caught by the same sets.
+Passwords are hashed on a pool of processes while the rows are inserted, and
+each chunk of users and their players is one bulk_create of each in one
+transaction. A blank password gives an unusable one: the player signs in with
+an emailed OTP.
+"""
+import csv
+import json
+from concurrent.futures import ProcessPoolExecutor
+
+import django
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.exceptions import ValidationError
+from django.db import IntegrityError, connections, router, transaction
+
+from .models import Player
+
+
+def read_rows(stream, file_format):
+    """(line number, row) for each user in a CSV (with a header) or NDJSON stream"""
+    if file_format == 'csv':
+        reader = csv.DictReader(stream)
+        for row in reader:
+            yield reader.line_num, row
+        return
+    for number, line in enumerate(stream, start=1):
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError:
+            row = None
+        yield number, row
+
+
+def taken(using=None):
+    """The sets of usernames and emails already registered"""
+    users = User.objects.using(using or router.db_for_read(User))
+    usernames = set(users.values_list('username', flat=True).iterator(chunk_size=10000))
+    emails = set(users.exclude(email='').values_list('email', flat=True).iterator(chunk_size=10000))
+    return usernames, emails
+
+
+def _field_errors(name, value):
+    try:
+        User._meta.get_field(name).run_validators(value)
+    except ValidationError as exc:
+        return exc.messages
+    return []
+
+
+def validate(rows, usernames, emails):
+    """
+    Split (line number, row) pairs into accepted rows and (line number, message)
+    errors. `usernames` and `emails` are the sets already taken; accepted rows
+    are added to them, so later duplicates in the same file are rejected.
+    """
+    accepted = []
+    errors = []
+    for number, row in rows:
+        if not isinstance(row, dict):
+            errors.append((number, "Not a JSON object"))
+            continue
+        # NDJSON rows can hold numbers, lists or objects where strings belong
+        wrong = [name for name in ('username', 'email', 'password') if row.get(name) is not None and not isinstance(row[name], str)]
+        if wrong:
+            errors.append((number, f"{wrong[0].capitalize()} must be a string"))
+            continue
+        username = User.normalize_username((row.get('username') or '').strip())
+        email = User.objects.normalize_email((row.get('email') or '').strip())
+        password = row.get('password') or ''
+
+        if len(username) < 3:
+            message = "Username must be at least 3 characters"
+        elif not email:
+            message = "Email is required"
+        elif password and len(password) < 6:
+            message = "Password must be at least 6 characters"
+        elif problems := _field_errors('username', username) + _field_errors('email', email):
+            message = " ".join(problems)
+        elif email in emails:
+            message = "Email already exists"
+        elif username in usernames:
+            message = "Username taken"
+        else:
+            usernames.add(username)
+            emails.add(email)
+            accepted.append({'username': username, 'email': email, 'password': password})
+            continue
+        errors.append((number, message))
+    return accepted, errors
+
+
+def hash_passwords(passwords, workers=None):
+    """make_password for each password, in order, computed across a pool of `workers` processes"""
+    # Forked workers must not inherit open database connections
+    connections.close_all()
+    executor = ProcessPoolExecutor(max_workers=workers, initializer=django.setup)
+    try:
+        # Blank passwords become unusable ones, which make_password does without hashing
+        yield from executor.map(make_password, [password or None for password in passwords], chunksize=16)
+    finally:
+        executor.shutdown(cancel_futures=True)
+
+
+def _bulk_create(users, using):
+    User.objects.using(using).bulk_create(users)
+    if users and users[0].pk is None:
+        # The backend cannot return the new ids (MySQL)
+        ids = dict(
+            User.objects.using(using).filter(username__in=[user.username for user in users])
+            .values_list('username', 'pk')
+        )
+        for user in users:
+            user.pk = ids[user.username]
+    Player.objects.using(using).bulk_create([Player(user_id=user.pk) for user in users])
+
+
+def _create_chunk(users, using):
+    """Insert one chunk. Returns the usernames skipped because they were registered meanwhile."""
+    try:
+        with transaction.atomic(using=using):
+            _bulk_create(users, using)
+        return []
+    except IntegrityError:
+        names = [user.username for user in users]
+        registered = set(User.objects.using(using).filter(username__in=names).values_list('username', flat=True))
+        with transaction.atomic(using=using):
+            _bulk_create([user for user in users if user.username not in registered], using)
+        return sorted(registered)
+
+
+def create_users(rows, hashes, chunk_size=2000, using=None):
+    """
+    Create a user and a player for each accepted row, pairing the rows with
+    their password hashes in order. Returns (created, skipped usernames).
+    """
+    using = using or router.db_for_write(User)
+    created = 0
+    skipped = []
+    chunk = []
+    for row, password_hash in zip(rows, hashes):
+        chunk.append(User(username=row['username'], email=row['email'], password=password_hash))
+        if len(chunk) == chunk_size:
+            conflicts = _create_chunk(chunk, using)
+            created += len(chunk) - len(conflicts)
+            skipped.extend(conflicts)
+            chunk = []
+    if chunk:
+        conflicts = _create_chunk(chunk, using)
+        created += len(chunk) - len(conflicts)
+        skipped.extend(conflicts)
+    return created, skipped
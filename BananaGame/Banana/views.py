@@ -1,20 +1,27 @@
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.response import Response
 from rest_framework import status
-from rest_framework.permissions import AllowAny, IsAuthenticated
+from rest_framework.permissions import AllowAny, IsAuthenticated, IsAdminUser
 from rest_framework_simplejwt.tokens import RefreshToken
-from rest_framework_simplejwt.exceptions import TokenError
-from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken, OutstandingToken
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, TokenError
 from django.contrib.auth.models import User
-from django.conf import settings
-from django.core.mail import send_mail
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.http import FileResponse, Http404, HttpResponse, HttpResponseNotModified, JsonResponse, StreamingHttpResponse
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_GET, require_POST
+from django.urls import reverse
+from django.utils import timezone
+from asgiref.sync import sync_to_async
+import json
 import logging
 
 from .serializers import (
     RegisterSerializer,
-    CustomTokenObtainPairSerializer,
+    LoginSerializer,
     PlayerSerializer,
     ScoreSerializer,
+    PuzzleAnswerBatchSerializer,
     EmailOTPRequestSerializer,
     EmailOTPVerifySerializer,
     ContactSerializer,
@@ -24,6 +31,10 @@ from .serializers import (
     ReviewCreateSerializer,
 )
 from .models import Player, Score, OTP, Contact, Rating, Review
+from .authentication import SnapshotJWTAuthentication
+from .revocation import RevocableRefreshToken
+from . import leaderboard as leaderboard_service
+from . import certificate_jobs, certificates, events, hashing, image_store, outbox, progress, puzzle_pool, puzzle_sessions, rank_index, revocation, scoring, snapshots, upstream, write_behind
 
 logger = logging.getLogger(__name__)
 # @api_view(['POST'])
@@ -41,29 +52,102 @@ logger = logging.getLogger(__name__)
 #     return Response({"detail": serializer.errors}, status=status.HTTP_400_BAD_REQUEST)
 
 
-@api_view(['POST'])
-@permission_classes([AllowAny])
-def register(request):
-    serializer = RegisterSerializer(data=request.data)
-    if serializer.is_valid():
-        user = serializer.save()
-        Player.objects.get_or_create(user=user)  
-        refresh = RefreshToken.for_user(user)
-        return Response({
-            'refresh': str(refresh),
-            'access': str(refresh.access_token),
-            'username': user.username,
-        }, status=status.HTTP_201_CREATED)
-    return Response({"detail": serializer.errors}, status=status.HTTP_400_BAD_REQUEST)
+def _request_data(request):
+    """The JSON or form body of a plain Django view, or None if the JSON is malformed"""
+    if request.content_type == 'application/json':
+        try:
+            data = json.loads(request.body or b'{}')
+        except ValueError:
+            return None
+        return data if isinstance(data, dict) else None
+    return request.POST
 
 
-@api_view(['POST'])
-@permission_classes([AllowAny])
-def login(request):
-    serializer = CustomTokenObtainPairSerializer(data=request.data)
-    if serializer.is_valid():
-        return Response(serializer.validated_data, status=status.HTTP_200_OK)
-    return Response({"detail": serializer.errors}, status=status.HTTP_400_BAD_REQUEST)
+def _token_pair(user):
+    refresh = RefreshToken.for_user(user)
+    return {
+        'refresh': str(refresh),
+        'access': str(refresh.access_token),
+        'username': user.username,
+    }
+
+
+def _create_account(data, password_hash):
+    with transaction.atomic():
+        user = User.objects.create(
+            username=User.normalize_username(data['username']),
+            email=User.objects.normalize_email(data['email']),
+            password=password_hash,
+        )
+        Player.objects.create(user=user)
+    return user
+
+
+def _hashing_busy(exc):
+    response = JsonResponse({"detail": str(exc)}, status=503)
+    response['Retry-After'] = str(hashing.retry_after())
+    return response
+
+
+# register and login are async so the password hash runs on the bounded
+# hashing pool (Banana.hashing) rather than on a thread per request
+
+@csrf_exempt
+@require_POST
+async def register(request):
+    data = _request_data(request)
+    if data is None:
+        return JsonResponse({"detail": "JSON parse error"}, status=400)
+    serializer = RegisterSerializer(data=data)
+    if not await sync_to_async(serializer.is_valid)():
+        return JsonResponse({"detail": serializer.errors}, status=400)
+    try:
+        password_hash = await hashing.make_password(serializer.validated_data['password'])
+    except hashing.QueueFullError as exc:
+        return _hashing_busy(exc)
+    try:
+        user = await sync_to_async(_create_account)(serializer.validated_data, password_hash)
+    except IntegrityError:
+        # Taken by a concurrent registration since the serializer checked
+        return JsonResponse({"detail": {"username": ["Username taken"]}}, status=400)
+    return JsonResponse(await sync_to_async(_token_pair)(user), status=201)
+
+
+@csrf_exempt
+@require_POST
+async def login(request):
+    """Checks the password the way ModelBackend does, on the hashing pool"""
+    data = _request_data(request)
+    if data is None:
+        return JsonResponse({"detail": "JSON parse error"}, status=400)
+    serializer = LoginSerializer(data=data)
+    if not serializer.is_valid():
+        return JsonResponse({"detail": serializer.errors}, status=400)
+    username = serializer.validated_data['username']
+    password = serializer.validated_data['password']
+
+    user = await sync_to_async(User.objects.filter(**{User.USERNAME_FIELD: username}).first)()
+    try:
+        if user is None:
+            # Hash anyway so unknown usernames take as long as wrong passwords
+            await hashing.make_password(password)
+            valid = must_update = False
+        else:
+            valid, must_update = await hashing.verify_password(password, user.password)
+    except hashing.QueueFullError as exc:
+        return _hashing_busy(exc)
+    if not valid or not user.is_active:
+        return JsonResponse({"detail": {"detail": ["Invalid username or password"]}}, status=400)
+
+    if must_update:
+        # Rehash with the current hasher settings; a busy pool just leaves it for another login
+        try:
+            password_hash = await hashing.make_password(password)
+        except hashing.QueueFullError:
+            pass
+        else:
+            await sync_to_async(User.objects.filter(pk=user.pk).update)(password=password_hash)
+    return JsonResponse(await sync_to_async(_token_pair)(user))
 
 def send_otp_email(email, otp_code):
     try:
@@ -72,17 +156,15 @@ def send_otp_email(email, otp_code):
             f'Your OTP for Banana Game login is: {otp_code}\n\n'
             'This OTP is valid for 10 minutes.'
         )
-        from_email = getattr(settings, 'DEFAULT_FROM_EMAIL', getattr(settings, 'EMAIL_HOST_USER', None))
-        recipient_list = [email]
-        send_mail(subject, message, from_email, recipient_list, fail_silently=False)
+        outbox.enqueue(subject, message, [email], priority=outbox.HIGH, sensitive=True)
         return True
     except Exception as exc:
-        logger.error("Failed to send OTP email: %s", exc)
+        logger.error("Failed to queue OTP email: %s", exc)
         return False
 
 
 def send_contact_thankyou_email(name, email):
-    """Send thank you email after contact form submission"""
+    """Queue a thank you email after contact form submission"""
     try:
         subject = 'Thank You for Contacting Banana Brain Blitz!'
         message = (
@@ -92,17 +174,15 @@ def send_contact_thankyou_email(name, email):
             'Best regards,\n'
             'Banana Brain Blitz Team'
         )
-        from_email = getattr(settings, 'DEFAULT_FROM_EMAIL', getattr(settings, 'EMAIL_HOST_USER', None))
-        recipient_list = [email]
-        send_mail(subject, message, from_email, recipient_list, fail_silently=False)
+        outbox.enqueue(subject, message, [email])
         return True
     except Exception as exc:
-        logger.error("Failed to send contact thank you email: %s", exc)
+        logger.error("Failed to queue contact thank you email: %s", exc)
         return False
 
 
 def send_review_thankyou_email(user_email, username, review_title):
-    """Send thank you email after review submission"""
+    """Queue a thank you email after review submission"""
     try:
         subject = 'Thank You for Your Review - Banana Brain Blitz!'
         message = (
@@ -114,12 +194,10 @@ def send_review_thankyou_email(user_email, username, review_title):
             'Best regards,\n'
             'Banana Brain Blitz Team'
         )
-        from_email = getattr(settings, 'DEFAULT_FROM_EMAIL', getattr(settings, 'EMAIL_HOST_USER', None))
-        recipient_list = [user_email]
-        send_mail(subject, message, from_email, recipient_list, fail_silently=False)
+        outbox.enqueue(subject, message, [user_email])
         return True
     except Exception as exc:
-        logger.error("Failed to send review thank you email: %s", exc)
+        logger.error("Failed to queue review thank you email: %s", exc)
         return False
 
 
@@ -137,9 +215,9 @@ def request_email_otp(request):
     except User.DoesNotExist:
         return Response({"detail": "User with this email was not found."}, status=status.HTTP_404_NOT_FOUND)
 
-    otp = OTP.generate_otp(user, OTP.EMAIL, email)
+    _, otp_code = OTP.generate_otp(user, OTP.EMAIL, email)
 
-    if not send_otp_email(email, otp.otp_code):
+    if not send_otp_email(email, otp_code):
         return Response({"detail": "Failed to send OTP. Please try again later."}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
     return Response(
@@ -191,22 +269,19 @@ def logout(request):
         return Response({"detail": "Missing refresh token"}, status=status.HTTP_400_BAD_REQUEST)
 
     try:
-        token = RefreshToken(refresh_token)
-        token.blacklist()
+        revocation.revoke(RevocableRefreshToken(refresh_token))
     except TokenError:
         return Response({"detail": "Invalid refresh token"}, status=status.HTTP_400_BAD_REQUEST)
 
+    snapshots.forget_user(request.user.pk)
     return Response({"detail": "Logout successful"}, status=status.HTTP_205_RESET_CONTENT)
 
 
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
 def logout_all(request):
-    tokens = OutstandingToken.objects.filter(user=request.user)
-
-    for outstanding_token in tokens:
-        BlacklistedToken.objects.get_or_create(token=outstanding_token)
-
+    revocation.revoke_all(request.user)
+    snapshots.forget_user(request.user.pk)
     return Response({"detail": "Logged out from all sessions"}, status=status.HTTP_205_RESET_CONTENT)
 
 @api_view(['GET', 'PATCH'])
@@ -215,13 +290,14 @@ def player_detail(request):
     player, created = Player.objects.get_or_create(user=request.user)
 
     if request.method == 'GET':
-        serializer = PlayerSerializer(player)
+        serializer = PlayerSerializer(write_behind.merge(player))
         return Response(serializer.data, status=status.HTTP_200_OK)
 
     elif request.method == 'PATCH':
         serializer = PlayerSerializer(player, data=request.data, partial=True)
         if serializer.is_valid():
-            serializer.save()
+            # Progress fields may change, so invalidate optimistic readers (and player snapshots)
+            serializer.save(version=F('version') + 1)
             return Response(serializer.data, status=status.HTTP_200_OK)
         return Response({"detail": serializer.errors}, status=status.HTTP_400_BAD_REQUEST)
 
@@ -235,14 +311,24 @@ def submit_score(request):
         if score_value is None:
             return Response({"detail": "Missing score field"}, status=status.HTTP_400_BAD_REQUEST)
 
-        
-        score_instance = Score.objects.create(user=request.user, score=int(score_value))
+        max_score = leaderboard_service.max_submitted_score()
+        try:
+            score_value = int(score_value)
+        except (TypeError, ValueError):
+            score_value = None
+        if score_value is None or not 0 <= score_value <= max_score:
+            return Response(
+                {"detail": f"score must be a whole number from 0 to {max_score}"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        score_instance = Score.objects.create(user=request.user, score=score_value)
+        leaderboard_service.record_score(request.user, score_instance.score, when=score_instance.date)
 
         
         player, created = Player.objects.get_or_create(user=request.user)
         if score_instance.score > player.high_score:
-            player.high_score = score_instance.score
-            player.save()
+            Player.objects.filter(pk=player.pk, high_score__lt=score_instance.score).update(high_score=score_instance.score)
 
         
         return Response({
@@ -255,183 +341,114 @@ def submit_score(request):
         return Response({"detail": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 
-from django.db.models import Max
-
 @api_view(['GET'])
 @permission_classes([AllowAny])
 def leaderboard(request):
-    top_scores = (
-        Score.objects
-        .values('user__username')
-        .annotate(highest_score=Max('score'))
-        .order_by('-highest_score')[:10]
-    )
+    """
+    Top players of the current day, week or all time (?window=day|week|all, default all)
+    """
+    window = request.query_params.get('window', leaderboard_service.ALL_TIME)
+    if window not in leaderboard_service.WINDOWS:
+        return Response(
+            {"detail": f"window must be one of: {', '.join(leaderboard_service.WINDOWS)}"},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    body, version = leaderboard_service.cached_top(window)
+    etag = f'"{window}-{version}"'
+    if etag in request.headers.get('If-None-Match', ''):
+        response = HttpResponseNotModified()
+    else:
+        response = HttpResponse(body, content_type='application/json')
+    response['ETag'] = etag
+    response['Cache-Control'] = 'no-cache'
+    return response
 
-    
-    leaderboard_data = [
-        {'username': item['user__username'], 'score': item['highest_score']}
-        for item in top_scores
-    ]
 
-    return Response(leaderboard_data, status=status.HTTP_200_OK)
+@api_view(['GET'])
+@permission_classes([AllowAny])
+def leaderboard_pages(request):
+    """
+    The whole leaderboard, one page at a time (?window=, ?page_size=, ?cursor=).
+    Pass the returned `next` cursor to get the following page; it is null on the last one.
+    """
+    window = request.query_params.get('window', leaderboard_service.ALL_TIME)
+    if window not in leaderboard_service.WINDOWS:
+        return Response(
+            {"detail": f"window must be one of: {', '.join(leaderboard_service.WINDOWS)}"},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    try:
+        size = int(request.query_params.get('page_size', leaderboard_service.page_size()))
+    except ValueError:
+        return Response({"detail": "page_size must be an integer"}, status=status.HTTP_400_BAD_REQUEST)
+    size = max(1, min(size, leaderboard_service.max_page_size()))
+
+    try:
+        results, next_cursor = leaderboard_service.page(request.query_params.get('cursor'), size, window)
+    except ValueError as e:
+        return Response({"detail": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    return Response({"results": results, "next": next_cursor}, status=status.HTTP_200_OK)
 
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
+def leaderboard_rank(request):
+    """
+    The current user's rank with up to `k` neighbours either side (?k=, default 5)
+    """
+    try:
+        k = int(request.query_params.get('k', 5))
+    except ValueError:
+        return Response({"detail": "k must be an integer"}, status=status.HTTP_400_BAD_REQUEST)
+    k = max(0, min(k, rank_index.AROUND_MAX))
+
+    try:
+        user_rank, score = rank_index.rank(request.user)
+        if user_rank is None:
+            return Response({"detail": "No score submitted yet."}, status=status.HTTP_404_NOT_FOUND)
+        return Response({
+            "username": request.user.username,
+            "rank": user_rank,
+            "score": score,
+            "total_players": len(rank_index.get_index()),
+            "around": rank_index.around(request.user, k),
+        }, status=status.HTTP_200_OK)
+    except Exception as e:
+        return Response({"detail": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+@api_view(['GET', 'POST'])
+@permission_classes([IsAuthenticated])
 def get_certificate(request):
     """
-    Generate and return certificate PDF for top 3 players
+    Certificate PDF for top 3 players. GET renders it in the request; POST
+    starts a background job and returns its status (poll the status_url, then
+    fetch the download_url).
     """
     try:
-        from reportlab.lib.pagesizes import A4, landscape
-        from reportlab.lib import colors
-        from reportlab.lib.units import mm
-        from reportlab.pdfgen import canvas
-        from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-        from reportlab.platypus import Paragraph, Spacer
-        from reportlab.lib.enums import TA_CENTER
-        from io import BytesIO
-        from django.http import HttpResponse
-        from datetime import datetime
-        
-        
-        top_scores = (
-            Score.objects
-            .values('user__username')
-            .annotate(highest_score=Max('score'))
-            .order_by('-highest_score')[:10]
-        )
-        
-        leaderboard_data = [
-            {'username': item['user__username'], 'score': item['highest_score']}
-            for item in top_scores
-        ]
-        
-        
-        user_rank = None
-        user_score = None
-        for idx, entry in enumerate(leaderboard_data, 1):
-            if entry['username'] == request.user.username:
-                user_rank = idx
-                user_score = entry['score']
-                break
-        
-        
+        user_rank, user_score = rank_index.rank(request.user)
+
         if not user_rank or user_rank > 3:
             return Response(
                 {"detail": "Certificate is only available for top 3 players."},
                 status=status.HTTP_403_FORBIDDEN
             )
-        
-        
-        buffer = BytesIO()
-        p = canvas.Canvas(buffer, pagesize=landscape(A4))
-        width, height = landscape(A4)
-        
-        
-        p.setFillColor(colors.HexColor('#FCD34D'))  
-        p.rect(0, 0, width, height, fill=1)
-        
-        
-        p.setStrokeColor(colors.HexColor('#F59E0B'))
-        p.setLineWidth(20)
-        p.rect(10, 10, width - 20, height - 20, fill=0, stroke=1)
-        
-        
-        p.setStrokeColor(colors.HexColor('#D97706'))
-        p.setLineWidth(5)
-        p.rect(30, 30, width - 60, height - 60, fill=0, stroke=1)
-        
-        
-        p.setFillColor(colors.HexColor('#92400E'))
-        p.setFont("Helvetica-Bold", 48)
-        title = "CERTIFICATE OF ACHIEVEMENT"
-        title_width = p.stringWidth(title, "Helvetica-Bold", 48)
-        p.drawString((width - title_width) / 2, height - 120, title)
-        
-        
-        p.setStrokeColor(colors.HexColor('#92400E'))
-        p.setLineWidth(3)
-        p.line(width * 0.2, height - 160, width * 0.8, height - 160)
-        
-        
-        place_texts = {1: "CHAMPION", 2: "RUNNER-UP", 3: "THIRD PLACE"}
-        place_colors = {
-            1: colors.HexColor('#FCD34D'),
-            2: colors.HexColor('#9CA3AF'),
-            3: colors.HexColor('#FB923C')
-        }
-        
-        p.setFillColor(place_colors[user_rank])
-        p.setFont("Helvetica-Bold", 36)
-        place_text = place_texts[user_rank]
-        place_width = p.stringWidth(place_text, "Helvetica-Bold", 36)
-        p.drawString((width - place_width) / 2, height - 220, place_text)
-        
-        
-        p.setFillColor(colors.HexColor('#78350F'))
-        p.setFont("Helvetica", 24)
-        subtitle = f"{'First' if user_rank == 1 else 'Second' if user_rank == 2 else 'Third'} Place Winner"
-        subtitle_width = p.stringWidth(subtitle, "Helvetica", 24)
-        p.drawString((width - subtitle_width) / 2, height - 270, subtitle)
-        
-        
-        p.setFillColor(colors.HexColor('#78350F'))
-        p.setFont("Helvetica", 20)
-        certify_text = "This is to certify that"
-        certify_width = p.stringWidth(certify_text, "Helvetica", 20)
-        p.drawString((width - certify_width) / 2, height - 320, certify_text)
-        
-       
-        p.setFillColor(colors.HexColor('#1F2937'))
-        p.setFont("Helvetica-Bold", 42)
-        player_name = request.user.username
-        name_width = p.stringWidth(player_name, "Helvetica-Bold", 42)
-        p.drawString((width - name_width) / 2, height - 380, player_name)
-        
-        
-        p.setFillColor(colors.HexColor('#78350F'))
-        p.setFont("Helvetica", 22)
-        achievement_text = f"Has achieved {user_rank}{'st' if user_rank == 1 else 'nd' if user_rank == 2 else 'rd'} Place"
-        achievement_width = p.stringWidth(achievement_text, "Helvetica", 22)
-        p.drawString((width - achievement_width) / 2, height - 440, achievement_text)
-        
-      
-        p.setFont("Helvetica", 20)
-        game_text = "in the Banana Brain Blitz Game"
-        game_width = p.stringWidth(game_text, "Helvetica", 20)
-        p.drawString((width - game_width) / 2, height - 480, game_text)
-        
-        
-        p.setFont("Helvetica-Bold", 28)
-        score_text = f"Final Score: {user_score} Points"
-        score_width = p.stringWidth(score_text, "Helvetica-Bold", 28)
-        p.drawString((width - score_width) / 2, height - 540, score_text)
-        
-        
-        p.setFillColor(colors.HexColor('#78350F'))
-        p.setFont("Helvetica", 16)
-        date_text = f"Date: {datetime.now().strftime('%B %d, %Y')}"
-        date_width = p.stringWidth(date_text, "Helvetica", 16)
-        p.drawString((width - date_width) / 2, 80, date_text)
-        
-        
-        p.setFont("Helvetica-Bold", 40)
-        p.setFillColor(colors.HexColor('#92400E'))
-        p.drawString(100, height - 100, "*")
-        p.drawString(width - 140, height - 100, "*")
-        p.drawString(100, 120, "*")
-        p.drawString(width - 140, 120, "*")
-        
-        p.showPage()
-        p.save()
-        
-        buffer.seek(0)
-        response = HttpResponse(buffer, content_type='application/pdf')
-        response['Content-Disposition'] = f'attachment; filename="Banana_Game_Certificate_{request.user.username}_{user_rank}st.pdf"'
-        
+
+        if request.method == 'POST':
+            try:
+                job = certificate_jobs.submit(request.user, user_rank, user_score, timezone.localdate())
+            except certificate_jobs.QueueFullError as exc:
+                return Response(
+                    {"detail": str(exc)}, status=status.HTTP_503_SERVICE_UNAVAILABLE, headers={'Retry-After': '5'}
+                )
+            code = status.HTTP_200_OK if job['status'] == certificate_jobs.DONE else status.HTTP_202_ACCEPTED
+            return Response(_certificate_job_body(request, job), status=code)
+
+        content = certificates.get_certificate(request.user, user_rank, user_score, timezone.localdate())
+        response = HttpResponse(content, content_type='application/pdf')
+        response['Content-Disposition'] = f'attachment; filename="{certificates.filename(request.user.username, user_rank)}"'
         return response
-        
+
     except Exception as e:
         logger.error("Error generating certificate: %s", e)
         return Response(
@@ -440,6 +457,65 @@ def get_certificate(request):
         )
 
 
+def _certificate_job_body(request, job):
+    body = {
+        "job_id": job['job_id'],
+        "status": job['status'],
+        "status_url": request.build_absolute_uri(reverse('certificate-job', kwargs={'job_id': job['job_id']})),
+    }
+    if job['status'] == certificate_jobs.DONE:
+        body["download_url"] = request.build_absolute_uri(
+            reverse('certificate-download', kwargs={'job_id': job['job_id']})
+        )
+    elif job['status'] == certificate_jobs.FAILED:
+        body["error"] = job.get('error', '')
+    return body
+
+
+def _own_certificate_job(request, job_id):
+    job = certificate_jobs.get(job_id)
+    if job is None or job['user_id'] != request.user.id:
+        return None
+    return job
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def certificate_job(request, job_id):
+    """Status of a certificate job started with POST /certificate/"""
+    job = _own_certificate_job(request, job_id)
+    if job is None:
+        return Response({"detail": "Certificate job not found."}, status=status.HTTP_404_NOT_FOUND)
+    return Response(_certificate_job_body(request, job), status=status.HTTP_200_OK)
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def certificate_download(request, job_id):
+    """The PDF of a finished certificate job"""
+    job = _own_certificate_job(request, job_id)
+    if job is None:
+        return Response({"detail": "Certificate job not found."}, status=status.HTTP_404_NOT_FOUND)
+    if job['status'] != certificate_jobs.DONE:
+        return Response(_certificate_job_body(request, job), status=status.HTTP_409_CONFLICT)
+    path = certificates.cached(job['user_id'], job['rank'], job['score'], job['date'])
+    handle = None
+    if path is not None:
+        try:
+            handle = open(path, 'rb')
+        except FileNotFoundError:
+            # Evicted between the check and the open
+            pass
+    if handle is None:
+        return Response(
+            {"detail": "Certificate has expired, request it again."}, status=status.HTTP_410_GONE
+        )
+    return FileResponse(
+        handle, as_attachment=True, filename=certificates.filename(job['username'], job['rank']),
+        content_type='application/pdf',
+    )
+
+
 
 import requests
 from django.http import JsonResponse
@@ -456,22 +532,113 @@ from .models import Player
 @permission_classes([IsAuthenticated])
 def fetch_puzzle(request):
     try:
-        res = requests.get("https://marcconrad.com/uob/banana/api.php", timeout=5)
-        if res.status_code != 200:
-            return JsonResponse({"error": "Failed to fetch puzzle"}, status=res.status_code)
+        try:
+            data = puzzle_pool.get_puzzle()
+        except (upstream.CircuitOpenError, upstream.UpstreamBusyError) as exc:
+            logger.warning("Puzzle upstream unavailable: %s", exc)
+            return JsonResponse({"error": "Puzzle service is temporarily unavailable"}, status=503)
+        except requests.RequestException as exc:
+            logger.error("Failed to fetch puzzle: %s", exc)
+            return JsonResponse({"error": "Failed to fetch puzzle"}, status=502)
 
-        data = res.json()
-        player, _ = Player.objects.get_or_create(user=request.user)
-        player.current_puzzle = data  
-        player.save()
+        puzzle_id = puzzle_sessions.issue(request.user.id, data)
 
        
         data.pop('solution', None)
+        data['puzzle_id'] = puzzle_id
+        if str(data.get('question', '')).startswith('/'):
+            data['question'] = request.build_absolute_uri(data['question'])
         return JsonResponse(data, safe=False)
     except Exception as e:
         return JsonResponse({"error": str(e)}, status=500)
 
 
+@require_GET
+def puzzle_image(request, digest):
+    """Serve a stored puzzle image. Content-addressed, so the digest is a strong ETag."""
+    etag = f'"{digest}"'
+    headers = {'ETag': etag, 'Cache-Control': 'public, max-age=31536000, immutable'}
+    if etag in request.headers.get('If-None-Match', ''):
+        response = HttpResponseNotModified()
+        for name, value in headers.items():
+            response[name] = value
+        return response
+
+    stored = image_store.open_image(digest)
+    if stored is None:
+        raise Http404("Puzzle image not found")
+    handle, image = stored
+    response = FileResponse(handle, content_type=image.content_type)
+    for name, value in headers.items():
+        response[name] = value
+    return response
+
+
+async def event_stream(request):
+    """
+    Server-sent events; needs the ASGI application (BananaGame.asgi).
+    Streams a `leaderboard` snapshot of ?window= (default all), then diffs as
+    scores change it. With ?token=<access token> (EventSource cannot send
+    headers) the caller's own `progress` results are streamed as well.
+    """
+    if request.method != 'GET':
+        return JsonResponse({"error": "Method not allowed"}, status=405)
+    window = request.GET.get('window', leaderboard_service.ALL_TIME)
+    if window not in leaderboard_service.WINDOWS:
+        return JsonResponse(
+            {"error": f"window must be one of: {', '.join(leaderboard_service.WINDOWS)}"}, status=400
+        )
+    topics = [f'leaderboard:{window}']
+    token = request.GET.get('token')
+    if token:
+        try:
+            user = await sync_to_async(_stream_user)(token)
+        except AuthenticationFailed:
+            return JsonResponse({"error": "Invalid or expired token"}, status=401)
+        topics.append(f'progress:{user.pk}')
+    if events.subscriber_count() >= events.max_connections():
+        response = JsonResponse({"error": "Too many open event streams"}, status=503)
+        response['Retry-After'] = '30'
+        return response
+
+    response = StreamingHttpResponse(_event_stream(topics, window), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
+def _stream_user(token):
+    """The ?token= user, refused for the same reasons as an Authorization header"""
+    authentication = SnapshotJWTAuthentication()
+    return authentication.get_user(authentication.get_validated_token(token))
+
+
+async def _event_stream(topics, window):
+    # Subscribe before taking the snapshot so no change falls in between
+    subscription = events.subscribe(topics)
+    try:
+        body, version = await sync_to_async(leaderboard_service.cached_top)(window)
+        yield events.format_event('snapshot', body.decode(), version)
+        while True:
+            frame = await subscription.queue.get()
+            if subscription.overflowed:
+                # Too far behind to replay the diffs; start the client over
+                subscription.drain()
+                body, version = await sync_to_async(leaderboard_service.cached_top)(window)
+                yield events.format_event('snapshot', body.decode(), version)
+                continue
+            yield frame
+    finally:
+        events.unsubscribe(subscription)
+
+
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def upstream_metrics(request):
+    """Connection pool and circuit breaker state of the Banana API client"""
+    return Response(upstream.get_client().metrics(), status=status.HTTP_200_OK)
+
+
 
 from django.http import JsonResponse
 from rest_framework.decorators import api_view, permission_classes
@@ -482,98 +649,84 @@ from .models import Player
 @permission_classes([IsAuthenticated])
 def check_puzzle_answer(request):
     try:
-        from datetime import date
-        import random
-        
         user_answer = str(request.data.get('answer', '')).strip()
         time_taken = request.data.get('time_taken', 0)  
         hints_used = request.data.get('hints_used', 0)  
         if not user_answer:
             return JsonResponse({"error": "Missing answer"}, status=400)
 
-        player, _ = Player.objects.get_or_create(user=request.user)
-        puzzle_data = player.current_puzzle or {}
-
+        puzzle_data = puzzle_sessions.take(request.user.id)
         real_solution = str(puzzle_data.get('solution', '')).strip()
         if not real_solution:
             return JsonResponse({"error": "No puzzle stored. Please fetch again."}, status=400)
 
-        correct = user_answer == real_solution
-        puzzle_id = puzzle_data.get('question', '')
+        if user_answer == real_solution:
+            result = progress.record_correct(
+                request.user,
+                time_taken=time_taken,
+                hints_used=hints_used,
+                puzzle_id=puzzle_data.get('question', ''),
+            )
+            return JsonResponse(result)
+        else:
+            progress.record_wrong(request.user)
+            return JsonResponse({"correct": False, "correct_answer": real_solution})
+    except Exception as e:
+        return JsonResponse({"error": str(e)}, status=500)
 
-        if correct:
-            
-            difficulty_multipliers = {'easy': 0.7, 'medium': 1.0, 'hard': 1.5}
-            base_points = 10 * difficulty_multipliers.get(player.difficulty, 1.0)
-            
-           
-            time_bonus = max(0, (40 - time_taken) / 2) if time_taken > 0 else 0
-            time_bonus = min(time_bonus, 15)  
-            
-            
-            combo_bonus = player.combo_count * 2
-            player.combo_count += 1
-            if player.combo_count > player.max_combo:
-                player.max_combo = player.combo_count
-            
-            
-            perfect_bonus = 0
-            if hints_used == 0:
-                perfect_bonus = 10
-                player.perfect_solves += 1
-            
-            
-            lucky_multiplier = 2.0 if random.random() < 0.05 else 1.0
-                        
-            total_points = int((base_points + time_bonus + combo_bonus + perfect_bonus) * lucky_multiplier)
-                        
-            xp_gained = total_points
-            if hints_used == 0:
-                xp_gained += 5  
-                        
-            old_level = player.level
-            player.xp += xp_gained
-            new_level = (player.xp // 100) + 1
-            leveled_up = new_level > old_level
-            player.level = new_level
-            
-            
-            player.puzzles_solved += 1
-            
-           
-            if puzzle_id:
-                if puzzle_id not in player.puzzle_history:
-                    player.puzzle_history.append(puzzle_id)
-                    if len(player.puzzle_history) > 50:
-                        player.puzzle_history = player.puzzle_history[-50:]
 
-            
-            player.current_puzzle = {}
-            player.save()
-            
-            return JsonResponse({
-                "correct": True,
-                "points": total_points,
-                "xp_gained": xp_gained,
-                "combo": player.combo_count,
-                "leveled_up": leveled_up,
-                "new_level": new_level if leveled_up else None,
-                "perfect_solve": hints_used == 0,
-                "lucky_streak": lucky_multiplier > 1.0,
-                "breakdown": {
-                    "base_points": int(base_points),
-                    "time_bonus": int(time_bonus),
-                    "combo_bonus": combo_bonus,
-                    "perfect_bonus": perfect_bonus,
-                    "lucky_multiplier": lucky_multiplier
-                }
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def check_puzzle_answers_batch(request):
+    """
+    Check an ordered list of {puzzle_id, answer, time_taken, hints_used}
+    against the puzzles issued to the player. Combos carry over in order and
+    all progress is applied in a single update.
+    """
+    try:
+        serializer = PuzzleAnswerBatchSerializer(data=request.data)
+        if not serializer.is_valid():
+            return JsonResponse({"error": serializer.errors}, status=400)
+        items = serializer.validated_data['answers']
+
+        puzzles = puzzle_sessions.take_many(request.user.id, [item['puzzle_id'] for item in items])
+        results = [None] * len(items)
+        answers = []
+        positions = []
+        for index, item in enumerate(items):
+            puzzle = puzzles.get(item['puzzle_id']) or {}
+            real_solution = str(puzzle.get('solution', '')).strip()
+            if not real_solution:
+                results[index] = {"puzzle_id": item['puzzle_id'], "error": "Unknown or expired puzzle"}
+                continue
+            answers.append({
+                'correct': item['answer'] == real_solution,
+                'solution': real_solution,
+                'time_taken': item['time_taken'],
+                'hints_used': item['hints_used'],
+                'puzzle_id': puzzle.get('question', ''),
             })
-        else:
-           
-            player.combo_count = 0
-            player.current_puzzle = {}
-            player.save()
-            return JsonResponse({"correct": False, "correct_answer": real_solution})
+            positions.append(index)
+
+        if answers:
+            try:
+                recorded = progress.record_answers(request.user, answers)
+            except progress.ConcurrentUpdateError as exc:
+                # Nothing was recorded, so the puzzles can be answered again
+                puzzle_sessions.put_back(request.user.id, puzzles)
+                response = JsonResponse({"error": str(exc)}, status=409)
+                response['Retry-After'] = '1'
+                return response
+            for index, result in zip(positions, recorded):
+                results[index] = {"puzzle_id": items[index]['puzzle_id'], **result}
+
+        solved = [result for result in results if result.get('correct')]
+        return JsonResponse({
+            "results": results,
+            "correct": len(solved),
+            "points": sum(result['points'] for result in solved),
+            "xp_gained": sum(result['xp_gained'] for result in solved),
+        })
     except Exception as e:
         return JsonResponse({"error": str(e)}, status=500)
 
@@ -591,13 +744,7 @@ def use_hint(request):
     5. Multiple choice hint (answer is one of X, Y, Z)
     """
     try:
-        player, _ = Player.objects.get_or_create(user=request.user)
-              
-        if player.hints <= 0:
-            return JsonResponse({"error": "No hints available"}, status=400)
-        
-
-        puzzle_data = player.current_puzzle or {}
+        puzzle_data = puzzle_sessions.get(request.user.id)
         real_solution = str(puzzle_data.get('solution', '')).strip()
         
         if not real_solution:
@@ -609,8 +756,9 @@ def use_hint(request):
             return JsonResponse({"error": "Invalid puzzle solution"}, status=400)
         
  
-        player.hints -= 1
-        player.save()
+        hints_remaining = progress.consume_hint(request.user)
+        if hints_remaining is None:
+            return JsonResponse({"error": "No hints available"}, status=400)
         
         import random
         hint_type = random.choice(['wrong_answer', 'range', 'parity', 'comparison', 'multiple_choice'])
@@ -656,7 +804,7 @@ def use_hint(request):
         return JsonResponse({
             "hint": hint_message,
             "title": hint_title,
-            "hints_remaining": player.hints,
+            "hints_remaining": hints_remaining,
             "hint_type": hint_type
         }, status=200)
         
@@ -673,9 +821,10 @@ def set_difficulty(request):
         if difficulty not in ['easy', 'medium', 'hard']:
             return JsonResponse({"error": "Invalid difficulty. Must be 'easy', 'medium', or 'hard'"}, status=400)
         
-        player, _ = Player.objects.get_or_create(user=request.user)
-        player.difficulty = difficulty
-        player.save()
+        # Bumps the version: solves score by difficulty, so their player snapshot is stale
+        updated = Player.objects.filter(user=request.user).update(difficulty=difficulty, version=F('version') + 1)
+        if not updated:
+            Player.objects.create(user=request.user, difficulty=difficulty)
         
         return JsonResponse({
             "difficulty": difficulty,
@@ -693,6 +842,7 @@ def get_daily_challenge(request):
         from datetime import date, timedelta
         
         player, _ = Player.objects.get_or_create(user=request.user)
+        write_behind.merge(player)
         today = date.today()
         
         if player.last_daily_challenge == today:
@@ -732,26 +882,32 @@ def claim_daily_challenge(request):
     try:
         from datetime import date, timedelta
         
-        player, _ = Player.objects.get_or_create(user=request.user)
-        today = date.today()
-        
+        with write_behind.player_lock(request.user.pk):
+            player, _ = Player.objects.get_or_create(user=request.user)
+            write_behind.merge(player)
+            today = date.today()
+            
 
-        if player.last_daily_challenge == today:
-            return JsonResponse({"error": "Daily challenge already claimed today"}, status=400)
-        
-        if player.last_daily_challenge:
-            yesterday = date.today() - timedelta(days=1)
-            if player.last_daily_challenge == yesterday:
-                player.daily_challenge_streak += 1
+            if player.last_daily_challenge == today:
+                return JsonResponse({"error": "Daily challenge already claimed today"}, status=400)
+            
+            if player.last_daily_challenge:
+                yesterday = date.today() - timedelta(days=1)
+                if player.last_daily_challenge == yesterday:
+                    player.daily_challenge_streak += 1
+                else:
+                    player.daily_challenge_streak = 1
             else:
                 player.daily_challenge_streak = 1
-        else:
-            player.daily_challenge_streak = 1
-        
-        reward = 50 + (player.daily_challenge_streak * 10)
-        player.coins += reward
-        player.last_daily_challenge = today
-        player.save()
+            
+            reward = 50 + (player.daily_challenge_streak * 10)
+            player.coins += reward
+            player.last_daily_challenge = today
+            values = {'last_daily_challenge': today, 'daily_challenge_streak': player.daily_challenge_streak}
+            if write_behind.enabled():
+                write_behind.record(player.pk, deltas={'coins': reward}, values=values)
+            else:
+                Player.objects.filter(pk=player.pk).update(coins=F('coins') + reward, version=F('version') + 1, **values)
         
         return JsonResponse({
             "reward": reward,
@@ -770,9 +926,10 @@ def get_game_stats(request):
     """Get comprehensive game statistics"""
     try:
         player, _ = Player.objects.get_or_create(user=request.user)
+        write_behind.merge(player)
         
-        xp_for_current_level = (player.level - 1) * 100
-        xp_for_next_level = player.level * 100
+        xp_for_current_level = scoring.xp_for_level(player.level)
+        xp_for_next_level = scoring.xp_for_level(player.level + 1)
         xp_progress = player.xp - xp_for_current_level
         xp_needed = xp_for_next_level - player.xp
         
@@ -0,0 +1,191 @@
+"""
+Optional write-behind buffer for player progress.
+
+With PLAYER_WRITE_BEHIND enabled, solves and daily-challenge claims add their
+xp / coins / puzzles_solved / perfect_solves deltas (plus a few absolute
+values such as the combo) to an in-process buffer instead of writing Player.
+A background thread flushes the buffer with one bulk_update every
+PLAYER_WRITE_BEHIND_INTERVAL seconds, which bounds what a crash can lose to
+that window. Reads that show progress call merge() so players see their
+pending numbers straight away.
+
+The buffer is per process: a player's pending deltas are only visible to the
+worker that recorded them until the next flush.
+
+A batch being flushed stays visible to merge() until its transaction has
+committed. Each entry notes the version its flush writes, so a row read
+after the commit (which already has the changes) is not given them twice.
+Only one flush runs at a time.
+"""
+import atexit
+import logging
+import threading
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import connection, transaction
+
+from .models import Player
+from .scoring import level_for_xp
+
+logger = logging.getLogger(__name__)
+
+DELTA_FIELDS = ('xp', 'coins', 'puzzles_solved', 'perfect_solves')
+
+_lock = threading.Lock()
+_pending = {}  # player_id -> {'deltas': {...}, 'values': {...}}
+_in_flight = {}  # the batch being flushed; entries gain a 'version' once their row is locked
+_flush_lock = threading.Lock()
+_full_flush_started = False  # a flush for a full buffer is already on its way
+_flusher = None
+_player_locks = [threading.Lock() for _ in range(64)]
+
+
+def enabled():
+    return getattr(settings, 'PLAYER_WRITE_BEHIND', False)
+
+
+def interval():
+    return getattr(settings, 'PLAYER_WRITE_BEHIND_INTERVAL', 5.0)
+
+
+def max_pending():
+    return getattr(settings, 'PLAYER_WRITE_BEHIND_MAX_PENDING', 1000)
+
+
+@contextmanager
+def player_lock(player_id):
+    """Serialise read-merge-record sequences for one player within this process"""
+    with _player_locks[player_id % len(_player_locks)]:
+        yield
+
+
+def _add(entry, deltas, values):
+    for field, delta in (deltas or {}).items():
+        entry['deltas'][field] = entry['deltas'].get(field, 0) + delta
+    entry['values'].update(values or {})
+
+
+def record(player_id, deltas=None, values=None):
+    """Buffer counter deltas and absolute field values for a player"""
+    global _full_flush_started
+    _ensure_flusher()
+    with _lock:
+        entry = _pending.setdefault(player_id, {'deltas': {}, 'values': {}})
+        _add(entry, deltas, values)
+        start_flush = len(_pending) >= max_pending() and not _full_flush_started
+        if start_flush:
+            _full_flush_started = True
+    if start_flush:
+        threading.Thread(target=_flush_full_buffer, name='player-write-behind-flush', daemon=True).start()
+
+
+def merge(player):
+    """Apply this process's pending changes to a Player instance in place and return it"""
+    deltas, values = {}, {}
+    with _lock:
+        flushing = _in_flight.get(player.pk)
+        # Once the flush has committed, a fresh read already has the in-flight changes
+        if flushing is not None and (flushing.get('version') is None or player.version < flushing['version']):
+            _add({'deltas': deltas, 'values': values}, flushing['deltas'], flushing['values'])
+        entry = _pending.get(player.pk)
+        if entry is not None:
+            _add({'deltas': deltas, 'values': values}, entry['deltas'], entry['values'])
+    if not deltas and not values:
+        return player
+    for field, delta in deltas.items():
+        setattr(player, field, getattr(player, field) + delta)
+    for field, value in values.items():
+        setattr(player, field, value)
+    if 'xp' in deltas:
+        player.level = level_for_xp(player.xp)
+    return player
+
+
+def flush():
+    """Write every pending change with a single bulk_update. Returns the number of players written."""
+    with _flush_lock:
+        return _flush()
+
+
+def _flush():
+    global _pending, _in_flight
+    with _lock:
+        batch, _pending = _pending, {}
+        _in_flight = batch
+    if not batch:
+        return 0
+
+    try:
+        with transaction.atomic():
+            players = Player.objects.select_for_update().in_bulk(list(batch.keys()))
+            with _lock:
+                for player_id, player in players.items():
+                    batch[player_id]['version'] = player.version + 1
+            fields = {'version'}
+            for player_id, entry in batch.items():
+                player = players.get(player_id)
+                if player is None:
+                    continue
+                for field, delta in entry['deltas'].items():
+                    setattr(player, field, getattr(player, field) + delta)
+                    fields.add(field)
+                for field, value in entry['values'].items():
+                    setattr(player, field, value)
+                    fields.add(field)
+                if 'xp' in entry['deltas']:
+                    player.level = level_for_xp(player.xp)
+                    fields.add('level')
+                # Invalidates optimistic readers working from the pre-flush row
+                player.version += 1
+            Player.objects.bulk_update(list(players.values()), sorted(fields), batch_size=500)
+    except Exception:
+        # Put the batch back underneath anything recorded since, so nothing is lost
+        with _lock:
+            for player_id, entry in batch.items():
+                entry.pop('version', None)
+                newer = _pending.get(player_id)
+                _pending[player_id] = entry
+                if newer is not None:
+                    _add(entry, newer['deltas'], newer['values'])
+            _in_flight = {}
+        raise
+    with _lock:
+        _in_flight = {}
+    return len(players)
+
+
+def _flush_full_buffer():
+    global _full_flush_started
+    try:
+        _flush_in_thread()
+    finally:
+        with _lock:
+            _full_flush_started = False
+
+
+def _flush_in_thread():
+    try:
+        flush()
+    except Exception as exc:
+        logger.error("Player write-behind flush failed: %s", exc)
+    finally:
+        connection.close()
+
+
+def _flush_loop():
+    while True:
+        time.sleep(interval())
+        _flush_in_thread()
+
+
+def _ensure_flusher():
+    global _flusher
+    if _flusher is not None:
+        return
+    with _lock:
+        if _flusher is None:
+            _flusher = threading.Thread(target=_flush_loop, name='player-write-behind', daemon=True)
+            _flusher.start()
+            atexit.register(_flush_in_thread)
@@ -5,6 +5,7 @@ Django settings for BananaGame project.
 Generated by 'django-admin startproject' using Django 5.1.6.
 """
 
+import os
 from pathlib import Path
 from datetime import timedelta
 
@@ -39,6 +40,7 @@ MIDDLEWARE = [
     'django.contrib.sessions.middleware.SessionMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.common.CommonMiddleware',
+    'Banana.throttling.ThrottleMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
@@ -47,13 +49,14 @@ MIDDLEWARE = [
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'Banana.authentication.SnapshotJWTAuthentication',
     ),
 }
 
 CORS_ALLOWED_ORIGINS = [
     "http://localhost:8080",  # Adjust to your frontend URL
 ]
+CORS_EXPOSE_HEADERS = ['Retry-After']
 
 ROOT_URLCONF = 'BananaGame.urls'
 
@@ -80,6 +83,9 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        # A file, not the in-memory default, so threaded tests wait on locks like the real
+        # database instead of failing with "database table is locked"; removed after the run
+        'TEST': {'NAME': BASE_DIR / 'test_db.sqlite3'},
     }
 }
 
@@ -108,11 +114,103 @@ USE_TZ = True
 # Static files
 STATIC_URL = 'static/'
 
+# Caches. Active puzzles live in the 'puzzle_sessions' cache rather than the
+# Player row. The file backend is shared by all worker processes on one host;
+# set PUZZLE_SESSION_REDIS_URL to share them across hosts (needs redis-py), or
+# switch to LocMemCache when running a single process.
+PUZZLE_SESSION_CACHE = 'puzzle_sessions'
+PUZZLE_SESSION_TTL = 15 * 60  # seconds an unanswered puzzle is kept
+PUZZLE_BATCH_MAX_ANSWERS = 50  # answers accepted by /check-puzzle/batch/
+
+# Players mid-game at the busiest moment. The file caches hold at most
+# MAX_ENTRIES entries each and cull beyond that (expired entries first, see
+# Banana.cache_backends), so size them for this peak: every player has a
+# current-puzzle pointer plus the puzzles issued to them but not yet answered,
+# several in the rapid-fire batch mode.
+PEAK_CONCURRENT_PLAYERS = 10_000
+PUZZLE_SESSION_MAX_ENTRIES = PEAK_CONCURRENT_PLAYERS * 20
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'puzzle_sessions': {
+        'BACKEND': 'Banana.cache_backends.ExpiringFileBasedCache',
+        'LOCATION': BASE_DIR / 'cache' / 'puzzle_sessions',
+        'TIMEOUT': PUZZLE_SESSION_TTL,
+        'OPTIONS': {'MAX_ENTRIES': PUZZLE_SESSION_MAX_ENTRIES},
+    },
+    'leaderboard': {
+        # A version and a rendered body per board and time bucket
+        'BACKEND': 'Banana.cache_backends.ExpiringFileBasedCache',
+        'LOCATION': BASE_DIR / 'cache' / 'leaderboard',
+        'OPTIONS': {'MAX_ENTRIES': 10_000},
+    },
+    'certificate_jobs': {
+        # One status record per job, kept for CERTIFICATE_JOB_TTL
+        'BACKEND': 'Banana.cache_backends.ExpiringFileBasedCache',
+        'LOCATION': BASE_DIR / 'cache' / 'certificate_jobs',
+        'OPTIONS': {'MAX_ENTRIES': PEAK_CONCURRENT_PLAYERS * 5},
+    },
+    'throttle': {
+        # The counters need an atomic incr(), which the file backend lacks; in process
+        # memory each worker enforces THROTTLES separately until Redis is configured below
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'throttle',
+        'TIMEOUT': 2 * 60 * 60,
+        'OPTIONS': {'MAX_ENTRIES': 100_000},
+    },
+    'auth': {
+        'BACKEND': 'Banana.cache_backends.ExpiringFileBasedCache',
+        'LOCATION': BASE_DIR / 'cache' / 'auth',
+        'OPTIONS': {'MAX_ENTRIES': 100_000},
+    },
+}
+
+if os.environ.get('PUZZLE_SESSION_REDIS_URL'):
+    CACHES['puzzle_sessions'] = {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': os.environ['PUZZLE_SESSION_REDIS_URL'],
+        'TIMEOUT': PUZZLE_SESSION_TTL,
+    }
+    CACHES['leaderboard'] = {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': os.environ['PUZZLE_SESSION_REDIS_URL'],
+        'KEY_PREFIX': 'leaderboard',
+    }
+    CACHES['certificate_jobs'] = {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': os.environ['PUZZLE_SESSION_REDIS_URL'],
+        'KEY_PREFIX': 'certificate_jobs',
+    }
+    CACHES['throttle'] = {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': os.environ['PUZZLE_SESSION_REDIS_URL'],
+        'KEY_PREFIX': 'throttle',
+    }
+    CACHES['auth'] = {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': os.environ['PUZZLE_SESSION_REDIS_URL'],
+        'KEY_PREFIX': 'auth',
+    }
+
+# Per-route request limits, checked by Banana.throttling.ThrottleMiddleware
+# before the view runs: {url name: {scope: (requests, window seconds)}}, where
+# the scope is 'ip', 'user' (from the JWT) or 'email' (from the request body)
+THROTTLE_CACHE = 'throttle'
+THROTTLES = {
+    'request-email-otp': {'ip': (20, 60 * 60), 'email': (5, 15 * 60)},
+    'verify-email-otp': {'ip': (30, 15 * 60), 'email': (10, 15 * 60)},
+    'fetch-puzzle': {'user': (60, 60), 'ip': (300, 60)},
+    'check-puzzle': {'user': (120, 60)},
+    'check-puzzle-batch': {'user': (30, 60)},
+    'submit-score': {'user': (30, 60)},
+}
+
 # Default primary key field type
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 # Email configuration (SMTP defaults; override via environment variables)
-import os
 
 EMAIL_BACKEND = 'django.core.mail.backends.smtp.EmailBackend'
 EMAIL_HOST = 'smtp.gmail.com'
@@ -128,4 +226,115 @@ SIMPLE_JWT = {
     'ACCESS_TOKEN_LIFETIME': timedelta(minutes=60),
     'REFRESH_TOKEN_LIFETIME': timedelta(days=1),
     'AUTH_HEADER_TYPES': ('Bearer',),
-}
\ No newline at end of file
+    'TOKEN_REFRESH_SERIALIZER': 'Banana.serializers.RevocableTokenRefreshSerializer',
+}
+
+# Cached answers to "has this user logged out everywhere / was this token
+# blacklisted" (Banana.revocation); `manage.py prune_tokens` clears out expired tokens
+TOKEN_REVOCATION_CACHE = 'auth'
+TOKEN_REVOCATION_CACHE_TTL = 5 * 60
+
+# Login and register hash passwords on a pool of threads (Banana.hashing);
+# beyond PASSWORD_HASH_MAX_PENDING waiting hashes they answer 503 + Retry-After
+PASSWORD_HASH_WORKERS = None  # one per CPU
+PASSWORD_HASH_MAX_PENDING = 64
+PASSWORD_HASH_RETRY_AFTER = 2
+
+# Cached user and player snapshots (Banana.snapshots): requests authenticate
+# without loading auth_user, and solves start from the cached player state
+AUTH_SNAPSHOT_CACHE = 'auth'
+AUTH_SNAPSHOT_TTL = 60
+
+# Puzzle pool: fetch_puzzle serves pre-fetched puzzles and a background
+# thread tops the pool back up to the high watermark below the low one.
+PUZZLE_API_URL = 'https://marcconrad.com/uob/banana/api.php'
+PUZZLE_POOL_LOW_WATERMARK = 20
+PUZZLE_POOL_HIGH_WATERMARK = 100
+# 'upstream' fetches from PUZZLE_API_URL, 'local' renders puzzles with Pillow.
+# With PUZZLE_LOCAL_FALLBACK the local generator also covers upstream outages.
+PUZZLE_SOURCE = 'upstream'
+PUZZLE_LOCAL_FALLBACK = True
+
+# Upstream client for the Banana API (pooled session, retries, circuit breaker)
+PUZZLE_API_POOL_SIZE = 10
+PUZZLE_API_MAX_CONCURRENCY = 10
+PUZZLE_API_RETRIES = 2
+PUZZLE_API_TIMEOUT = 5.0
+PUZZLE_API_BREAKER_THRESHOLD = 5
+PUZZLE_API_BREAKER_RESET_SECONDS = 30.0
+
+# Content-addressed puzzle image store served from /banana/puzzle-images/
+PUZZLE_IMAGE_STORE = True
+PUZZLE_IMAGE_ROOT = BASE_DIR / 'media' / 'puzzle_images'
+PUZZLE_IMAGE_STORE_MAX_BYTES = 200 * 1024 * 1024
+
+# Write-behind buffering of player progress. When enabled, solves and daily
+# claims are buffered per process and flushed with one bulk_update every
+# PLAYER_WRITE_BEHIND_INTERVAL seconds (the most a crash can lose), or sooner
+# once PLAYER_WRITE_BEHIND_MAX_PENDING players have pending changes.
+PLAYER_WRITE_BEHIND = False
+PLAYER_WRITE_BEHIND_INTERVAL = 5.0
+PLAYER_WRITE_BEHIND_MAX_PENDING = 1000
+
+# Per-process rank index behind /banana/leaderboard/rank/. It is rebuilt from
+# LeaderboardEntry once older than this, which bounds how long scores
+# submitted through other workers take to affect ranks.
+RANK_INDEX_MAX_AGE = 300
+# Score buckets in its Fenwick tree; scores above the last are kept in a sorted list
+RANK_INDEX_MAX_BUCKETS = 2 ** 20
+
+# Highest score /banana/submit-score/ accepts
+MAX_SUBMITTED_SCORE = 1_000_000
+
+# Daily and weekly leaderboards: buckets kept per window, the current one
+# included. Older buckets are deleted automatically as new ones start.
+LEADERBOARD_WINDOW_RETENTION = {'day': 7, 'week': 4}
+
+# Page sizes for /banana/leaderboard/pages/ (?page_size= is capped at the max)
+LEADERBOARD_PAGE_SIZE = 50
+LEADERBOARD_MAX_PAGE_SIZE = 200
+
+# Rendered top-N boards for /banana/leaderboard/, versioned for ETags. Must be
+# shared by every worker (the versions are bumped by whichever one handles
+# submit_score); the Redis switch above covers it as well.
+LEADERBOARD_CACHE = 'leaderboard'
+LEADERBOARD_CACHE_TTL = 60  # seconds a rendered board is kept
+LEADERBOARD_CACHE_LOCK_WAIT = 2.0  # seconds a poll waits for another worker's render
+
+# Server-sent events at /banana/events/ (serve BananaGame.asgi:application with
+# an ASGI server such as uvicorn; under WSGI each stream would hold a thread).
+EVENT_STREAM_HEARTBEAT = 15  # seconds between keep-alive comments
+EVENT_STREAM_MAX_CONNECTIONS = 20000  # per process; further streams get a 503
+EVENT_STREAM_QUEUE_SIZE = 100  # events buffered per stream before it is resynced
+
+# Certificate PDFs from /banana/certificate/, cached on disk per
+# (user, rank, score, date) and evicted least recently used beyond the limit.
+CERTIFICATE_CACHE_ROOT = BASE_DIR / 'media' / 'certificates'
+CERTIFICATE_CACHE_MAX_BYTES = 50 * 1024 * 1024
+
+# Background certificate jobs (POST /banana/certificate/): render processes
+# per server process, jobs allowed to wait per process before a 503, and how
+# long a job may stay pending before a new request starts it again. Job
+# status must be visible to every worker, like the caches above.
+CERTIFICATE_WORKERS = 2
+CERTIFICATE_MAX_PENDING = 100
+CERTIFICATE_JOB_TIMEOUT = 60
+CERTIFICATE_JOB_TTL = 60 * 60
+CERTIFICATE_JOB_CACHE = 'certificate_jobs'
+
+# Email outbox: OTP and thank-you mail is queued in EmailOutbox and sent by a
+# background sender over one reused SMTP connection. Each server process runs
+# a sender thread unless EMAIL_OUTBOX_SENDER_THREAD is False, in which case
+# run `manage.py send_outbox`. Failed sends are retried with exponential
+# backoff (EMAIL_OUTBOX_BACKOFF seconds, doubling up to the max).
+EMAIL_OUTBOX_SENDER_THREAD = True
+EMAIL_OUTBOX_BATCH_SIZE = 20
+EMAIL_OUTBOX_MAX_ATTEMPTS = 5
+EMAIL_OUTBOX_BACKOFF = 30
+EMAIL_OUTBOX_BACKOFF_MAX = 60 * 60
+EMAIL_OUTBOX_LEASE = 5 * 60  # seconds before a claimed message may be taken over
+EMAIL_OUTBOX_POLL_INTERVAL = 5.0
+EMAIL_OUTBOX_RETENTION_DAYS = 7  # sent mail is deleted after this
+
+# Expired OTP codes are kept this long, then deleted by `manage.py purge_otps`
+OTP_RETENTION_HOURS = 24